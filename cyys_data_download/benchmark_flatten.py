@@ -0,0 +1,99 @@
+# 响应解析与数据展平微基准
+# 用法：python benchmark_flatten.py [录制的响应JSON文件或目录 ...]
+# 未指定文件时使用按接口结构生成的样例数据
+import sys
+project_root = r"E:\powerbi_data"
+sys.path.insert(0, project_root)
+from common_code import decode_json, orjson
+from cyy_to_mysql_99 import flatten_data, extract_page_items, CompiledFlattener
+from typing import Dict, List, Callable
+import time
+import json
+import os
+
+
+def load_payloads(paths: List[str]) -> Dict[str, bytes]:
+    """
+    读取录制的响应体
+
+    Args:
+        paths: 文件或目录列表（目录下读取所有 .json 文件）
+
+    Returns:
+        文件名到响应体字节的映射
+    """
+    payloads = {}
+    for path in paths:
+        if os.path.isdir(path):
+            files = [os.path.join(path, name) for name in sorted(os.listdir(path)) if name.endswith('.json')]
+        else:
+            files = [path]
+        for file_path in files:
+            with open(file_path, 'rb') as f:
+                payloads[os.path.basename(file_path)] = f.read()
+    return payloads
+
+
+def sample_payload(rows: int = 3000) -> bytes:
+    """生成与接口返回结构相同的样例响应体"""
+    items = []
+    for i in range(rows):
+        items.append({
+            'ID': i,
+            'OrderCode': f'SO{i:08d}',
+            'CusName': f'客户{i}',
+            'Amount': i * 13.5,
+            'CreateTime': '2025-10-01 08:30:00',
+            'Remark': None,
+            'Car': {'FrameNumber': f'LFV{i:014d}', 'Model': '车型', 'Color': {'Code': 'W1', 'Name': '白色'}},
+            'Salesman': {'ID': i % 50, 'Name': f'顾问{i % 50}'},
+        })
+    body = {'Code': 200, 'Total': rows, 'Data': items}
+    return json.dumps(body, ensure_ascii=False).encode('utf-8')
+
+
+def best_of(func: Callable[[], object], repeat: int = 5) -> float:
+    """多次运行取最短耗时（秒）"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def run_benchmark(payloads: Dict[str, bytes], repeat: int = 5) -> None:
+    """对每个响应体比较解析和展平耗时"""
+    print(f"orjson: {'已安装' if orjson is not None else '未安装，decode_json 使用标准库'}")
+    print(f"{'payload':<32}{'rows':>8}{'json.loads':>12}{'decode_json':>13}{'flatten_data':>14}{'compiled':>10}{'speedup':>9}")
+
+    for name, content in payloads.items():
+        body = decode_json(content)
+        try:
+            items = extract_page_items(body)
+        except KeyError:
+            items = body if isinstance(body, list) else []
+        if not items:
+            print(f"{name:<32}{'无数据':>8}")
+            continue
+
+        std_time = best_of(lambda: json.loads(content), repeat)
+        fast_time = best_of(lambda: decode_json(content), repeat)
+        generic_time = best_of(lambda: flatten_data(items), repeat)
+        flattener = CompiledFlattener(items[0])
+        compiled_time = best_of(lambda: flattener.flatten(items), repeat)
+
+        # 校验两种展平结果一致
+        generic_rows, generic_fields = flatten_data(items)
+        compiled_rows, compiled_fields = flattener.flatten(items)
+        if generic_rows != compiled_rows or set(generic_fields) != set(compiled_fields):
+            print(f"{name}: 展平结果不一致")
+
+        speedup = (std_time + generic_time) / (fast_time + compiled_time)
+        print(f"{name:<32}{len(items):>8}{std_time * 1000:>10.1f}ms{fast_time * 1000:>11.1f}ms"
+              f"{generic_time * 1000:>12.1f}ms{compiled_time * 1000:>8.1f}ms{speedup:>8.2f}x")
+
+
+if __name__ == "__main__":
+    recorded = load_payloads(sys.argv[1:]) if len(sys.argv) > 1 else {'sample_3000_rows': sample_payload()}
+    run_benchmark(recorded)
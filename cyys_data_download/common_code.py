@@ -1,11 +1,39 @@
-from typing import Optional, Union, Dict, List, Tuple, Any
-from curl_cffi import requests
+from typing import Optional, Union, Dict, List, Tuple, Any, Callable
+from curl_cffi import requests, CurlOpt, CurlHttpVersion
+from urllib.parse import urlsplit
+from contextlib import contextmanager
 from datetime import date
 import mimetypes
+import threading
 import logging
+import random
 import time
 import json
 import os
+import base64
+import hashlib
+import tempfile
+
+try:
+    # 可选依赖：orjson 解析速度明显快于标准库，未安装时使用 json
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def decode_json(content: Union[bytes, str]) -> Any:
+    """
+    解析JSON内容（优先使用 orjson，未安装时回退到标准库 json）
+
+    Args:
+        content: 响应体字节或字符串
+
+    Returns:
+        解析后的对象，内容不是合法JSON时抛出 ValueError
+    """
+    if orjson is not None:
+        return orjson.loads(content)
+    return json.loads(content)
 
 
 class WriteLog:
@@ -97,11 +125,593 @@ def collect_nested_keys(data, key_list):
     return {k: _optimize_value(v) for k, v in result.items() if v}
 
 
+class TokenBucket:
+    """
+    令牌桶限流器（线程安全），多个线程共享同一个实例即可限制总请求速率
+    示例：
+    limiter = TokenBucket(rate=2, capacity=4)
+    limiter.acquire()  # 阻塞直到获得令牌
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        """
+        :param rate: 令牌生成速率（每秒）
+        :param capacity: 桶容量（允许的突发请求数），默认与速率相同且不小于1
+        """
+        if rate <= 0:
+            raise ValueError("rate 必须大于0")
+        self.rate = float(rate)
+        self.capacity = float(capacity) if capacity else max(1.0, self.rate)
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def acquire(self, tokens: float = 1.0) -> float:
+        """
+        获取令牌，令牌不足时阻塞等待
+
+        :param tokens: 需要的令牌数
+        :return: 实际等待的秒数
+        """
+        waited = 0.0
+        while True:
+            with self.lock:
+                self._refill()
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return waited
+                wait_time = (tokens - self.tokens) / self.rate
+            time.sleep(wait_time)
+            waited += wait_time
+
+    def set_rate(self, rate: float) -> None:
+        """调整令牌生成速率（已积累的令牌保留，不超过容量）"""
+        if rate <= 0:
+            raise ValueError("rate 必须大于0")
+        with self.lock:
+            self._refill()
+            self.rate = float(rate)
+
+
+class AdaptiveController:
+    """
+    自适应请求控制器（AIMD：加性增、乘性减）
+    根据每次请求的耗时、返回行数和错误/限流情况，动态调整：
+    - 并发上限：同时在途的请求数（slot）
+    - 请求间隔：共享 TokenBucket 的速率
+    - 每个API的分页大小：在请求第一页前选定，同一次翻页过程中不变；
+      只有返回总条数的API才会超过配置的分页大小（上游限制了分页大小时，不返回总条数就无法发现只返回了一部分）
+    示例：
+    controller = AdaptiveController(rate_limiter)
+    with controller.slot():
+        start = time.monotonic()
+        response = requester.request(...)
+    controller.on_success(time.monotonic() - start)   # 失败时调用 controller.on_failure(throttled=True)
+    """
+
+    # 单个请求的目标耗时（秒），超过目标的2倍视为拥塞
+    TARGET_LATENCY = 5.0
+    # 并发上限范围
+    MIN_CONCURRENCY = 1
+    MAX_CONCURRENCY = 12
+    # 请求速率范围（每秒）和加性增量
+    MIN_RATE = 0.2
+    MAX_RATE = 10.0
+    RATE_STEP = 0.25
+    # 分页大小范围
+    MIN_PAGE_SIZE = 500
+    MAX_PAGE_SIZE = 10000
+    # 两次乘性减之间的最短间隔（秒），避免同一波失败把参数连续减半
+    DECREASE_COOLDOWN = 10.0
+
+    def __init__(self, rate_limiter: Optional['TokenBucket'] = None, concurrency: int = 4):
+        """
+        :param rate_limiter: 共享的令牌桶限流器（为None时不调整请求速率）
+        :param concurrency: 初始并发上限
+        """
+        self.rate_limiter = rate_limiter
+        self.limit = max(self.MIN_CONCURRENCY, min(self.MAX_CONCURRENCY, concurrency))
+        self.in_flight = 0
+        self.successes = 0
+        self.last_decrease = 0.0
+        self.page_sizes: Dict[str, int] = {}
+        self.page_caps: Dict[str, int] = {}
+        # 各API配置的分页大小（已知上游能完整返回的大小）
+        self.default_page_sizes: Dict[str, int] = {}
+        self._condition = threading.Condition()
+        self.logger = WriteLog()
+
+    @contextmanager
+    def slot(self):
+        """占用一个并发名额，超过当前并发上限时阻塞等待"""
+        with self._condition:
+            while self.in_flight >= self.limit:
+                self._condition.wait()
+            self.in_flight += 1
+        try:
+            yield
+        finally:
+            with self._condition:
+                self.in_flight -= 1
+                self._condition.notify()
+
+    def on_success(self, latency: float) -> None:
+        """
+        请求成功：耗时正常时每累计 limit 次成功，并发上限和速率各加一步；耗时过长按拥塞处理
+
+        :param latency: 请求耗时（秒）
+        """
+        if latency > self.TARGET_LATENCY * 2:
+            self._decrease(f"请求耗时 {latency:.1f}s")
+            return
+        with self._condition:
+            self.successes += 1
+            if latency > self.TARGET_LATENCY or self.successes < self.limit:
+                return
+            self.successes = 0
+            if self.limit < self.MAX_CONCURRENCY:
+                self.limit += 1
+                self._condition.notify()
+        if self.rate_limiter and self.rate_limiter.rate < self.MAX_RATE:
+            self.rate_limiter.set_rate(min(self.MAX_RATE, self.rate_limiter.rate + self.RATE_STEP))
+
+    def on_failure(self, throttled: bool = False) -> None:
+        """
+        请求失败：限流（429/503）或超时等错误时并发上限和速率减半
+
+        :param throttled: 是否为上游限流响应
+        """
+        self._decrease("上游限流" if throttled else "请求失败")
+
+    def _decrease(self, reason: str) -> None:
+        now = time.monotonic()
+        with self._condition:
+            self.successes = 0
+            if now - self.last_decrease < self.DECREASE_COOLDOWN:
+                return
+            self.last_decrease = now
+            self.limit = max(self.MIN_CONCURRENCY, self.limit // 2)
+        if self.rate_limiter:
+            self.rate_limiter.set_rate(max(self.MIN_RATE, self.rate_limiter.rate / 2))
+        self.logger.log_warning(
+            f"{reason}，并发上限降为 {self.limit}，请求速率降为 "
+            f"{self.rate_limiter.rate if self.rate_limiter else '-'}/s")
+
+    def page_size_for(self, api_name: str, default: int) -> int:
+        """选定某个API本次翻页使用的分页大小（请求第一页前调用，default 为配置的分页大小）"""
+        with self._condition:
+            self.default_page_sizes[api_name] = default
+            page_size = self.page_sizes.get(api_name, default)
+        cap = self.page_caps.get(api_name)
+        return min(page_size, cap) if cap else page_size
+
+    def on_page(self, api_name: str, page_size: int, rows: int, latency: float, has_total: bool = True) -> None:
+        """
+        记录一页的结果，调整该API下次使用的分页大小：
+        整页返回且耗时低于目标一半时翻倍，耗时超过目标1.5倍时减半。
+        未返回总条数的API最大只用配置的分页大小：上游限制了分页大小时返回的短页会被当作最后一页，其余数据会丢失
+
+        :param api_name: API名称
+        :param page_size: 本页请求的分页大小
+        :param rows: 本页返回的行数
+        :param latency: 请求耗时（秒）
+        :param has_total: 本页响应是否返回了总条数
+        """
+        with self._condition:
+            limit = self.MAX_PAGE_SIZE if has_total else self.default_page_sizes.get(api_name, page_size)
+            current = self.page_sizes.get(api_name, page_size)
+            if latency > self.TARGET_LATENCY * 1.5:
+                self.page_sizes[api_name] = min(limit, max(self.MIN_PAGE_SIZE, min(current, page_size) // 2))
+            elif rows >= page_size and latency < self.TARGET_LATENCY / 2:
+                self.page_sizes[api_name] = min(limit, max(current, page_size * 2))
+            elif current > limit:
+                self.page_sizes[api_name] = limit
+
+    def record_page_cap(self, api_name: str, cap: int) -> None:
+        """记录上游对某个API分页大小的上限（请求的分页大小大于上限时只返回上限条数）"""
+        with self._condition:
+            self.page_caps[api_name] = cap
+            self.page_sizes[api_name] = min(self.page_sizes.get(api_name, cap), cap)
+
+
+
+class CircuitOpenError(Exception):
+    """熔断器处于打开状态，请求被快速拒绝"""
+
+
+class RetryPolicy:
+    """
+    统一重试策略（线程安全，一次运行共享一个实例）
+    - 指数退避加随机抖动：第n次重试前等待 uniform(0, min(MAX_DELAY, BASE_DELAY * 2^n)) 秒
+    - 重试预算：一次运行内所有API的重试总次数上限，耗尽后不再重试
+    - 按API的熔断器：连续失败达到阈值后打开，OPEN_SECONDS 内的请求直接失败；
+      之后放行一个探测请求（半开），成功则关闭，失败则重新打开
+    示例：
+    policy = RetryPolicy()
+    attempt = 0
+    while True:
+        policy.before_attempt('按揭业务')  # 熔断时抛出 CircuitOpenError
+        try:
+            response = requester.request(...)
+            policy.record_success('按揭业务')
+            break
+        except Exception:
+            policy.record_failure('按揭业务')
+            delay = policy.next_delay('按揭业务', attempt)
+            if delay is None:
+                raise
+            time.sleep(delay)
+            attempt += 1
+    """
+
+    # 单个请求的最大尝试次数（含首次）
+    MAX_ATTEMPTS = 4
+    # 退避基数和上限（秒）
+    BASE_DELAY = 1.0
+    MAX_DELAY = 30.0
+    # 一次运行内的重试总次数上限
+    RETRY_BUDGET = 60
+    # 连续失败多少次后熔断，熔断持续秒数
+    FAILURE_THRESHOLD = 5
+    OPEN_SECONDS = 60.0
+
+    def __init__(self, max_attempts: Optional[int] = None, retry_budget: Optional[int] = None,
+                 base_delay: Optional[float] = None, max_delay: Optional[float] = None):
+        """
+        :param max_attempts: 单个请求的最大尝试次数，默认 MAX_ATTEMPTS
+        :param retry_budget: 一次运行内的重试总次数上限，默认 RETRY_BUDGET
+        :param base_delay: 退避基数（秒），默认 BASE_DELAY
+        :param max_delay: 单次退避上限（秒），默认 MAX_DELAY
+        """
+        self.max_attempts = max_attempts or self.MAX_ATTEMPTS
+        self.budget = self.RETRY_BUDGET if retry_budget is None else retry_budget
+        self.base_delay = self.BASE_DELAY if base_delay is None else base_delay
+        self.max_delay = self.MAX_DELAY if max_delay is None else max_delay
+        self.failures: Dict[str, int] = {}
+        self.opened_at: Dict[str, float] = {}
+        self.probing: set = set()
+        self.lock = threading.Lock()
+        self.logger = WriteLog()
+
+    def is_open(self, key: str) -> bool:
+        """熔断器是否处于打开状态（不含可放行探测请求的半开状态）"""
+        with self.lock:
+            opened_at = self.opened_at.get(key)
+            if opened_at is None:
+                return False
+            return key in self.probing or time.monotonic() - opened_at < self.OPEN_SECONDS
+
+    def before_attempt(self, key: str) -> None:
+        """
+        请求前检查熔断器
+
+        :param key: 熔断器键（通常为API名称）
+        :raises CircuitOpenError: 熔断器打开时
+        """
+        with self.lock:
+            opened_at = self.opened_at.get(key)
+            if opened_at is None:
+                return
+            if key not in self.probing and time.monotonic() - opened_at >= self.OPEN_SECONDS:
+                # 半开：放行一个探测请求
+                self.probing.add(key)
+                return
+        raise CircuitOpenError(f"{key} 连续失败已熔断，暂停请求")
+
+    def record_success(self, key: str) -> None:
+        """记录请求成功，关闭熔断器"""
+        with self.lock:
+            self.failures.pop(key, None)
+            self.probing.discard(key)
+            if self.opened_at.pop(key, None) is not None:
+                self.logger.log_info(f"{key} 探测请求成功，熔断器关闭")
+
+    def record_failure(self, key: str) -> None:
+        """记录请求失败，连续失败达到阈值（或探测请求失败）时打开熔断器"""
+        with self.lock:
+            self.failures[key] = self.failures.get(key, 0) + 1
+            if key in self.probing or (key not in self.opened_at and self.failures[key] >= self.FAILURE_THRESHOLD):
+                self.probing.discard(key)
+                self.opened_at[key] = time.monotonic()
+                self.logger.log_warning(f"{key} 连续失败 {self.failures[key]} 次，熔断 {self.OPEN_SECONDS:.0f} 秒")
+
+    def next_delay(self, key: str, attempt: int) -> Optional[float]:
+        """
+        计算下一次重试前的等待时间，并消耗一次重试预算
+
+        :param key: 熔断器键
+        :param attempt: 已失败的尝试序号（从0开始）
+        :return: 等待秒数；不应再重试（次数用尽、预算耗尽或已熔断）时返回None
+        """
+        if attempt + 1 >= self.max_attempts or self.is_open(key):
+            return None
+        with self.lock:
+            if self.budget <= 0:
+                self.logger.log_warning(f"本次运行的重试预算已用尽，{key} 不再重试")
+                return None
+            self.budget -= 1
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+
+class TokenCache:
+    """
+    API令牌缓存：令牌和过期时间保存在本地文件中，多个进程共用（文件锁保证同一时间只有一个进程去获取新令牌）
+    示例：
+    cache = TokenCache(fetch_token, cache_key='https://api.example.com|account')
+    token = cache.get()                # 未过期时直接返回缓存的令牌，临近过期时提前刷新
+    token = cache.invalidate(token)    # 接口返回认证错误时调用，刷新后返回新令牌
+    """
+
+    # 令牌不是JWT（无法读取exp）时的默认有效期（秒）
+    DEFAULT_TTL = 3600
+    # 距过期不足该秒数时提前刷新
+    REFRESH_MARGIN = 300
+    # 锁文件超过该秒数未释放视为持有进程已退出
+    LOCK_TIMEOUT = 60
+
+    def __init__(self, fetch_token: Callable[[], str], cache_key: str, cache_dir: Optional[str] = None,
+                 ttl: Optional[int] = None):
+        """
+        :param fetch_token: 获取新令牌的函数
+        :param cache_key: 缓存标识（如 接口地址+账号），不同账号使用不同的缓存文件
+        :param cache_dir: 缓存目录，默认系统临时目录
+        :param ttl: 非JWT令牌的有效期（秒），默认 DEFAULT_TTL
+        """
+        self.fetch_token = fetch_token
+        self.ttl = ttl or self.DEFAULT_TTL
+        digest = hashlib.md5(cache_key.encode('utf-8')).hexdigest()[:16]
+        self.cache_path = os.path.join(cache_dir or tempfile.gettempdir(), f"api_token_{digest}.json")
+        self.lock_path = f"{self.cache_path}.lock"
+        self.token: Optional[str] = None
+        self.expires_at = 0.0
+        self._lock = threading.Lock()
+        self.logger = WriteLog()
+
+    @staticmethod
+    def jwt_expiry(token: str) -> Optional[float]:
+        """读取JWT令牌的exp（时间戳），不是JWT时返回None"""
+        parts = token.split('.') if isinstance(token, str) else []
+        if len(parts) != 3:
+            return None
+        try:
+            payload = parts[1] + '=' * (-len(parts[1]) % 4)
+            exp = json.loads(base64.urlsafe_b64decode(payload)).get('exp')
+            return float(exp) if exp else None
+        except (ValueError, TypeError, AttributeError):
+            return None
+
+    def _is_fresh(self, expires_at: float) -> bool:
+        return expires_at - self.REFRESH_MARGIN > time.time()
+
+    def _read_file(self) -> Tuple[Optional[str], float]:
+        try:
+            with open(self.cache_path, 'r', encoding='utf-8') as f:
+                cached = json.load(f)
+            return cached.get('token'), float(cached.get('expires_at', 0))
+        except (OSError, ValueError, TypeError):
+            return None, 0.0
+
+    def _write_file(self, token: str, expires_at: float) -> None:
+        temp_path = f"{self.cache_path}.{os.getpid()}.tmp"
+        fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump({'token': token, 'expires_at': expires_at}, f)
+        os.replace(temp_path, self.cache_path)
+
+    @contextmanager
+    def _file_lock(self):
+        """跨进程文件锁（O_EXCL 创建锁文件），超时的锁文件会被清除"""
+        deadline = time.time() + self.LOCK_TIMEOUT
+        while True:
+            try:
+                fd = os.open(self.lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+                os.close(fd)
+                break
+            except FileExistsError:
+                try:
+                    if time.time() - os.path.getmtime(self.lock_path) > self.LOCK_TIMEOUT:
+                        os.remove(self.lock_path)
+                        continue
+                except OSError:
+                    continue
+                if time.time() > deadline:
+                    raise TimeoutError(f"等待令牌锁超时: {self.lock_path}")
+                time.sleep(0.2)
+        try:
+            yield
+        finally:
+            try:
+                os.remove(self.lock_path)
+            except OSError:
+                pass
+
+    def _refresh(self, stale_token: Optional[str]) -> str:
+        """在文件锁内刷新：其他进程已经刷新过时直接使用文件中的新令牌"""
+        with self._file_lock():
+            token, expires_at = self._read_file()
+            if token and token != stale_token and self._is_fresh(expires_at):
+                self.token, self.expires_at = token, expires_at
+                return token
+
+            token = self.fetch_token()
+            expires_at = self.jwt_expiry(token) or time.time() + self.ttl
+            try:
+                self._write_file(token, expires_at)
+            except OSError as e:
+                self.logger.log_warning(f"令牌缓存写入失败: {str(e)}")
+            self.token, self.expires_at = token, expires_at
+            self.logger.log_info("已获取新的API令牌")
+            return token
+
+    def get(self) -> str:
+        """获取有效令牌：内存缓存 -> 文件缓存 -> 重新获取"""
+        if self.token and self._is_fresh(self.expires_at):
+            return self.token
+        with self._lock:
+            if self.token and self._is_fresh(self.expires_at):
+                return self.token
+            token, expires_at = self._read_file()
+            if token and self._is_fresh(expires_at):
+                self.token, self.expires_at = token, expires_at
+                return token
+            return self._refresh(self.token)
+
+    def invalidate(self, token: Optional[str] = None) -> str:
+        """
+        令牌被接口拒绝时调用：丢弃该令牌并返回新令牌（其他线程已刷新时不重复获取）
+
+        :param token: 被拒绝的令牌，默认当前令牌
+        :return: 新令牌
+        """
+        stale_token = token or self.token
+        with self._lock:
+            if self.token and self.token != stale_token and self._is_fresh(self.expires_at):
+                return self.token
+            return self._refresh(stale_token)
+
+
+def is_auth_error(response: Any) -> bool:
+    """
+    判断请求结果是否为认证失败（令牌过期或无效）
+
+    :param response: RequestFunction.request 返回的字典
+    :return: 认证失败返回True
+    """
+    if not isinstance(response, dict):
+        return False
+    if response.get('status_code') in (401, 403) or response.get('error_code') in (401, 403):
+        return True
+    body = response.get('data')
+    if isinstance(body, dict) and 'Data' not in body:
+        message = body.get('Msg')
+        if isinstance(message, str) and 'token' in message.lower():
+            return any(word in message.lower() for word in ('过期', '失效', '无效', '错误', 'invalid', 'expired'))
+    return False
+
+
+def is_throttled(response: Any) -> bool:
+    """
+    判断请求结果是否为上游限流（429/503）
+
+    :param response: RequestFunction.request 返回的字典
+    :return: 被限流返回True
+    """
+    if not isinstance(response, dict):
+        return False
+    return response.get('status_code') in (429, 503) or response.get('error_code') in (429, 503)
+
+
+class SessionPool:
+    """
+    HTTP会话池：保持长连接的 curl_cffi 会话在所有线程之间借出、归还（curl句柄同一时间只由一个线程使用），
+    各API临时创建的翻页线程结束后会话仍留在池中，下一个API继续复用已建立的连接，会话总数不超过 max_sessions；
+    同一主机的并发连接数由共享信号量限制，服务端支持时使用HTTP/2
+    示例：
+    pool = SessionPool(impersonate='chrome110')
+    with pool.session_for(url) as session:
+        response = session.request('GET', url)
+    pool.close()
+    """
+
+    def __init__(self, impersonate: str = 'chrome110', max_host_connections: int = 8,
+                 max_connections: int = 32, http_version: int = CurlHttpVersion.V2TLS,
+                 max_sessions: Optional[int] = None):
+        """
+        :param impersonate: 浏览器指纹版本
+        :param max_host_connections: 同一主机的最大并发连接数（所有线程合计）
+        :param max_connections: 单个会话缓存的最大连接数
+        :param http_version: HTTP版本，默认HTTPS优先协商HTTP/2，不支持时回退HTTP/1.1
+        :param max_sessions: 会话总数上限（即同时在途的请求数上限），默认 max_host_connections 的2倍
+        """
+        self.impersonate = impersonate
+        self.max_host_connections = max_host_connections
+        self.max_connections = max_connections
+        self.http_version = http_version
+        self.max_sessions = max_sessions or max_host_connections * 2
+        self._sessions: List[requests.Session] = []
+        # 空闲会话（后进先出，优先借出最近用过、连接仍然有效的会话）
+        self._idle: List[requests.Session] = []
+        self._host_limits: Dict[str, threading.BoundedSemaphore] = {}
+        self._lock = threading.Lock()
+        self._available = threading.Condition(self._lock)
+
+    def create_session(self) -> requests.Session:
+        """新建一个会话"""
+        return requests.Session(
+            impersonate=self.impersonate,
+            http_version=self.http_version,
+            # 每主机连接数是 curl multi 句柄的选项，不能设置在会话上，由 session_for 的信号量限制
+            curl_options={CurlOpt.MAXCONNECTS: self.max_connections},
+        )
+
+    def get_session(self) -> requests.Session:
+        """借出一个空闲会话，没有空闲会话时新建，会话数已达上限时等待归还（用完后调用 release_session）"""
+        with self._available:
+            while not self._idle and len(self._sessions) >= self.max_sessions:
+                self._available.wait()
+            if self._idle:
+                return self._idle.pop()
+            session = self.create_session()
+            self._sessions.append(session)
+            return session
+
+    def release_session(self, session: requests.Session) -> None:
+        """归还借出的会话（会话池已关闭时直接关闭该会话）"""
+        with self._available:
+            if any(session is pooled for pooled in self._sessions):
+                self._idle.append(session)
+                self._available.notify()
+                return
+        try:
+            session.close()
+        except Exception:
+            pass
+
+    def _host_limit(self, url: str) -> threading.BoundedSemaphore:
+        host = urlsplit(url).netloc
+        with self._lock:
+            if host not in self._host_limits:
+                self._host_limits[host] = threading.BoundedSemaphore(self.max_host_connections)
+            return self._host_limits[host]
+
+    @contextmanager
+    def session_for(self, url: str):
+        """占用目标主机的一个连接名额，借出一个会话，退出时归还"""
+        limit = self._host_limit(url)
+        with limit:
+            session = self.get_session()
+            try:
+                yield session
+            finally:
+                self.release_session(session)
+
+    def close(self) -> None:
+        """关闭所有会话（借出中的会话在归还时关闭）"""
+        with self._available:
+            self._sessions = []
+            idle, self._idle = self._idle, []
+            self._available.notify_all()
+        for session in idle:
+            try:
+                session.close()
+            except Exception:
+                pass
+
+
 # 支持的浏览器类型：
 # "chrome89", "chrome90", "chrome91", "chrome100", "chrome101", "chrome110",
 # "edge93", "edge101", "firefox92", "firefox102", "safari15_3", "safari15_6_1", "safari16"
 class RequestFunction:
-    def __init__(self):
+    def __init__(self, use_session: bool = True, max_host_connections: int = 8):
+        """
+        :param use_session: 是否复用连接池中的长连接会话（关闭时每次请求新建连接）
+        :param max_host_connections: 同一主机的最大并发连接数
+        """
         self.default_headers = {
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
             'Accept': '*/*',
@@ -112,6 +722,7 @@ class RequestFunction:
         self.logger = WriteLog()
         self.default_timeout = 30
         self.default_impersonate = 'chrome110'
+        self.session_pool = SessionPool(self.default_impersonate, max_host_connections) if use_session else None
         # 初始化MIME类型数据库
         mimetypes.init()
         # 敏感关键词列表 - 修改为精确匹配
@@ -198,8 +809,12 @@ class RequestFunction:
                 if 'Content-Type' not in final_headers:
                     final_headers['Content-Type'] = 'application/json'
 
-            # 发送请求
-            response = requests.request(**request_args)
+            # 发送请求（优先复用当前线程的长连接会话）
+            if self.session_pool:
+                with self.session_pool.session_for(url) as session:
+                    response = session.request(**request_args)
+            else:
+                response = requests.request(**request_args)
 
             # 如果是流式响应，直接返回响应对象
             if stream:
@@ -236,31 +851,36 @@ class RequestFunction:
                 'cookies': dict(response.cookies),
                 'is_binary': isinstance(result, bytes),
                 'url': response.url,  # 最终URL（考虑重定向）
-                'elapsed': response.elapsed  # 请求耗时
+                'elapsed': response.elapsed,  # 请求耗时
+                'content_length': len(response.content)  # 响应体字节数
             }
 
             # 如果数据是二进制，记录大小而不是内容
             if response_dict['is_binary']:
                 self.logger.log_debug(f"接收二进制数据: {len(result)} 字节")
-            else:
-                # 安全记录响应内容
-                safe_content = self._sanitize_data(str(result))
-                # self.logger.log_debug(f"响应内容: {safe_content[:200]}{'...' if len(safe_content) > 200 else ''}")
+            # 响应内容日志已关闭，不再对整页数据做 str() 和脱敏处理
+            # self.logger.log_debug(f"响应内容: {self._sanitize_data(str(result))[:200]}")
             # self.logger.log_debug(f"请求耗时: {response_dict['elapsed']} 秒")
             return response_dict
 
         except requests.RequestsError as e:
             status_code = getattr(e, 'code', 500)
+            # raise_for_status 抛出的 HTTPError 的 code 是 curl 错误码（为0），HTTP 状态码在 e.response 上
+            error_response = getattr(e, 'response', None)
+            http_status = getattr(error_response, 'status_code', None)
             error_type = type(e).__name__
-            error_msg = f"请求失败: {url} - [{error_type}] {str(e)} [状态码: {status_code}]"
+            error_msg = f"请求失败: {url} - [{error_type}] {str(e)} [状态码: {http_status or status_code}]"
             self.logger.log_error(error_msg)
-            return {
+            result = {
                 'success': False,
                 'error_code': status_code,
                 'error': str(e),
                 'error_type': error_type,
                 'url': url
             }
+            if http_status:
+                result['status_code'] = http_status
+            return result
 
         except Exception as e:
             error_type = type(e).__name__
@@ -274,6 +894,11 @@ class RequestFunction:
                 'url': url
             }
 
+    def close(self) -> None:
+        """关闭连接池中的会话"""
+        if self.session_pool:
+            self.session_pool.close()
+
     def retry_request(self, url: str, method: str = 'GET', headers: Optional[Dict] = None,
                       data: Optional[Union[Dict, bytes, str]] = None,
                       json_data: Optional[Dict] = None,  # 使用json_data避免冲突
@@ -458,6 +1083,11 @@ class RequestFunction:
         # JSON处理
         if 'json' in mime_type or mime_type.endswith('+json'):
             try:
+                return decode_json(response.content)
+            except ValueError:
+                pass
+            try:
+                # 非UTF-8编码等情况交给按响应编码解码的标准路径
                 return response.json()
             except (ValueError, json.JSONDecodeError) as e:
                 # JSON解析失败时返回原始文本
@@ -0,0 +1,299 @@
+# 基于 asyncio 的车易云数据同步引擎
+import sys
+project_root = r"E:\powerbi_data"
+sys.path.insert(0, project_root)
+from cyy_to_mysql_99 import (DataSyncManager, send_wechat_notification, should_fetch_next_page,
+                             validate_page_body, extract_page_items, extract_total)
+from common_code import decode_json, is_auth_error
+from landing_zone import LandingStream
+from curl_cffi.requests import AsyncSession
+from typing import Dict, List, Any, Optional, Tuple
+from itertools import islice
+import threading
+import asyncio
+import queue
+import math
+import time
+import copy
+from config.cyys_data_download.config import Config
+
+
+class AsyncTokenBucket:
+    """
+    协程版令牌桶限流器（只能在同一个事件循环中使用）
+    示例：
+    limiter = AsyncTokenBucket(rate=2, capacity=4)
+    await limiter.acquire()
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        if rate <= 0:
+            raise ValueError("rate 必须大于0")
+        self.rate = float(rate)
+        self.capacity = float(capacity) if capacity else max(1.0, self.rate)
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self, tokens: float = 1.0) -> float:
+        """获取令牌，令牌不足时挂起等待，返回等待秒数"""
+        waited = 0.0
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return waited
+                wait_time = (tokens - self.tokens) / self.rate
+                await asyncio.sleep(wait_time)
+                waited += wait_time
+
+
+class AsyncDataSyncManager(DataSyncManager):
+    """
+    异步数据同步管理器
+
+    所有API及其分页以协程方式运行，共用一个并发预算（CONCURRENCY）和限流器，
+    重试由共享的 retry_policy 控制，等待使用 asyncio.sleep，不占用线程。
+    API配置与 DataSyncManager 相同（DataCenter.get_apis_99），页数据先放入事件循环内的有界队列，
+    由一个转发协程交给写库端的 consume_pages 逐页写库。
+    """
+
+    # 同时在途的请求数上限
+    CONCURRENCY = 16
+    # 异步引擎的请求限流（每秒请求数、突发容量）。线程引擎的 REQUEST_RATE 是自适应控制器的起始速率，
+    # 异步引擎没有自适应控制，使用固定速率；实际在途请求数约为 速率 × 单次请求耗时，不超过 CONCURRENCY
+    ASYNC_REQUEST_RATE = 8.0
+    ASYNC_REQUEST_BURST = CONCURRENCY
+    # 单个请求超时时间（秒）
+    REQUEST_TIMEOUT = 30
+    METRICS_RUN_NAME = 'cyy_async_sync'
+
+    def __init__(self, time_option: int = 2, incremental: bool = True,
+                 db_config: Optional[Dict[str, Any]] = None, polling: bool = True):
+        super().__init__(time_option=time_option, incremental=incremental, db_config=db_config, polling=polling)
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.semaphore: Optional[asyncio.Semaphore] = None
+        self.async_limiter: Optional[AsyncTokenBucket] = None
+        self.page_buffer: Optional[asyncio.Queue] = None
+
+    async def send_request(self, session: AsyncSession, task_name: str, method: str, url: str,
+                           kwargs: Dict[str, Any]) -> Tuple[Any, Any]:
+        """发送一次请求（受限流器和并发上限约束），返回响应对象和解析后的响应体（非JSON时为None）"""
+        self.metrics.observe_throttle_wait(task_name, await self.async_limiter.acquire())
+        async with self.semaphore:
+            started = time.monotonic()
+            try:
+                response = await session.request(method.upper(), url, headers=self.requester.default_headers,
+                                                 timeout=self.REQUEST_TIMEOUT, verify=False, **kwargs)
+            except Exception:
+                self.metrics.observe_request(task_name, time.monotonic() - started, success=False)
+                raise
+        self.metrics.observe_request(task_name, time.monotonic() - started, len(response.content),
+                                     success=response.status_code < 400)
+        try:
+            body = decode_json(response.content)
+        except ValueError:
+            body = None
+        return response, body
+
+    async def request_page_async(self, session: AsyncSession, task_name: str, url: str, method: str,
+                                 payload: Dict[str, Any], page_number: int,
+                                 landing: Optional[LandingStream] = None) -> Tuple[List[Dict], Optional[int]]:
+        """
+        异步请求单页数据（带重试）
+
+        Returns:
+            当前页数据列表和接口返回的总条数（未返回总条数时为None）
+        """
+        page_payload = dict(payload)
+        if 'PageNumber' in page_payload:
+            page_payload['PageNumber'] = page_number
+
+        kwargs = {}
+        if method.upper() == 'GET':
+            kwargs['params'] = page_payload
+        else:
+            kwargs['json'] = page_payload
+
+        attempt = 0
+        while True:
+            self.logger.log_info(f"{task_name} 第{page_number}页 - 第{attempt + 1}次请求")
+            self.retry_policy.before_attempt(task_name)
+            try:
+                # 令牌缓存可能需要刷新（网络请求和文件锁），放到线程池中执行
+                page_payload['Token'] = await self.loop.run_in_executor(None, self.get_token)
+                response, body = await self.send_request(session, task_name, method, url, kwargs)
+
+                # 令牌失效时刷新令牌并立即重发一次
+                if is_auth_error({'status_code': response.status_code, 'data': body}):
+                    self.logger.log_warning(f"{task_name} 第{page_number}页令牌失效，刷新令牌后重试")
+                    page_payload['Token'] = await self.loop.run_in_executor(
+                        None, self.token_cache.invalidate, page_payload['Token'])
+                    response, body = await self.send_request(session, task_name, method, url, kwargs)
+
+                response.raise_for_status()
+                validate_page_body(body)
+                self.retry_policy.record_success(task_name)
+                break
+            except Exception as e:
+                self.retry_policy.record_failure(task_name)
+                retry_delay = self.retry_policy.next_delay(task_name, attempt)
+                if retry_delay is not None:
+                    self.logger.log_warning(
+                        f"{task_name} 第{page_number}页第{attempt + 1}次请求失败: {str(e)}，{retry_delay:.1f}秒后重试")
+                    self.metrics.observe_retry(task_name, retry_delay)
+                    await asyncio.sleep(retry_delay)
+                else:
+                    raise Exception(f"{task_name} 第{page_number}页请求失败，已请求{attempt + 1}次: {str(e)}")
+            attempt += 1
+
+        page_data = extract_page_items(body)
+        if not isinstance(page_data, list):
+            raise Exception(
+                f"{task_name} 第{page_number}页返回数据格式不正确，预期列表类型，实际得到: {type(page_data)}")
+        if landing is not None:
+            landing.write_page(page_number, body)
+        self.metrics.observe_page(task_name, len(page_data))
+        return page_data, extract_total(body)
+
+    async def put_page(self, item: Tuple[str, Optional[List[Dict]], Optional[Exception]]) -> None:
+        """把页数据放入事件循环内的有界队列（队列满时挂起生产者，保留背压且不占用线程）"""
+        await self.page_buffer.put(item)
+
+    async def forward_pages(self, page_queue: queue.Queue) -> None:
+        """
+        转发协程：把有界队列中的页数据依次交给写库端，收到 None 时结束
+
+        写库端的队列满时只有这一个转发调用在线程池中等待，其余生产者挂起在有界队列上。
+        """
+        while True:
+            item = await self.page_buffer.get()
+            if item is None:
+                return
+            await self.loop.run_in_executor(None, page_queue.put, item)
+
+    async def produce_pages_async(self, session: AsyncSession, task_name: str, api_config: Dict[str, Any]) -> None:
+        """异步生产者：请求单个API的所有分页并逐页放入队列，结束或失败时放入结束标记"""
+        url = api_config['url']
+        method = api_config['method']
+        payload = self.apply_watermark(task_name, copy.deepcopy(api_config.get('payload', {})))
+
+        page_number = payload.get('PageNumber', 1)
+        page_size = payload.get('PageSize', Config.PAGE_SIZE)
+
+        landing = self.open_landing(task_name)
+        try:
+            page_data, total = await self.request_page_async(session, task_name, url, method, payload, page_number,
+                                                             landing)
+            await self.put_page((task_name, page_data, None))
+
+            # 根据总条数并发请求剩余页（每个API同时在途的页数不超过 PAGE_WORKERS）
+            if total and 'PageNumber' in payload and should_fetch_next_page(page_data, page_size):
+                last_page = page_number + math.ceil(total / page_size) - 1
+                remaining_pages = list(range(page_number + 1, last_page + 1))
+                if remaining_pages:
+                    self.logger.log_info(f"{task_name} 共{total}条数据，并发请求剩余{len(remaining_pages)}页")
+                    pending_pages = iter(remaining_pages)
+                    in_flight: Dict[asyncio.Future, int] = {}
+                    try:
+                        for page in islice(pending_pages, self.PAGE_WORKERS):
+                            in_flight[asyncio.ensure_future(self.request_page_async(
+                                session, task_name, url, method, payload, page, landing))] = page
+                        while in_flight:
+                            done, _ = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+                            for future in done:
+                                page = in_flight.pop(future)
+                                current_data, _ = future.result()
+                                if page == last_page:
+                                    page_data = current_data
+                                await self.put_page((task_name, current_data, None))
+                                next_page = next(pending_pages, None)
+                                if next_page is not None:
+                                    in_flight[asyncio.ensure_future(self.request_page_async(
+                                        session, task_name, url, method, payload, next_page, landing))] = next_page
+                    finally:
+                        for future in in_flight:
+                            future.cancel()
+                    page_number = last_page
+
+            # 未返回总条数，或翻页期间数据有新增时，继续顺序翻页
+            while 'PageNumber' in payload and should_fetch_next_page(page_data, page_size):
+                page_number += 1
+                page_data, _ = await self.request_page_async(session, task_name, url, method, payload, page_number,
+                                                             landing)
+                await self.put_page((task_name, page_data, None))
+
+            if landing is not None:
+                landing.commit()
+            await self.put_page((task_name, None, None))
+        except Exception as e:
+            await self.put_page((task_name, None, Exception(f"API请求过程出错: {str(e)}")))
+        finally:
+            if landing is not None:
+                landing.abort()
+
+    async def produce_all(self, apis: Dict[str, Dict[str, Any]], page_queue: queue.Queue) -> None:
+        """在一个事件循环中并发运行所有API的生产者"""
+        self.loop = asyncio.get_running_loop()
+        self.semaphore = asyncio.Semaphore(self.CONCURRENCY)
+        self.async_limiter = AsyncTokenBucket(self.ASYNC_REQUEST_RATE, self.ASYNC_REQUEST_BURST)
+        self.page_buffer = asyncio.Queue(maxsize=self.PIPELINE_QUEUE_SIZE)
+        forwarder = asyncio.ensure_future(self.forward_pages(page_queue))
+
+        try:
+            async with AsyncSession(impersonate=self.requester.default_impersonate,
+                                    max_clients=self.CONCURRENCY) as session:
+                await asyncio.gather(*(
+                    self.produce_pages_async(session, task_name, api_config)
+                    for task_name, api_config in apis.items()
+                ))
+        except Exception as e:
+            # 会话创建失败等整体异常：为所有任务放入失败标记，避免写库端一直等待
+            self.logger.log_error(f"异步请求引擎异常: {str(e)}")
+            for task_name in apis:
+                await self.put_page((task_name, None, e))
+        finally:
+            await self.page_buffer.put(None)
+            await forwarder
+
+    def run_apis(self) -> Dict[str, int]:
+        """
+        在后台线程运行事件循环请求所有API，主线程逐页写库
+
+        Returns:
+            各任务获取的数据条数
+        """
+        apis = self.select_due_apis(self.get_apis())
+
+        # 加载增量同步水位线（在主线程读取，协程只读内存副本）
+        self.watermarks = self.load_watermarks()
+
+        page_queue: queue.Queue = queue.Queue(maxsize=self.PIPELINE_QUEUE_SIZE)
+        producer = threading.Thread(target=asyncio.run, args=(self.produce_all(apis, page_queue),),
+                                    name="CYY_Async", daemon=True)
+        producer.start()
+        try:
+            return self.consume_pages(apis, page_queue)
+        finally:
+            producer.join()
+            self.write_metrics()
+            self.prune_landing()
+            self.prune_changelog()
+
+
+# 程序入口
+if __name__ == "__main__":
+    sync_manager = None
+    try:
+        sync_manager = AsyncDataSyncManager(time_option=1)
+        sync_manager.run_apis()
+    except Exception as e:
+        error_msg = f"异步数据同步主程序异常: {str(e)}"
+        print(error_msg)
+        send_wechat_notification(error_msg)
+    finally:
+        if sync_manager:
+            sync_manager.close()
@@ -0,0 +1,125 @@
+# 车易云同步端到端基准测试
+# 用本地替身服务（回放录制的响应）和本地 MySQL 兼容数据库运行完整的 DataSyncManager 同步，输出耗时和吞吐
+# 用法：python cyy_benchmark.py <录制目录> --db-host 127.0.0.1 --db-user root --db-password xxx --db-name cyy_bench
+#       [--engine thread|async] [--latency 0.2] [--throttle-rate 0.02] [--failure-rate 0.01] ...
+# 本地数据库需预先导入与生产相同的表结构（DataSaver 按表结构写入）
+import sys
+project_root = r"E:\powerbi_data"
+sys.path.insert(0, project_root)
+from cyy_to_mysql_99 import DataSyncManager
+from cyy_async_sync import AsyncDataSyncManager
+from cyy_standin_server import add_simulation_arguments, create_server
+from urllib.parse import urlsplit, urlunsplit
+from typing import Dict, List, Any
+import argparse
+import time
+import copy
+import os
+
+
+class BenchmarkMixin:
+    """把同步管理器的API地址改为替身服务，不发送企微通知"""
+
+    standin_base_url = ''
+    api_names: List[str] = []
+
+    def api_base_url(self) -> str:
+        return self.standin_base_url
+
+    def get_apis(self) -> Dict[str, Dict[str, Any]]:
+        standin = urlsplit(self.standin_base_url)
+        apis = {}
+        for task_name, api_config in super().get_apis().items():
+            if task_name not in self.api_names:
+                continue
+            api_config = copy.deepcopy(api_config)
+            url = urlsplit(api_config['url'])
+            api_config['url'] = urlunsplit((standin.scheme, standin.netloc, url.path, url.query, ''))
+            apis[task_name] = api_config
+        return apis
+
+    def send_summary(self, total_tasks: int, success_tasks: int, failed_tasks: List[str], total_affected: int,
+                     row_count_notifications: List[str]) -> None:
+        print(f"任务 {success_tasks}/{total_tasks} 成功，总影响行数 {total_affected}")
+        for failed in failed_tasks:
+            print(f"  失败: {failed}")
+
+
+class BenchmarkSyncManager(BenchmarkMixin, DataSyncManager):
+    METRICS_RUN_NAME = 'cyy_benchmark_thread'
+
+
+class BenchmarkAsyncSyncManager(BenchmarkMixin, AsyncDataSyncManager):
+    METRICS_RUN_NAME = 'cyy_benchmark_async'
+
+
+def run_benchmark(args: argparse.Namespace) -> Dict[str, Any]:
+    """
+    启动替身服务并运行一次完整同步
+
+    Returns:
+        基准测试结果（耗时、行数、吞吐和替身服务统计）
+    """
+    server = create_server(args.recordings_dir, args)
+    db_config = {
+        'host': args.db_host,
+        'port': args.db_port,
+        'user': args.db_user,
+        'password': args.db_password,
+        'database': args.db_name,
+        'charset': 'utf8mb4',
+        'local_infile': args.local_infile,
+    }
+    manager_class = BenchmarkAsyncSyncManager if args.engine == 'async' else BenchmarkSyncManager
+    manager_class.standin_base_url = server.start()
+    manager_class.api_names = list(server.apis)
+    manager_class.METRICS_DIR = args.metrics_dir
+    manager_class.LANDING_ENABLED = bool(args.landing_dir)
+    manager_class.LANDING_DIR = args.landing_dir
+
+    sync_manager = None
+    try:
+        sync_manager = manager_class(time_option=args.time_option, incremental=False, db_config=db_config)
+        started = time.perf_counter()
+        results = sync_manager.run_apis()
+        wall_time = time.perf_counter() - started
+    finally:
+        if sync_manager:
+            sync_manager.close()
+        server.stop()
+
+    rows = sum(results.values())
+    written = sum(api.rows_written for api in sync_manager.metrics.apis.values())
+    return {
+        'engine': args.engine,
+        'apis': len(results),
+        'rows': rows,
+        'rows_written': written,
+        'wall_time': wall_time,
+        'rows_per_second': rows / wall_time if wall_time else 0,
+        'standin': dict(server.stats),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='车易云同步端到端基准测试')
+    parser.add_argument('recordings_dir', help='替身服务的录制目录')
+    parser.add_argument('--engine', choices=('thread', 'async'), default='thread', help='同步引擎')
+    parser.add_argument('--time-option', type=int, default=1)
+    parser.add_argument('--db-host', default='127.0.0.1')
+    parser.add_argument('--db-port', type=int, default=3306)
+    parser.add_argument('--db-user', default='root')
+    parser.add_argument('--db-password', default='')
+    parser.add_argument('--db-name', default='cyy_bench')
+    parser.add_argument('--local-infile', action='store_true', help='启用 LOAD DATA LOCAL INFILE 全量写入')
+    parser.add_argument('--metrics-dir', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmark_metrics'))
+    parser.add_argument('--landing-dir', default='', help='原始响应落地目录（默认不落地）')
+    add_simulation_arguments(parser)
+    args = parser.parse_args()
+
+    result = run_benchmark(args)
+    print(f"引擎: {result['engine']}  API数: {result['apis']}")
+    print(f"获取行数: {result['rows']}  提交写库行数: {result['rows_written']}")
+    print(f"总耗时: {result['wall_time']:.2f}秒  吞吐: {result['rows_per_second']:.1f} 行/秒")
+    print(f"替身服务: 请求 {result['standin']['requests']} 次，限流 {result['standin']['throttled']} 次，"
+          f"错误 {result['standin']['failed']} 次，令牌失效 {result['standin']['auth_failed']} 次")
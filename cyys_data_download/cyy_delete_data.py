@@ -1,12 +1,13 @@
 import pandas as pd
 import pymysql
 import json
-from typing import Dict, List, Optional, Tuple, Any
+from typing import Dict, List, Optional, Tuple, Set, Any
 from datetime import datetime
 import os
 import sys
 import logging
 import traceback
+from sync_state import SyncStateStore, RowHashStore, ChangeLogStore
 
 
 # 配置常量
@@ -73,6 +74,11 @@ class Config:
         'car_sales_data': 'ID',
     }
 
+    # 对账模式：单条 DELETE ... IN 语句的ID数量上限
+    DELETE_BATCH_SIZE = 1000
+    # 对账模式：已处理删除日志的 WriteTime 水位线在 sync_state 表中的键
+    DELETE_LOG_WATERMARK_KEY = 'watermark:delete_log_reconcile'
+
     # 日志配置
     LOG_PATH = r"E:\powerbi_data\data\cyy_log\cyy_delete_log\cyy_delete_log"
     LOG_LEVEL = logging.INFO
@@ -238,6 +244,9 @@ class DeleteLogProcessor:
         self.processed_count = 0
         self.deleted_count = 0
         self.errors = []
+        self.logger = logger
+        # 各表字段集合缓存（对账模式每张表只查询一次）
+        self.table_columns: Dict[str, Set[str]] = {}
 
     def load_delete_log_mapping(self) -> Dict[str, List[Dict]]:
         """
@@ -292,10 +301,13 @@ class DeleteLogProcessor:
 
         return {}
 
-    def get_delete_logs(self) -> List[Dict[str, Any]]:
+    def get_delete_logs(self, since: Optional[str] = None) -> List[Dict[str, Any]]:
         """
         从数据库获取删除日志数据
 
+        Args:
+            since: 只获取 WriteTime 不早于该时间的日志，为None时获取全部
+
         Returns:
             删除日志列表
         """
@@ -303,7 +315,8 @@ class DeleteLogProcessor:
 
         try:
             # 查询删除日志表
-            query = """
+            where_clause = "WHERE WriteTime >= %s" if since else ""
+            query = f"""
             SELECT 
                 Title, 
                 Type, 
@@ -311,10 +324,11 @@ class DeleteLogProcessor:
                 WriteTime, 
                 UserName
             FROM delete_log 
+            {where_clause}
             ORDER BY WriteTime DESC
             """
 
-            results = self.db_operator.execute_query(query)
+            results = self.db_operator.execute_query(query, (since,) if since else None)
 
             if results:
                 for row in results:
@@ -580,13 +594,223 @@ class DeleteLogProcessor:
             'errors': self.errors
         }
 
+    def get_table_columns(self, table_name: str) -> Set[str]:
+        """
+        获取表的字段集合（按表缓存）
+
+        Args:
+            table_name: 表名
+
+        Returns:
+            字段名集合，查询失败时为空集合（不缓存）
+        """
+        if table_name not in self.table_columns:
+            result = self.db_operator.execute_query(f"SHOW COLUMNS FROM {table_name}")
+            if result is None:
+                return set()
+            self.table_columns[table_name] = {row[0] for row in result}
+        return self.table_columns[table_name]
+
+    def resolve_delete_targets(self, title: str) -> List[Tuple[str, str]]:
+        """
+        根据删除日志标题确定要删除的 (表名, 字段名) 列表，规则与 execute_delete_for_log 相同
+
+        Args:
+            title: 删除日志标题
+
+        Returns:
+            (表名, 字段名) 列表
+        """
+        targets = []
+        for mapping in self.delete_log_mapping.get(title, []):
+            table_name = self.get_table_name_by_api(mapping['api_name'])
+            if not table_name:
+                continue
+
+            if title == "删除装饰业务数据":
+                delete_field = "ID"
+            elif title == "删除装饰出库数据":
+                delete_field = "OutId"
+            else:
+                delete_field = self.get_table_primary_key(table_name)
+            if not delete_field:
+                continue
+
+            if delete_field not in self.get_table_columns(table_name):
+                self.logger.warning(f"跳过表 {table_name}，字段 {delete_field} 不存在")
+                continue
+            targets.append((table_name, delete_field))
+        return targets
+
+    def delete_ids_batched(self, table_name: str, field_name: str, id_list: List[str],
+                           key_field: Optional[str] = None) -> Optional[Tuple[int, List[str]]]:
+        """
+        按批执行 DELETE ... WHERE field IN (...)
+
+        Args:
+            table_name: 表名
+            field_name: 字段名
+            id_list: 要删除的ID列表
+            key_field: 主键字段，指定时先查询每批中要删除行的主键值并返回（用于清除行哈希和记录变更）；
+                与 field_name 相同时只删除实际存在的ID
+
+        Returns:
+            删除的行数和被删除行的主键值列表（未指定 key_field 时为空），有批次失败时返回None
+        """
+        total_deleted = 0
+        deleted_keys: List[str] = []
+        for start in range(0, len(id_list), Config.DELETE_BATCH_SIZE):
+            chunk = id_list[start:start + Config.DELETE_BATCH_SIZE]
+            keys: List[str] = []
+            if key_field:
+                placeholders = ', '.join(['%s'] * len(chunk))
+                existing = self.db_operator.execute_query(
+                    f"SELECT DISTINCT `{key_field}` FROM `{table_name}` WHERE `{field_name}` IN ({placeholders})",
+                    tuple(chunk)
+                )
+                if existing is None:
+                    return None
+                keys = [str(row[0]) for row in existing if row[0] is not None]
+                if key_field == field_name:
+                    chunk = keys
+                if not existing or not chunk:
+                    continue
+            placeholders = ', '.join(['%s'] * len(chunk))
+            deleted_rows = self.db_operator.execute_delete(
+                table_name,
+                f"`{field_name}` IN ({placeholders})",
+                tuple(chunk)
+            )
+            if self.db_operator.get_last_error():
+                return None
+            total_deleted += deleted_rows
+            deleted_keys.extend(keys)
+        return total_deleted, deleted_keys
+
+    @staticmethod
+    def parse_write_time(value: Any) -> Optional[datetime]:
+        """
+        把删除日志的 WriteTime 转换为 datetime（字段为字符串时按常见格式解析）
+
+        Args:
+            value: WriteTime 字段值
+
+        Returns:
+            datetime，无法解析时返回None
+        """
+        if isinstance(value, datetime):
+            return value
+        if not value:
+            return None
+        text = str(value).strip()
+        for time_format in ('%Y-%m-%d %H:%M:%S.%f', '%Y-%m-%d %H:%M:%S', '%Y/%m/%d %H:%M:%S', '%Y-%m-%dT%H:%M:%S',
+                            '%Y-%m-%d', '%Y/%m/%d'):
+            try:
+                return datetime.strptime(text, time_format)
+            except ValueError:
+                continue
+        return None
+
+    def reconcile_delete_logs(self) -> Dict[str, Any]:
+        """
+        对账模式：只处理水位线之后的新删除日志，按 (表, 字段) 分组后批量删除
+
+        删除前先查询要删除行的主键（按主键删除时即实际存在的ID），为这些主键清除行哈希
+        （避免数据重新出现时被增量同步当作未变化而跳过）并记录删除变更，日志中已不存在的ID不重复记录；
+        表没有主键时清除整张表的行哈希并记一条整表替换。
+        所有分组删除成功后才推进水位线；水位线按 >= 比较，同一秒的日志会重复处理一次（删除是幂等的）。
+
+        Returns:
+            处理结果统计
+        """
+        state_store = SyncStateStore(self.db_operator)
+        row_hash_store = RowHashStore(self.db_operator)
+        changelog = ChangeLogStore(self.db_operator, f"delete_{datetime.now().strftime('%Y%m%d_%H%M%S')}")
+
+        watermark = state_store.get(Config.DELETE_LOG_WATERMARK_KEY)
+        self.logger.info(f"开始对账删除日志，水位线: {watermark or '无（处理全部日志）'}")
+
+        delete_logs = self.get_delete_logs(since=watermark)
+        if not delete_logs:
+            self.logger.info("没有新的删除日志")
+            return {
+                'total_logs': 0,
+                'processed_logs': 0,
+                'total_deleted': 0,
+                'errors': self.errors
+            }
+
+        # 按 (表, 字段) 汇总要删除的ID
+        grouped_ids: Dict[Tuple[str, str], Dict[str, None]] = {}
+        target_cache: Dict[str, List[Tuple[str, str]]] = {}
+        for delete_log in delete_logs:
+            title = delete_log['title']
+            id_list = self.split_ids(delete_log['logo_id_or_code'])
+            if not id_list:
+                continue
+            if title not in target_cache:
+                target_cache[title] = self.resolve_delete_targets(title)
+            for target in target_cache[title]:
+                grouped_ids.setdefault(target, {}).update(dict.fromkeys(id_list))
+            self.processed_count += 1
+
+        total_deleted = 0
+        failed = False
+        for (table_name, field_name), ids in grouped_ids.items():
+            id_list = list(ids)
+            primary_key = self.get_table_primary_key(table_name)
+            result = self.delete_ids_batched(table_name, field_name, id_list, key_field=primary_key)
+            if result is None:
+                failed = True
+                error_msg = f"批量删除 {table_name}.{field_name} 失败: {self.db_operator.get_last_error()}"
+                self.logger.error(error_msg)
+                self.errors.append(error_msg)
+                continue
+            deleted_rows, deleted_keys = result
+
+            if primary_key:
+                if deleted_keys:
+                    row_hash_store.delete_hashes(table_name, deleted_keys)
+                    changelog.append(table_name, [(pk, ChangeLogStore.OP_DELETE) for pk in deleted_keys])
+            elif deleted_rows > 0:
+                # 没有主键无法逐行记录，清除整张表的行哈希并记一条整表替换
+                row_hash_store.clear(table_name)
+                changelog.append(table_name, [('', ChangeLogStore.OP_REPLACE)])
+
+            total_deleted += deleted_rows
+            self.deleted_count += deleted_rows
+            if deleted_rows > 0:
+                self.logger.info(f"从 {table_name} 表中删除了 {deleted_rows} 行数据（{field_name} 共 {len(id_list)} 个ID）")
+            else:
+                self.logger.info(f"{table_name} 表中 {len(id_list)} 个ID均已不存在")
+
+        if not failed:
+            write_times = [self.parse_write_time(delete_log['write_time']) for delete_log in delete_logs]
+            write_times = [write_time for write_time in write_times if write_time is not None]
+            if write_times:
+                latest = max(write_times).strftime('%Y-%m-%d %H:%M:%S')
+                state_store.set(Config.DELETE_LOG_WATERMARK_KEY, latest)
+                self.logger.info(f"删除日志水位线推进到: {latest}")
+
+        return {
+            'total_logs': len(delete_logs),
+            'processed_logs': self.processed_count,
+            'total_deleted': total_deleted,
+            'errors': self.errors
+        }
+
     def close(self):
         """关闭资源"""
         self.db_operator.close()
 
 
-def main():
-    """主函数"""
+def main(full_replay: bool = False):
+    """
+    主函数
+
+    Args:
+        full_replay: 为True时逐条重放全部删除日志（原处理方式），否则使用对账模式
+    """
     print("=" * 50)
     print("删除日志处理程序")
     print(f"开始时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
@@ -597,8 +821,11 @@ def main():
         # 创建处理器
         processor = DeleteLogProcessor()
 
-        # 处理所有删除日志
-        result = processor.process_all_delete_logs()
+        # 默认只对账新的删除日志，--full 时处理所有删除日志
+        if full_replay:
+            result = processor.process_all_delete_logs()
+        else:
+            result = processor.reconcile_delete_logs()
 
         print("\n" + "=" * 50)
         print("删除日志处理完成")
@@ -629,4 +856,4 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main(full_replay='--full' in sys.argv[1:])
\ No newline at end of file
@@ -0,0 +1,458 @@
+# 车易云接口本地替身服务
+# 录制：python cyy_standin_server.py record <录制目录> [--time-option 1] [--max-pages 5]
+# 回放：python cyy_standin_server.py serve <录制目录> [--port 18099] [--latency 0.3] [--throttle-rate 0.02] ...
+# 录制的响应按API保存为 <录制目录>/<API名称>/page_0001.json，敏感字段做确定性脱敏（同一原值脱敏结果相同，主键仍唯一）
+import sys
+project_root = r"E:\powerbi_data"
+sys.path.insert(0, project_root)
+from common_code import RequestFunction, WriteLog, decode_json
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qsl
+from typing import Dict, List, Any, Optional, Tuple
+import threading
+import argparse
+import hashlib
+import random
+import uuid
+import copy
+import json
+import time
+import os
+from config.cyys_data_download.config import Config, DataCenter
+
+# 字段名包含以下片段（不区分大小写）时视为敏感字段
+SENSITIVE_FIELD_PARTS = ('phone', 'tel', 'mobile', 'name', 'idcard', 'idno', 'cardno', 'address', 'addr',
+                         'email', 'wechat', 'contact', 'bankaccount', 'account')
+# 分页和令牌参数，按请求参数匹配API时忽略
+PAGING_PARAMS = {'Token', 'PageNumber', 'PageSize'}
+ANONYMIZE_SALT = 'cyy-standin'
+
+
+def anonymize_value(value: Any, salt: str = ANONYMIZE_SALT) -> Any:
+    """
+    确定性脱敏：保留长度和字符类别（数字、字母、中文），同一原值得到相同结果
+
+    Args:
+        value: 原值（字符串或整数，其他类型原样返回）
+        salt: 脱敏盐值
+
+    Returns:
+        脱敏后的值，类型与原值相同
+    """
+    if isinstance(value, bool) or not isinstance(value, (str, int)):
+        return value
+    text = str(value)
+    digest = hashlib.sha256(f"{salt}|{text}".encode('utf-8')).digest()
+    while len(digest) < len(text):
+        digest += hashlib.sha256(digest).digest()
+
+    chars = []
+    for char, byte in zip(text, digest):
+        if char.isdigit():
+            chars.append(str(byte % 10))
+        elif 'a' <= char.lower() <= 'z':
+            letter = chr(ord('a') + byte % 26)
+            chars.append(letter.upper() if char.isupper() else letter)
+        elif '\u4e00' <= char <= '\u9fff':
+            chars.append(chr(0x4e00 + (byte * 37 + ord(char)) % 0x5000))
+        else:
+            chars.append(char)
+    result = ''.join(chars)
+    if isinstance(value, int):
+        # 避免首位变为0导致位数变化
+        return int(result) if not result.startswith('0') else int('1' + result[1:])
+    return result
+
+
+def anonymize(data: Any, salt: str = ANONYMIZE_SALT) -> Any:
+    """递归脱敏响应体中的敏感字段"""
+    if isinstance(data, list):
+        return [anonymize(item, salt) for item in data]
+    if isinstance(data, dict):
+        result = {}
+        for key, value in data.items():
+            if isinstance(value, (dict, list)):
+                result[key] = anonymize(value, salt)
+            elif any(part in key.lower() for part in SENSITIVE_FIELD_PARTS):
+                result[key] = anonymize_value(value, salt)
+            else:
+                result[key] = value
+        return result
+    return data
+
+
+def locate_items(body: Dict[str, Any]) -> Tuple[Dict[str, Any], str]:
+    """
+    定位响应体中存放当前页数据的位置（与 extract_page_items 的解析规则一致）
+
+    Returns:
+        数据所在的字典和键名
+    """
+    container, key = (body['Msg'], 'Model') if isinstance(body.get('Msg'), dict) else (body, 'Data')
+    if isinstance(container.get(key), dict):
+        container = container[key]
+        key = 'list' if 'list' in container else 'items'
+    return container, key
+
+
+def total_containers(body: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """响应体中可能包含总条数字段的字典（与 extract_total 的查找范围一致）"""
+    candidates = [body]
+    if isinstance(body.get('Msg'), dict):
+        candidates.append(body['Msg'])
+        candidates.append(body['Msg'].get('Model'))
+    candidates.append(body.get('Data'))
+    return [candidate for candidate in candidates if isinstance(candidate, dict)]
+
+
+def record_apis(output_dir: str, time_option: int = 1, max_pages: int = 5,
+                api_names: Optional[List[str]] = None) -> Dict[str, int]:
+    """
+    从真实接口录制 DataCenter.get_apis_99 中各API的前几页响应（脱敏后保存）
+
+    Args:
+        output_dir: 录制目录
+        time_option: 时间选项 1-当日 2-当月 3-全部数据
+        max_pages: 每个API最多录制的页数
+        api_names: 只录制指定的API，默认全部
+
+    Returns:
+        各API录制的数据条数
+    """
+    logger = WriteLog()
+    requester = RequestFunction()
+    results = {}
+    try:
+        token_response = requester.request(
+            url=f'{Config.API_BASE_URL}/api/Values/GetToken',
+            method='GET',
+            params={"Account": DataCenter.USER, "PassWord": DataCenter.PWD},
+        )
+        token = token_response['data']['Msg']
+
+        for api_name, api_config in DataCenter.get_apis_99(time_option).items():
+            if api_names and api_name not in api_names:
+                continue
+            api_dir = os.path.join(output_dir, api_name)
+            os.makedirs(api_dir, exist_ok=True)
+            payload = copy.deepcopy(api_config.get('payload', {}))
+            method = api_config['method'].upper()
+            page_number = payload.get('PageNumber', 1)
+            rows = 0
+
+            for page_index in range(1, max_pages + 1):
+                page_payload = dict(payload, Token=token)
+                if 'PageNumber' in page_payload:
+                    page_payload['PageNumber'] = page_number + page_index - 1
+                kwargs = {'params': page_payload} if method == 'GET' else {'json_data': page_payload}
+                response = requester.request(url=api_config['url'], method=method, **kwargs)
+                body = response.get('data')
+                if not response.get('success') or not isinstance(body, dict):
+                    logger.log_warning(f"{api_name} 第{page_index}页录制失败: {response.get('error')}")
+                    break
+                with open(os.path.join(api_dir, f"page_{page_index:04d}.json"), 'w', encoding='utf-8') as f:
+                    json.dump(anonymize(body), f, ensure_ascii=False)
+
+                container, key = locate_items(body)
+                page_items = container.get(key) or []
+                rows += len(page_items)
+                if 'PageNumber' not in payload or len(page_items) < payload.get('PageSize', Config.PAGE_SIZE):
+                    break
+
+            meta = {
+                'path': urlsplit(api_config['url']).path,
+                'method': method,
+                'payload': {k: v for k, v in payload.items() if k not in PAGING_PARAMS},
+            }
+            with open(os.path.join(api_dir, 'meta.json'), 'w', encoding='utf-8') as f:
+                json.dump(meta, f, ensure_ascii=False, indent=2)
+            results[api_name] = rows
+            logger.log_info(f"{api_name} 录制完成，共 {rows} 条")
+    finally:
+        requester.close()
+    return results
+
+
+class RecordedApi:
+    """一个API的录制数据：合并所有录制页的数据，按请求的页码和分页大小重新切片"""
+
+    def __init__(self, api_name: str, api_dir: str):
+        self.api_name = api_name
+        with open(os.path.join(api_dir, 'meta.json'), 'r', encoding='utf-8') as f:
+            self.meta = json.load(f)
+        self.items: List[Dict] = []
+        self.template: Optional[Dict[str, Any]] = None
+
+        for file_name in sorted(os.listdir(api_dir)):
+            if not file_name.startswith('page_'):
+                continue
+            with open(os.path.join(api_dir, file_name), 'rb') as f:
+                body = decode_json(f.read())
+            container, key = locate_items(body)
+            self.items.extend(container.get(key) or [])
+            if self.template is None:
+                container[key] = []
+                self.template = body
+        if self.template is None:
+            self.template = {'Code': 200, 'Total': 0, 'Data': []}
+
+    def render_page(self, page_number: int, page_size: int) -> Dict[str, Any]:
+        """生成指定页的响应体（总条数为录制的数据条数）"""
+        body = copy.deepcopy(self.template)
+        container, key = locate_items(body)
+        start = (page_number - 1) * page_size
+        container[key] = self.items[start:start + page_size]
+        for candidate in total_containers(body):
+            for total_key in ('Total', 'total', 'TotalCount', 'totalCount', 'RecordCount', 'recordCount'):
+                if total_key in candidate and not isinstance(candidate[total_key], bool):
+                    candidate[total_key] = len(self.items)
+        return body
+
+
+class StandinServer:
+    """
+    车易云接口本地替身服务（回放录制的响应）
+
+    按请求路径（同一路径对应多个API时再按请求参数）找到录制的API，按页码和分页大小返回数据，
+    可模拟网络延迟、限流（429）、服务端错误（500）、并发上限和令牌过期。
+    示例：
+    server = StandinServer(r'E:\\powerbi_data\\data\\cyy_recordings', latency=0.3, throttle_rate=0.02)
+    base_url = server.start()
+    ...
+    server.stop()
+    """
+
+    def __init__(self, recordings_dir: str, latency: float = 0.0, latency_jitter: float = 0.0,
+                 latency_per_1000_rows: float = 0.0, throttle_rate: float = 0.0, failure_rate: float = 0.0,
+                 max_concurrency: int = 0, token_ttl: int = 0, seed: Optional[int] = None):
+        """
+        Args:
+            recordings_dir: 录制目录
+            latency: 平均响应延迟（秒）
+            latency_jitter: 延迟的标准差（秒）
+            latency_per_1000_rows: 每1000行额外增加的延迟（秒），用于模拟大分页变慢
+            throttle_rate: 随机返回429的概率
+            failure_rate: 随机返回500的概率
+            max_concurrency: 同时处理的请求数上限，超过时返回429（0表示不限制）
+            token_ttl: 令牌有效期（秒），过期后返回令牌失效（0表示不过期）
+            seed: 随机数种子，便于复现
+        """
+        self.logger = WriteLog()
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        self.latency_per_1000_rows = latency_per_1000_rows
+        self.throttle_rate = throttle_rate
+        self.failure_rate = failure_rate
+        self.max_concurrency = max_concurrency
+        self.token_ttl = token_ttl
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.tokens: Dict[str, float] = {}
+        self.stats = {'requests': 0, 'throttled': 0, 'failed': 0, 'auth_failed': 0, 'rows': 0}
+        self.httpd: Optional[ThreadingHTTPServer] = None
+        self.thread: Optional[threading.Thread] = None
+
+        self.apis: Dict[str, RecordedApi] = {}
+        self.routes: Dict[str, List[RecordedApi]] = {}
+        for api_name in sorted(os.listdir(recordings_dir)):
+            api_dir = os.path.join(recordings_dir, api_name)
+            if not os.path.isfile(os.path.join(api_dir, 'meta.json')):
+                continue
+            api = RecordedApi(api_name, api_dir)
+            self.apis[api_name] = api
+            self.routes.setdefault(api.meta['path'], []).append(api)
+        self.logger.log_info(f"替身服务已加载 {len(self.apis)} 个API的录制数据")
+
+    def route(self, path: str, params: Dict[str, Any]) -> Optional[RecordedApi]:
+        """按路径和请求参数找到对应的录制API（参数相同的个数最多者）"""
+        candidates = self.routes.get(path)
+        if not candidates:
+            return None
+        if len(candidates) == 1:
+            return candidates[0]
+
+        def _score(api: RecordedApi) -> int:
+            return sum(1 for key, value in api.meta['payload'].items()
+                       if key in params and str(params[key]) == str(value))
+        return max(candidates, key=_score)
+
+    def issue_token(self) -> str:
+        token = f"standin-{uuid.uuid4().hex}"
+        with self.lock:
+            self.tokens[token] = time.time()
+        return token
+
+    def token_valid(self, token: Any) -> bool:
+        if not self.token_ttl:
+            return True
+        with self.lock:
+            issued_at = self.tokens.get(token)
+        return issued_at is not None and time.time() - issued_at < self.token_ttl
+
+    def simulate(self) -> Tuple[float, Optional[int]]:
+        """
+        抽取本次请求的延迟和故障
+
+        Returns:
+            延迟秒数和要返回的错误状态码（正常时为None）
+        """
+        with self.lock:
+            self.stats['requests'] += 1
+            delay = max(0.0, self.random.gauss(self.latency, self.latency_jitter)) if self.latency_jitter else self.latency
+            roll = self.random.random()
+            if self.max_concurrency and self.in_flight >= self.max_concurrency:
+                self.stats['throttled'] += 1
+                return delay, 429
+            if roll < self.throttle_rate:
+                self.stats['throttled'] += 1
+                return delay, 429
+            if roll < self.throttle_rate + self.failure_rate:
+                self.stats['failed'] += 1
+                return delay, 500
+        return delay, None
+
+    def handle(self, method: str, raw_path: str, body: bytes) -> Tuple[int, Dict[str, Any]]:
+        """处理一次请求，返回状态码和响应体"""
+        url = urlsplit(raw_path)
+        params: Dict[str, Any] = dict(parse_qsl(url.query))
+        if method == 'POST' and body:
+            try:
+                params.update(decode_json(body))
+            except ValueError:
+                return 400, {'Code': 400, 'Msg': '请求体不是有效的JSON'}
+
+        if url.path.rstrip('/').endswith('/api/Values/GetToken'):
+            return 200, {'Code': 200, 'Msg': self.issue_token()}
+
+        api = self.route(url.path, params)
+        if api is None:
+            return 404, {'Code': 404, 'Msg': f'未录制的接口: {url.path}'}
+
+        page_size = int(params.get('PageSize') or len(api.items) or 1)
+        page_number = int(params.get('PageNumber') or 1)
+        delay, status = self.simulate()
+        delay += self.latency_per_1000_rows * min(page_size, len(api.items)) / 1000
+        with self.lock:
+            self.in_flight += 1
+        try:
+            time.sleep(delay)
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+
+        if status == 429:
+            return 429, {'Code': 429, 'Msg': '请求过于频繁'}
+        if status == 500:
+            return 500, {'Code': 500, 'Msg': '服务器内部错误'}
+        if not self.token_valid(params.get('Token')):
+            with self.lock:
+                self.stats['auth_failed'] += 1
+            return 200, {'Code': 401, 'Msg': 'Token已过期'}
+
+        page = api.render_page(page_number, page_size)
+        container, key = locate_items(page)
+        with self.lock:
+            self.stats['rows'] += len(container[key])
+        return 200, page
+
+    def start(self, host: str = '127.0.0.1', port: int = 0) -> str:
+        """
+        在后台线程启动服务
+
+        Args:
+            host: 监听地址
+            port: 监听端口，0表示自动分配
+
+        Returns:
+            服务地址，如 http://127.0.0.1:18099
+        """
+        standin = self
+
+        class _Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def _serve(self) -> None:
+                length = int(self.headers.get('Content-Length') or 0)
+                request_body = self.rfile.read(length) if length else b''
+                try:
+                    status, response_body = standin.handle(self.command, self.path, request_body)
+                except Exception as e:
+                    status, response_body = 500, {'Code': 500, 'Msg': f'替身服务异常: {str(e)}'}
+                content = json.dumps(response_body, ensure_ascii=False).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json; charset=utf-8')
+                self.send_header('Content-Length', str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+
+            do_GET = _serve
+            do_POST = _serve
+
+            def log_message(self, format: str, *args: Any) -> None:
+                pass
+
+        self.httpd = ThreadingHTTPServer((host, port), _Handler)
+        self.httpd.daemon_threads = True
+        self.thread = threading.Thread(target=self.httpd.serve_forever, name="CYY_Standin", daemon=True)
+        self.thread.start()
+        base_url = f"http://{host}:{self.httpd.server_address[1]}"
+        self.logger.log_info(f"替身服务已启动: {base_url}")
+        return base_url
+
+    def stop(self) -> None:
+        """停止服务"""
+        if self.httpd:
+            self.httpd.shutdown()
+            self.httpd.server_close()
+            self.httpd = None
+
+
+def add_simulation_arguments(parser: argparse.ArgumentParser) -> None:
+    """添加故障模拟相关的命令行参数（回放服务和基准测试共用）"""
+    parser.add_argument('--latency', type=float, default=0.2, help='平均响应延迟（秒）')
+    parser.add_argument('--latency-jitter', type=float, default=0.05, help='延迟标准差（秒）')
+    parser.add_argument('--latency-per-1000-rows', type=float, default=0.05, help='每1000行额外延迟（秒）')
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help='随机返回429的概率')
+    parser.add_argument('--failure-rate', type=float, default=0.0, help='随机返回500的概率')
+    parser.add_argument('--max-concurrency', type=int, default=0, help='并发请求上限，超过返回429')
+    parser.add_argument('--token-ttl', type=int, default=0, help='令牌有效期（秒）')
+    parser.add_argument('--seed', type=int, default=None, help='随机数种子')
+
+
+def create_server(recordings_dir: str, args: argparse.Namespace) -> StandinServer:
+    """根据命令行参数创建替身服务"""
+    return StandinServer(recordings_dir, latency=args.latency, latency_jitter=args.latency_jitter,
+                         latency_per_1000_rows=args.latency_per_1000_rows, throttle_rate=args.throttle_rate,
+                         failure_rate=args.failure_rate, max_concurrency=args.max_concurrency,
+                         token_ttl=args.token_ttl, seed=args.seed)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='车易云接口本地替身服务')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    record_parser = subparsers.add_parser('record', help='从真实接口录制响应')
+    record_parser.add_argument('recordings_dir')
+    record_parser.add_argument('--time-option', type=int, default=1)
+    record_parser.add_argument('--max-pages', type=int, default=5)
+    record_parser.add_argument('--api', action='append', dest='apis', help='只录制指定API，可重复')
+
+    serve_parser = subparsers.add_parser('serve', help='回放录制的响应')
+    serve_parser.add_argument('recordings_dir')
+    serve_parser.add_argument('--host', default='127.0.0.1')
+    serve_parser.add_argument('--port', type=int, default=18099)
+    add_simulation_arguments(serve_parser)
+
+    args = parser.parse_args()
+    if args.command == 'record':
+        recorded = record_apis(args.recordings_dir, args.time_option, args.max_pages, args.apis)
+        print(f"录制完成: {len(recorded)} 个API，共 {sum(recorded.values())} 条")
+    else:
+        server = create_server(args.recordings_dir, args)
+        print(f"替身服务地址: {server.start(args.host, args.port)}")
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            server.stop()
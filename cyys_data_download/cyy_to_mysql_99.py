@@ -2,16 +2,30 @@
 import sys
 project_root = r"E:\powerbi_data"
 sys.path.insert(0, project_root)
-from common_code import RequestFunction, WriteLog
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from datetime import datetime
+from common_code import (RequestFunction, WriteLog, TokenBucket, TokenCache, AdaptiveController, RetryPolicy,
+                         is_auth_error, is_throttled)
+from sync_state import SyncStateStore, RowHashStore, ChangeLogStore
+from sync_metrics import SyncMetrics
+from landing_zone import LandingZone, LandingStream
+from polling_policy import PollingPolicy
+from concurrent.futures import ThreadPoolExecutor, Future, wait, FIRST_COMPLETED
+from datetime import datetime, timedelta
 from webdav3.client import Client
-from time import sleep
-import random
+from time import sleep, monotonic
 import copy
+import math
+import queue
+import threading
+import hashlib
+import tempfile
+import os
 import pymysql
+from pymysql.cursors import RE_INSERT_VALUES
 import requests
-from typing import Dict, List, Any, Optional, Tuple, Set
+from typing import Dict, List, Any, Optional, Tuple, Set, Iterator, Callable
+from operator import methodcaller
+from itertools import islice, chain
+from collections import Counter
 import json
 from config.cyys_data_download.config import Config, DataCenter
 
@@ -32,6 +46,84 @@ def should_fetch_next_page(current_items: list, page_size: int) -> bool:
     return len(current_items) >= page_size
 
 
+def validate_page_body(body: Any) -> None:
+    """
+    检查接口响应 data 部分的结构
+
+    Args:
+        body: 接口响应的 data 部分
+
+    Raises:
+        KeyError: 数据结构不完整
+    """
+    if not body:
+        raise KeyError("data 字段为空")
+
+    # 检查嵌套的数据结构
+    if 'Msg' in body:
+        if 'Model' not in body['Msg']:
+            raise KeyError("data.Msg 中缺少 'Model' 字段")
+    else:
+        if 'Data' not in body:
+            raise KeyError("data 中缺少 'Data' 字段")
+
+
+def extract_page_items(body: Dict[str, Any]) -> Any:
+    """
+    从接口响应中提取当前页的数据（调用前需通过 validate_page_body 检查）
+
+    Args:
+        body: 接口响应的 data 部分
+
+    Returns:
+        当前页数据，正常情况下为列表
+    """
+    if 'Msg' in body:
+        page_data = body['Msg']['Model']
+    else:
+        page_data = body['Data']
+
+    # 处理不同类型的数据结构
+    if isinstance(page_data, dict):
+        page_data = page_data.get('list', page_data.get('items', []))
+    return page_data
+
+
+def extract_total(body: Any) -> Optional[int]:
+    """
+    从接口响应中提取数据总条数
+
+    Args:
+        body: 接口响应的 data 部分
+
+    Returns:
+        总条数，响应中没有有效的总条数字段时返回None
+    """
+    if not isinstance(body, dict):
+        return None
+    total_keys = ('Total', 'total', 'TotalCount', 'totalCount', 'RecordCount', 'recordCount')
+    candidates = [body]
+    if isinstance(body.get('Msg'), dict):
+        candidates.append(body['Msg'])
+        candidates.append(body['Msg'].get('Model'))
+    candidates.append(body.get('Data'))
+
+    for candidate in candidates:
+        if not isinstance(candidate, dict):
+            continue
+        for key in total_keys:
+            value = candidate.get(key)
+            if isinstance(value, bool):
+                continue
+            try:
+                total = int(value)
+            except (ValueError, TypeError):
+                continue
+            if total >= 0:
+                return total
+    return None
+
+
 def flatten_data(data_list: List[Dict], parent_key: str = '', sep: str = '_') -> Tuple[List[Dict], List[str]]:
     """
     将嵌套的字典列表展平，用于处理API返回的嵌套结构数据
@@ -71,6 +163,106 @@ def flatten_data(data_list: List[Dict], parent_key: str = '', sep: str = '_') ->
     return flattened, list(all_fields)
 
 
+class CompiledFlattener:
+    """
+    按样例数据的键路径生成的专用展平函数（同一API各页结构固定，省去逐项递归和键名拼接）
+    示例：
+    flattener = CompiledFlattener(data_list[0])
+    flattened_data, fieldnames = flattener.flatten(data_list)
+
+    结构与样例不一致的项（键不同、空值变成了字典等）回退到 flatten_data，结果与 flatten_data 一致；
+    一页中超过一半的项不匹配时，用第一个不匹配的项重新生成。
+    """
+
+    def __init__(self, sample: Dict, sep: str = '_'):
+        self.sep = sep
+        self.compile(sample)
+
+    @staticmethod
+    def collect_paths(d: Dict, prefix: Tuple[str, ...] = ()) -> List[Tuple[str, ...]]:
+        """按 flatten_data 的规则收集样例中所有叶子节点的键路径"""
+        paths = []
+        for k, v in d.items():
+            if isinstance(v, dict) and v:
+                paths.extend(CompiledFlattener.collect_paths(v, prefix + (k,)))
+            else:
+                paths.append(prefix + (k,))
+        return paths
+
+    def compile(self, sample: Dict) -> None:
+        """根据样例生成展平函数源码并编译"""
+        paths = self.collect_paths(sample)
+        self.fieldnames = [self.sep.join(path) for path in paths]
+
+        # 每个嵌套字典取一次并校验类型和键数量，叶子值按顺序组成元组
+        lines = ["def flatten_item(item):", f"    if len(item) != {len(sample)}: return None"]
+        node_names = {(): 'item'}
+
+        def _emit_node(path: Tuple[str, ...], node: Dict) -> None:
+            for k, v in node.items():
+                if isinstance(v, dict) and v:
+                    child_path = path + (k,)
+                    name = f"n{len(node_names)}"
+                    node_names[child_path] = name
+                    lines.append(f"    {name} = {node_names[path]}[{k!r}]")
+                    lines.append(f"    if type({name}) is not dict or len({name}) != {len(v)}: return None")
+                    _emit_node(child_path, v)
+
+        _emit_node((), sample)
+        value_exprs = [f"{node_names[path[:-1]]}[{path[-1]!r}]" for path in paths]
+        lines.append(f"    values = ({', '.join(value_exprs)}{',' if len(value_exprs) == 1 else ''})")
+        # 叶子值变成非空字典时，展平结果会多出字段，交给通用展平处理
+        lines.append("    for value in values:")
+        lines.append("        if type(value) is dict and value: return None")
+        lines.append("    return dict(zip(FIELDNAMES, values))")
+
+        namespace = {'FIELDNAMES': tuple(self.fieldnames)}
+        exec(compile('\n'.join(lines), '<flatten_item>', 'exec'), namespace)
+        self._flatten_item = namespace['flatten_item']
+
+    def flatten_item(self, item: Dict) -> Optional[Dict]:
+        """展平单项，结构不匹配时返回None"""
+        try:
+            return self._flatten_item(item)
+        except KeyError:
+            return None
+
+    def flatten(self, data_list: List[Dict]) -> Tuple[List[Dict], List[str]]:
+        """
+        展平数据列表，返回值与 flatten_data 相同
+
+        Args:
+            data_list: 嵌套字典的列表
+
+        Returns:
+            展平后的数据列表和所有字段名集合
+        """
+        flattened = []
+        all_fields: Set[str] = set()
+        matched = False
+        mismatches: List[Dict] = []
+
+        for item in data_list:
+            if not isinstance(item, dict):
+                continue  # 跳过非字典类型的项
+            flat_item = self.flatten_item(item)
+            if flat_item is None:
+                fallback, fields = flatten_data([item], sep=self.sep)
+                flat_item = fallback[0]
+                all_fields.update(fields)
+                mismatches.append(item)
+            else:
+                matched = True
+            flattened.append(flat_item)
+
+        if matched:
+            all_fields.update(self.fieldnames)
+        if mismatches and len(mismatches) * 2 > len(flattened):
+            self.compile(mismatches[0])
+
+        return flattened, list(all_fields)
+
+
 def send_wechat_notification(content: str) -> bool:
     """
     发送企业微信机器人通知
@@ -110,10 +302,20 @@ def send_wechat_notification(content: str) -> bool:
 class DBOperator:
     """数据库操作类"""
 
+    # 分块写入：每块最大行数、最大字节数，连接错误时的重试次数和间隔（秒）
+    CHUNK_MAX_ROWS = 1000
+    CHUNK_MAX_BYTES = 1024 * 1024
+    CHUNK_MAX_RETRIES = 3
+    CHUNK_RETRY_DELAY = 2
+    # 连接空闲超过该秒数后，使用前先 ping 检查
+    HEALTH_CHECK_INTERVAL = 30
+
     def __init__(self, db_config: Dict[str, Any]):
         self.db_config = db_config
         self.connection: Optional[pymysql.Connection] = None
         self.last_error: Optional[str] = None  # 记录最后一次错误信息
+        self.skipped_rows: List[int] = []  # 最近一次分块写入中因数据错误跳过的行（参数列表下标）
+        self.last_used = monotonic()
         self.logger = WriteLog()
         self.connect()
 
@@ -132,9 +334,30 @@ class DBOperator:
     def reconnect(self) -> None:
         """重新连接数据库"""
         if self.connection:
-            self.connection.close()
+            try:
+                self.connection.close()
+            except Exception:
+                pass  # 连接已断开
         self.connect()
 
+    def ensure_connection(self) -> None:
+        """
+        连接健康检查：连接空闲超过 HEALTH_CHECK_INTERVAL 时 ping，失败则重连
+
+        Raises:
+            重连失败时抛出连接异常
+        """
+        now = monotonic()
+        if self.connection is None:
+            self.connect()
+        elif now - self.last_used > self.HEALTH_CHECK_INTERVAL:
+            try:
+                self.connection.ping(reconnect=False)
+            except Exception as e:
+                self.logger.log_warning(f"数据库连接检查失败: {str(e)}，重新连接")
+                self.reconnect()
+        self.last_used = now
+
     def execute_query(self, query: str, params: Optional[Tuple] = None) -> Optional[List[Tuple]]:
         """执行查询语句"""
         try:
@@ -166,6 +389,112 @@ class DBOperator:
             self.reconnect()
             return 0
 
+    def execute_batched(self, query: str, data_list: List[Tuple]) -> int:
+        """
+        分块执行批量插入/更新
+
+        把单行 INSERT ... VALUES (...) [ON DUPLICATE KEY UPDATE ...] 语句按行数和字节预算
+        拼接为多行语句，每块单独提交。连接类错误只重试失败的块；数据类错误把块二分，
+        定位并跳过出错的行，其余行照常写入。
+
+        Args:
+            query: 单行插入语句（与 execute_many 相同）
+            data_list: 参数列表
+
+        Returns:
+            已提交的影响行数（有块因连接错误最终失败时 last_error 不为空；
+            因数据错误跳过的行不算失败，其下标记录在 skipped_rows 中）
+        """
+        match = RE_INSERT_VALUES.match(query)
+        if not match:
+            return self.execute_many(query, data_list)
+
+        prefix = match.group(1) % ()
+        values_template = match.group(2).rstrip()
+        suffix = match.group(3) or ''
+        base_bytes = len((prefix + suffix).encode('utf-8'))
+
+        self.last_error = None
+        self.skipped_rows = []
+        chunk_errors = []
+        total_affected = 0
+        chunk: List[Tuple[int, str]] = []
+        chunk_bytes = base_bytes
+
+        try:
+            for index, row in enumerate(data_list):
+                values = values_template % tuple(self.connection.literal(value) for value in row)
+                row_bytes = len(values.encode('utf-8')) + 1
+                if chunk and (len(chunk) >= self.CHUNK_MAX_ROWS or chunk_bytes + row_bytes > self.CHUNK_MAX_BYTES):
+                    total_affected += self._execute_chunk(prefix, chunk, suffix, chunk_errors)
+                    chunk = []
+                    chunk_bytes = base_bytes
+                chunk.append((index, values))
+                chunk_bytes += row_bytes
+
+            if chunk:
+                total_affected += self._execute_chunk(prefix, chunk, suffix, chunk_errors)
+        except Exception as e:
+            chunk_errors.append(f"分块写入中断: {str(e)}")
+
+        if self.skipped_rows:
+            self.logger.log_warning(f"分块写入跳过 {len(self.skipped_rows)} 行无法写入的数据，其余行已提交")
+        if chunk_errors:
+            self.last_error = f"分块写入有 {len(chunk_errors)} 处失败: {chunk_errors[0]}"
+            self.logger.log_error(self.last_error)
+        return total_affected
+
+    def _execute_chunk(self, prefix: str, rows: List[Tuple[int, str]], suffix: str, chunk_errors: List[str]) -> int:
+        """
+        执行并提交一个多行语句块
+
+        Args:
+            prefix: INSERT ... VALUES 部分
+            rows: (参数列表下标, 已转义的 (...) 片段) 列表
+            suffix: ON DUPLICATE KEY UPDATE 部分
+            chunk_errors: 收集最终失败的错误信息
+
+        Returns:
+            影响的行数
+        """
+        sql = f"{prefix}{','.join(values for _, values in rows)}{suffix}"
+
+        for attempt in range(self.CHUNK_MAX_RETRIES):
+            try:
+                with self.connection.cursor() as cursor:
+                    affected = cursor.execute(sql)
+                self.connection.commit()
+                return affected
+            except (pymysql.err.OperationalError, pymysql.err.InterfaceError) as e:
+                # 连接类错误：重连后只重试当前块
+                self.logger.log_warning(
+                    f"分块写入第{attempt + 1}次失败（{len(rows)}行）: {str(e)}，重连后重试")
+                try:
+                    self.reconnect()
+                except Exception:
+                    pass
+                if attempt < self.CHUNK_MAX_RETRIES - 1:
+                    sleep(self.CHUNK_RETRY_DELAY * (attempt + 1))
+                else:
+                    chunk_errors.append(str(e))
+                    return 0
+            except Exception as e:
+                # 数据类错误：二分定位出错的行
+                try:
+                    self.connection.rollback()
+                except Exception:
+                    pass
+                if len(rows) > 1:
+                    middle = len(rows) // 2
+                    return (self._execute_chunk(prefix, rows[:middle], suffix, chunk_errors)
+                            + self._execute_chunk(prefix, rows[middle:], suffix, chunk_errors))
+                # 单行数据错误：跳过该行（记录下标，由调用方作为警告汇报），不算写入失败
+                index, values = rows[0]
+                self.logger.log_warning(f"跳过无法写入的行: {str(e)}，数据: {values[:200]}")
+                self.skipped_rows.append(index)
+                return 0
+        return 0
+
     def get_last_error(self) -> Optional[str]:
         """获取最后一次错误信息"""
         return self.last_error
@@ -211,6 +540,106 @@ class DBOperator:
             return 0
 
 
+    def bulk_load(self, table_name: str, data_list: List[Tuple], fieldnames: List[str]) -> int:
+        """
+        使用 LOAD DATA LOCAL INFILE 批量导入数据（需连接参数 local_infile=True 且服务端允许）
+
+        Args:
+            table_name: 表名
+            data_list: 数据列表
+            fieldnames: 字段名列表
+
+        Returns:
+            导入的行数
+        """
+        def _escape(value: Any) -> str:
+            if value is None:
+                return '\\N'
+            if isinstance(value, bool):
+                return '1' if value else '0'
+            return (str(value).replace('\\', '\\\\').replace('\t', '\\t')
+                    .replace('\n', '\\n').replace('\r', '\\r'))
+
+        fd, file_path = tempfile.mkstemp(prefix=f'{table_name}_', suffix='.tsv')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8', newline='') as f:
+                for row in data_list:
+                    f.write('\t'.join(_escape(value) for value in row))
+                    f.write('\n')
+
+            quoted_fields = ', '.join(f"`{field}`" for field in fieldnames)
+            query = (
+                f"LOAD DATA LOCAL INFILE %s INTO TABLE {table_name} CHARACTER SET utf8mb4 "
+                f"FIELDS TERMINATED BY '\\t' ESCAPED BY '\\\\' LINES TERMINATED BY '\\n' ({quoted_fields})"
+            )
+            with self.connection.cursor() as cursor:
+                affected = cursor.execute(query, (file_path,))
+            self.connection.commit()
+            return affected
+        finally:
+            os.remove(file_path)
+
+    def replace_table(self, table_name: str, data_list: List[Tuple], fieldnames: List[str]) -> int:
+        """
+        用影子表整体替换表数据：数据先导入 {table}__staging，再通过 RENAME TABLE 原子切换，
+        读取方不会看到空表或只写了一半的表
+
+        Args:
+            table_name: 表名
+            data_list: 数据列表
+            fieldnames: 字段名列表
+
+        Returns:
+            写入的行数
+        """
+        staging_table = f"{table_name}__staging"
+        old_table = f"{table_name}__old"
+        self.last_error = None
+        self.skipped_rows = []
+
+        try:
+            with self.connection.cursor() as cursor:
+                cursor.execute(f"DROP TABLE IF EXISTS {staging_table}")
+                cursor.execute(f"CREATE TABLE {staging_table} LIKE {table_name}")
+            self.connection.commit()
+
+            affected_rows = None
+            if self.db_config.get('local_infile'):
+                try:
+                    affected_rows = self.bulk_load(staging_table, data_list, fieldnames)
+                except Exception as e:
+                    self.logger.log_warning(f"{staging_table} 批量导入失败，改用分块插入: {str(e)}")
+                    with self.connection.cursor() as cursor:
+                        cursor.execute(f"TRUNCATE TABLE {staging_table}")
+
+            if affected_rows is None:
+                quoted_fields = [f"`{field}`" for field in fieldnames]
+                placeholders = ', '.join(['%s'] * len(fieldnames))
+                insert_query = f"INSERT INTO {staging_table} ({', '.join(quoted_fields)}) VALUES ({placeholders})"
+                affected_rows = self.execute_batched(insert_query, data_list)
+                if self.last_error:
+                    raise Exception(self.last_error)
+
+            # 原子切换
+            with self.connection.cursor() as cursor:
+                cursor.execute(f"DROP TABLE IF EXISTS {old_table}")
+                cursor.execute(f"RENAME TABLE {table_name} TO {old_table}, {staging_table} TO {table_name}")
+                cursor.execute(f"DROP TABLE {old_table}")
+            self.connection.commit()
+            self.last_error = None
+            return affected_rows
+        except Exception as e:
+            error_msg = f"表 {table_name} 整体替换失败: {str(e)}"
+            self.logger.log_error(error_msg)
+            try:
+                self.reconnect()
+                with self.connection.cursor() as cursor:
+                    cursor.execute(f"DROP TABLE IF EXISTS {staging_table}")
+            except Exception:
+                pass
+            self.last_error = error_msg
+            return 0
+
     def close(self) -> None:
         """关闭数据库连接"""
         if self.connection:
@@ -274,12 +703,43 @@ class DataSaver:
     # 需要全量更新的表列表（先删除后插入）
     FULL_UPDATE_TABLES = ['planned_vehicles', 'unsold_orders', 'inventory_vehicle_query', 'delete_log']
 
-    def __init__(self, db_operator: DBOperator):
+    # 全量表内容指纹在同步状态表中的键前缀
+    FINGERPRINT_PREFIX = 'fingerprint:'
+
+    def __init__(self, db_operator: DBOperator, state_store: Optional[SyncStateStore] = None,
+                 row_hash_store: Optional[RowHashStore] = None, metrics: Optional[SyncMetrics] = None,
+                 changelog: Optional[ChangeLogStore] = None):
         self.db_operator = db_operator
+        self.state_store = state_store
+        self.row_hash_store = row_hash_store
+        self.metrics = metrics
+        self.changelog = changelog
+        self.flatteners: Dict[str, CompiledFlattener] = {}
         self.table_schema: Dict[str, Dict[str, str]] = {}
+        self.encoder_plans: Dict[Tuple[str, Tuple[str, ...]], List[Callable[[List[Any]], List[Any]]]] = {}
         self.last_error: Optional[str] = None  # 记录最后一次错误信息
+        self.last_warning: Optional[str] = None  # 记录最后一次写入的警告（跳过的行）
         self.logger = WriteLog()
 
+    def flatten(self, api_name: str, data_list: List[Dict]) -> Tuple[List[Dict], List[str]]:
+        """
+        展平API数据，每个API首次保存时根据第一项生成专用展平函数并复用
+
+        Args:
+            api_name: API名称
+            data_list: 数据列表
+
+        Returns:
+            展平后的数据列表和所有字段名集合
+        """
+        flattener = self.flatteners.get(api_name)
+        if flattener is None:
+            sample = next((item for item in data_list if isinstance(item, dict)), None)
+            if sample is None:
+                return flatten_data(data_list)
+            flattener = self.flatteners[api_name] = CompiledFlattener(sample)
+        return flattener.flatten(data_list)
+
     def get_table_schema(self, table_name: str) -> Optional[Dict[str, str]]:
         """
         获取表结构信息
@@ -344,6 +804,87 @@ class DataSaver:
         # 其他类型转为字符串
         return str(value) if value is not None else None
 
+    @staticmethod
+    def compile_column_converter(field_type: str) -> Callable[[List[Any]], List[Any]]:
+        """
+        根据字段类型生成整列转换函数，结果与逐值调用 convert_value_based_on_type 一致，
+        类型判断只在生成时做一次
+
+        Args:
+            field_type: 字段类型
+
+        Returns:
+            列转换函数：输入一列原始值，返回一列转换后的值
+        """
+        convert_value = DataSaver.convert_value_based_on_type
+
+        if 'int' in field_type or 'decimal' in field_type or 'float' in field_type or 'double' in field_type:
+            cast = int if 'int' in field_type else float
+
+            def convert(column: List[Any]) -> List[Any]:
+                try:
+                    # 乐观路径：整列直接转换，遇到无法转换的值再逐值处理
+                    return [None if v is None or v == '' or v == 'null' else cast(v) for v in column]
+                except (ValueError, TypeError):
+                    return [convert_value(v, field_type) for v in column]
+        elif 'date' in field_type or 'time' in field_type:
+            # 日期时间类型保持原样，嵌套结构转为JSON字符串
+            def convert(column: List[Any]) -> List[Any]:
+                return [
+                    None if v is None or v == '' or v == 'null'
+                    else json.dumps(v, ensure_ascii=False) if isinstance(v, (dict, list)) else v
+                    for v in column
+                ]
+        else:
+            # 其他类型转为字符串
+            def convert(column: List[Any]) -> List[Any]:
+                return [
+                    None if v is None or v == '' or v == 'null' else v if v.__class__ is str else str(v)
+                    for v in column
+                ]
+        return convert
+
+    def get_row_encoder(self, table_name: str, valid_fields: List[str],
+                        table_schema: Dict[str, str]) -> List[Callable[[List[Any]], List[Any]]]:
+        """
+        获取表的列转换计划（按表和字段列表缓存，每种组合只生成一次）
+
+        Args:
+            table_name: 表名
+            valid_fields: 需要写入的字段列表
+            table_schema: 表结构信息
+
+        Returns:
+            与字段一一对应的列转换函数列表
+        """
+        plan_key = (table_name, tuple(valid_fields))
+        plan = self.encoder_plans.get(plan_key)
+        if plan is None:
+            plan = [self.compile_column_converter(table_schema.get(field, 'varchar(255)')) for field in valid_fields]
+            self.encoder_plans[plan_key] = plan
+        return plan
+
+    def encode_rows(self, table_name: str, data_list: List[Dict], valid_fields: List[str],
+                    table_schema: Dict[str, str]) -> List[Tuple]:
+        """
+        按列批量转换整页数据，生成可直接绑定的参数元组
+
+        Args:
+            table_name: 表名
+            data_list: 展平后的数据列表
+            valid_fields: 需要写入的字段列表
+            table_schema: 表结构信息
+
+        Returns:
+            参数元组列表，顺序与 valid_fields 一致
+        """
+        plan = self.get_row_encoder(table_name, valid_fields, table_schema)
+        columns = [
+            convert(list(map(methodcaller('get', field), data_list)))
+            for field, convert in zip(valid_fields, plan)
+        ]
+        return list(zip(*columns))
+
     def build_upsert_query(self, table_name: str, data_list: List[Dict],fieldnames: List[str], table_schema: Dict[str, str]) -> Tuple[Optional[str], Optional[List[Tuple]]]:
         """
         构建UPSERT查询语句
@@ -389,19 +930,7 @@ class DataSaver:
 
         query = f"{insert_clause} ON DUPLICATE KEY UPDATE {update_clause}"
 
-        params_list = []
-        for item in data_list:
-            params = []
-            for field in valid_fields:
-                value = item.get(field)
-                field_type = table_schema.get(field, 'varchar(255)')
-                converted_value = self.convert_value_based_on_type(value, field_type)
-
-                if isinstance(converted_value, (dict, list)):
-                    converted_value = json.dumps(converted_value, ensure_ascii=False)
-
-                params.append(converted_value)
-            params_list.append(tuple(params))
+        params_list = self.encode_rows(table_name, data_list, valid_fields, table_schema)
 
         return query, params_list
 
@@ -409,9 +938,72 @@ class DataSaver:
         """获取最后一次错误信息"""
         return self.last_error
 
+    def get_last_warning(self) -> Optional[str]:
+        """获取最后一次写入的警告信息"""
+        return self.last_warning
+
+    def note_skipped_rows(self, api_name: str) -> None:
+        """把数据库写入时因数据错误跳过的行记为警告"""
+        skipped_rows = self.db_operator.skipped_rows
+        if skipped_rows:
+            self.last_warning = f"{api_name} 跳过 {len(skipped_rows)} 行无法写入的数据"
+            self.logger.log_warning(self.last_warning)
+
+    @staticmethod
+    def compute_fingerprint(fieldnames: List[str], params_list: List[Tuple]) -> str:
+        """
+        计算整表快照的内容指纹（与行顺序无关）
+
+        Args:
+            fieldnames: 字段名列表
+            params_list: 转换后的参数列表
+
+        Returns:
+            十六进制指纹字符串
+        """
+        digest = hashlib.sha256('|'.join(fieldnames).encode('utf-8'))
+        for row_digest in sorted(hashlib.md5(repr(row).encode('utf-8')).digest() for row in params_list):
+            digest.update(row_digest)
+        return digest.hexdigest()
+
+    def replace_snapshot(self, api_name: str, table_name: str, params_list: List[Tuple],
+                         fieldnames: List[str]) -> int:
+        """
+        用新快照整体替换表数据；内容指纹与上次一致且表行数未变时跳过写入
+
+        Args:
+            api_name: API名称
+            table_name: 表名
+            params_list: 转换后的参数列表
+            fieldnames: 字段名列表
+
+        Returns:
+            写入的行数，跳过时为0
+        """
+        fingerprint = f"{self.compute_fingerprint(fieldnames, params_list)}:{len(params_list)}"
+        fingerprint_key = f"{self.FINGERPRINT_PREFIX}{table_name}"
+
+        if self.state_store is not None and self.state_store.get(fingerprint_key) == fingerprint:
+            count_result = self.db_operator.execute_query(f"SELECT COUNT(*) FROM {table_name}")
+            if count_result and count_result[0][0] == len(params_list):
+                self.logger.log_info(f"{api_name} 数据与上次一致，跳过全量更新")
+                return 0
+
+        affected_rows = self.db_operator.replace_table(table_name, params_list, fieldnames)
+        if self.db_operator.get_last_error():
+            return 0
+
+        # 有跳过的行时不保存指纹，下次运行重新整体替换
+        if self.state_store is not None and not self.db_operator.skipped_rows:
+            self.state_store.set(fingerprint_key, fingerprint)
+        # 快照表整表替换，下游按整表重新读取
+        if self.changelog is not None:
+            self.changelog.append(table_name, [('', ChangeLogStore.OP_REPLACE)])
+        return affected_rows
+
     def save_full_update_data(self, api_name: str, data_list: List[Dict]) -> int:
         """
-        全量更新数据到数据库（先删除所有数据，再插入新数据）
+        全量更新数据到数据库（写入影子表后原子切换，内容未变化时跳过）
 
         Args:
             api_name: API名称
@@ -441,27 +1033,27 @@ class DataSaver:
             return 0
 
         try:
-            flattened_data, fieldnames = flatten_data(data_list)
+            encode_started = monotonic()
+            flattened_data, fieldnames = self.flatten(api_name, data_list)
 
             # 构建插入查询
             query, params_list = self.build_insert_query(table_name, flattened_data, fieldnames, table_schema)
+            if self.metrics:
+                self.metrics.observe_encode(api_name, monotonic() - encode_started)
 
             if not query or not params_list:
                 self.last_error = f"无法构建SQL查询，无法保存 {api_name} 数据"
                 return 0
 
-            # 先删除表中所有数据
-            delete_query = f"DELETE FROM {table_name}"
-            delete_count = self.db_operator.execute_query(delete_query)
-            self.logger.log_info(f"{api_name} 已清空表数据")
-
-            # 执行批量插入
-            affected_rows = self.db_operator.execute_many(query, params_list)
+            # 写入影子表并原子切换
+            valid_fields = [field for field in fieldnames if field in table_schema]
+            affected_rows = self.replace_snapshot(api_name, table_name, params_list, valid_fields)
 
             # 检查是否有数据库错误
             if self.db_operator.get_last_error():
                 self.last_error = self.db_operator.get_last_error()
                 return 0
+            self.note_skipped_rows(api_name)
 
             self.logger.log_info(f"{api_name} 全量更新完成，插入 {affected_rows} 行数据")
             return affected_rows
@@ -498,19 +1090,7 @@ class DataSaver:
         placeholders = ', '.join(['%s'] * len(valid_fields))
         query = f"INSERT INTO {table_name} ({', '.join(quoted_fields)}) VALUES ({placeholders})"
 
-        params_list = []
-        for item in data_list:
-            params = []
-            for field in valid_fields:
-                value = item.get(field)
-                field_type = table_schema.get(field, 'varchar(255)')
-                converted_value = self.convert_value_based_on_type(value, field_type)
-
-                if isinstance(converted_value, (dict, list)):
-                    converted_value = json.dumps(converted_value, ensure_ascii=False)
-
-                params.append(converted_value)
-            params_list.append(tuple(params))
+        params_list = self.encode_rows(table_name, data_list, valid_fields, table_schema)
 
         return query, params_list
 
@@ -587,7 +1167,7 @@ class DataSaver:
 
         try:
             # 展平数据
-            flattened_data, fieldnames = flatten_data(processed_data)
+            flattened_data, fieldnames = self.flatten(api_name, processed_data)
 
             # 确保必须的字段存在，如果没有则添加默认值
             required_fields = ['Title', 'Type', 'IPAddress', 'Contents', 'WriteTime', 'UserName']
@@ -652,15 +1232,14 @@ class DataSaver:
                     params.append(converted_value)
                 params_list.append(tuple(params))
 
-            # 执行没有主键的批量插入（先清空再插入）
-            affected_rows = self.db_operator.execute_without_primary_key(
-                table_name, params_list, valid_fields
-            )
+            # 执行没有主键的全量替换（写入影子表后原子切换）
+            affected_rows = self.replace_snapshot(api_name, table_name, params_list, valid_fields)
 
             # 检查是否有数据库错误
             if self.db_operator.get_last_error():
                 self.last_error = self.db_operator.get_last_error()
                 return 0
+            self.note_skipped_rows(api_name)
 
             print(f"{api_name} 数据保存完成，影响 {affected_rows} 行")
             return affected_rows
@@ -671,6 +1250,53 @@ class DataSaver:
             self.last_error = error_msg
             return 0
 
+    def filter_changed_rows(self, table_name: str, params_list: List[Tuple], fieldnames: List[str],
+                            primary_key: str) -> Tuple[List[Tuple], List[Tuple[str, str]], List[Tuple[str, str]]]:
+        """
+        按主键比对行哈希，筛出新增或内容有变化的行
+
+        同一页中主键重复的行、主键为空的行总是写入；哈希表查询失败时全部写入。
+
+        Args:
+            table_name: 表名
+            params_list: 转换后的参数列表
+            fieldnames: 与参数顺序一致的字段名列表
+            primary_key: 主键字段名
+
+        Returns:
+            需要写入的参数列表、写入成功后要保存的 (主键值, 哈希) 列表，
+            以及要记入变更日志的 (主键值, 操作类型) 列表（无法判断是否新增时记为更新）
+        """
+        if primary_key not in fieldnames:
+            return params_list, [], []
+
+        pk_index = fieldnames.index(primary_key)
+        if self.row_hash_store is None:
+            pk_values = dict.fromkeys(str(row[pk_index]) for row in params_list if row[pk_index] is not None)
+            return params_list, [], [(pk, ChangeLogStore.OP_UPDATE) for pk in pk_values]
+
+        row_hashes = [
+            (None if row[pk_index] is None else str(row[pk_index]), self.row_hash_store.row_hash(fieldnames, row))
+            for row in params_list
+        ]
+        stored = self.row_hash_store.get_hashes(table_name, [pk for pk, _ in row_hashes if pk is not None])
+        if stored is None:
+            changed_hashes = [(pk, row_hash) for pk, row_hash in row_hashes if pk is not None]
+            changes = [(pk, ChangeLogStore.OP_UPDATE) for pk in dict.fromkeys(pk for pk, _ in changed_hashes)]
+            return params_list, changed_hashes, changes
+
+        pk_counts = Counter(pk for pk, _ in row_hashes)
+        changed_params = []
+        changed_hashes = []
+        changes: Dict[str, str] = {}
+        for row, (pk, row_hash) in zip(params_list, row_hashes):
+            if pk is None or pk_counts[pk] > 1 or stored.get(pk) != row_hash:
+                changed_params.append(row)
+                if pk is not None:
+                    changed_hashes.append((pk, row_hash))
+                    changes.setdefault(pk, ChangeLogStore.OP_UPDATE if pk in stored else ChangeLogStore.OP_INSERT)
+        return changed_params, changed_hashes, list(changes.items())
+
     def save_data(self, api_name: str, data_list: List[Dict]) -> int:
         """
         保存数据到数据库
@@ -680,9 +1306,11 @@ class DataSaver:
             data_list: 数据列表
 
         Returns:
-            影响的行数
+            影响的行数（跳过个别无法写入的行时仍返回已提交的行数，跳过情况记入 last_warning）
         """
         self.last_error = None
+        self.last_warning = None
+        self.db_operator.skipped_rows = []
 
         if not data_list:
             msg = f"{api_name} 无数据可保存"
@@ -712,22 +1340,49 @@ class DataSaver:
             return 0
 
         try:
-            flattened_data, fieldnames = flatten_data(data_list)
+            encode_started = monotonic()
+            flattened_data, fieldnames = self.flatten(api_name, data_list)
             query, params_list = self.build_upsert_query(table_name, flattened_data, fieldnames, table_schema)
+            if self.metrics:
+                self.metrics.observe_encode(api_name, monotonic() - encode_started)
 
             if not query or not params_list:
                 self.last_error = f"无法构建SQL查询，无法保存 {api_name} 数据"
                 return 0
 
-            affected_rows = self.db_operator.execute_many(query, params_list)
+            # 与已保存的行哈希比对，只写入新增或有变化的行
+            valid_fields = [field for field in fieldnames if field in table_schema]
+            changed_params, changed_hashes, changes = self.filter_changed_rows(
+                table_name, params_list, valid_fields, self.TABLE_PRIMARY_KEYS[table_name]
+            )
+            if not changed_params:
+                self.logger.log_info(f"{api_name} {len(params_list)} 行数据均未变化，跳过写入")
+                return 0
+
+            affected_rows = self.db_operator.execute_batched(query, changed_params)
 
             # 检查是否有数据库错误
             if self.db_operator.get_last_error():
                 self.last_error = self.db_operator.get_last_error()
                 return 0
 
+            # 跳过的行不记录哈希和变更，下次会重新写入
+            if self.db_operator.skipped_rows:
+                self.note_skipped_rows(api_name)
+                pk_index = valid_fields.index(self.TABLE_PRIMARY_KEYS[table_name])
+                skipped_pks = {str(changed_params[index][pk_index]) for index in self.db_operator.skipped_rows}
+                changed_hashes = [(pk, row_hash) for pk, row_hash in changed_hashes if pk not in skipped_pks]
+                changes = [(pk, op) for pk, op in changes if pk not in skipped_pks]
+
+            # 写库成功后再记录哈希，写入失败的行下次会重新写入
+            if changed_hashes:
+                self.row_hash_store.set_hashes(table_name, changed_hashes)
+            if self.changelog is not None and changes:
+                self.changelog.append(table_name, changes)
+
             # 将数据保存完成的信息写入日志
-            self.logger.log_info(f"{api_name} 数据保存完成，影响 {affected_rows} 行")
+            skipped = len(params_list) - len(changed_params)
+            self.logger.log_info(f"{api_name} 数据保存完成，写入 {len(changed_params)} 行（跳过未变化 {skipped} 行），影响 {affected_rows} 行")
             return affected_rows
         except Exception as e:
             error_msg = f"{api_name} 数据处理失败: {str(e)}"
@@ -736,33 +1391,216 @@ class DataSaver:
             return 0
 
 
+class WriterPool:
+    """
+    写库线程池
+
+    每个写库线程持有独立的数据库连接和 DataSaver，每次写入前检查连接健康状态；
+    同一张表的写入固定路由到同一个线程按提交顺序执行，不同表的写入并行进行。
+    在途写入任务数达到上限时 submit 阻塞，背压传递给请求端。
+    示例：
+    pool = WriterPool(Config.DB_CONFIG, size=4)
+    future = pool.submit('mortgage_business', lambda saver: saver.save_data('按揭业务', data_list))
+    future.result()
+    pool.close()
+    """
+
+    def __init__(self, db_config: Dict[str, Any], size: int = 4, metrics: Optional[SyncMetrics] = None,
+                 max_pending: Optional[int] = None, changelog_run_id: Optional[str] = None):
+        """
+        Args:
+            db_config: 数据库连接配置
+            size: 写库线程数（即连接数）
+            metrics: 运行指标收集对象
+            max_pending: 在途写入任务数上限，默认为线程数的2倍
+            changelog_run_id: 变更日志中的运行ID，为None时不记录变更日志
+        """
+        self.logger = WriteLog()
+        self.writers: List[Tuple[ThreadPoolExecutor, DataSaver]] = []
+        self.routes: Dict[str, int] = {}
+        self.route_lock = threading.Lock()
+        self.pending = threading.BoundedSemaphore(max_pending or size * 2)
+        try:
+            for index in range(size):
+                db_operator = DBOperator(db_config)
+                changelog = ChangeLogStore(db_operator, changelog_run_id) if changelog_run_id else None
+                data_saver = DataSaver(db_operator, SyncStateStore(db_operator), RowHashStore(db_operator), metrics,
+                                       changelog)
+                executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"CYY_Writer{index}")
+                self.writers.append((executor, data_saver))
+        except Exception:
+            self.close()
+            raise
+        self.logger.log_info(f"写库线程池已启动，共 {size} 个连接")
+
+    def route(self, table_name: str) -> int:
+        """表到写库线程的映射（按首次出现的顺序轮流分配，之后固定不变）"""
+        with self.route_lock:
+            if table_name not in self.routes:
+                self.routes[table_name] = len(self.routes) % len(self.writers)
+            return self.routes[table_name]
+
+    def submit(self, table_name: str, func: Callable[..., Any], *args: Any) -> Future:
+        """
+        提交写库任务
+
+        Args:
+            table_name: 目标表名（决定由哪个写库线程执行）
+            func: 写库函数，第一个参数为该线程的 DataSaver
+            *args: 写库函数的其他参数
+
+        Returns:
+            写库任务的 Future
+        """
+        executor, data_saver = self.writers[self.route(table_name)]
+        self.pending.acquire()
+        try:
+            future = executor.submit(self._run, data_saver, func, args)
+        except Exception:
+            self.pending.release()
+            raise
+        future.add_done_callback(lambda _: self.pending.release())
+        return future
+
+    @staticmethod
+    def _run(data_saver: DataSaver, func: Callable[..., Any], args: Tuple) -> Any:
+        data_saver.db_operator.ensure_connection()
+        return func(data_saver, *args)
+
+    def close(self) -> None:
+        """等待在途写入完成并关闭所有连接"""
+        for executor, data_saver in self.writers:
+            executor.shutdown(wait=True)
+            data_saver.db_operator.close()
+        self.writers = []
+
+
 class DataSyncManager:
     """数据同步管理器"""
 
-    def __init__(self, time_option: int = 2):
+    # 增量同步只对滚动时间窗口（当日、当月）生效
+    INCREMENTAL_TIME_OPTIONS = (1, 2)
+    # 接口时间参数可能使用的日期格式
+    TIME_PARAM_FORMATS = ('%Y/%m/%d', '%Y-%m-%d', '%Y/%m/%d %H:%M:%S', '%Y-%m-%d %H:%M:%S')
+    WATERMARK_FORMAT = '%Y-%m-%d %H:%M:%S'
+    # 所有线程共享的请求限流（每秒请求数、突发容量）
+    REQUEST_RATE = 1.0
+    REQUEST_BURST = 3
+    # 单个API并发请求分页（或时间子窗口）的线程数
+    PAGE_WORKERS = 4
+    # 大时间窗口拆分：当月、全部数据的API总页数超过 PARTITION_MIN_PAGES 时，按周或按日拆分为子窗口并行请求，
+    # 子窗口预计页数不超过 PARTITION_TARGET_PAGES 时按周拆分，否则按日拆分
+    PARTITION_TIME_OPTIONS = (2, 3)
+    PARTITION_MIN_PAGES = 10
+    PARTITION_TARGET_PAGES = 5
+    # 合并请求：同一接口只有一个筛选参数不同的API合并为一次请求（该参数置空），按记录中的同名字段分发到各表；
+    # 以下参数不参与合并（分页、令牌、时间窗口，以及决定按哪个日期字段筛选的参数，置空后不是各API的并集）
+    COALESCE_EXCLUDED_PARAMS = ('PageNumber', 'PageSize', 'Token', 'beginTime', 'endTime', 'BeginTime', 'EndTime',
+                                'TimeType', 'timetype', 'DateType')
+    # 请求线程与写库线程之间的页队列长度（背压）
+    PIPELINE_QUEUE_SIZE = 4
+    # 写库线程数（每个线程一个独立连接，不同表并行写入；0表示在主线程用单连接写库）
+    WRITER_POOL_SIZE = 4
+    # 自适应分页大小在同步状态表中的键前缀
+    PAGE_SIZE_PREFIX = 'page_size:'
+    # 运行指标（JSON报告和 Prometheus textfile）输出目录、运行名称和JSON报告保留天数
+    METRICS_DIR = r"E:\powerbi_data\data\cyy_metrics"
+    METRICS_RUN_NAME = 'cyy_to_mysql_99'
+    METRICS_RETENTION_DAYS = 30
+    # 原始响应落地区（本地压缩NDJSON，可离线回放重建表）目录和保留天数
+    LANDING_ENABLED = True
+    LANDING_DIR = r"E:\powerbi_data\data\cyy_landing"
+    LANDING_RETENTION_DAYS = 60
+    # 变更日志（sync_changelog 表，供下游按变更增量处理）开关和保留天数
+    CHANGELOG_ENABLED = True
+    CHANGELOG_RETENTION_DAYS = 14
+    # 按变化频率轮询（仅当日增量同步）：基础间隔为调度周期，最长间隔为各API的最低新鲜度（分钟）
+    POLLING_TIME_OPTIONS = (1,)
+    POLL_BASE_MINUTES = 30
+    POLL_MAX_STALENESS_MINUTES = 120
+
+    def __init__(self, time_option: int = 2, incremental: bool = True,
+                 db_config: Optional[Dict[str, Any]] = None, polling: bool = True):
         """
         初始化数据同步管理器
 
         Args:
             time_option: 时间选项 1-当日 2-当月 3-全部数据
+            incremental: 是否启用基于水位线的增量同步（仅当日、当月有效）
+            db_config: 数据库连接配置，默认使用 Config.DB_CONFIG
+            polling: 是否按变化频率跳过未到期的API（仅当日增量同步有效，跳过的API下次从水位线继续）
         """
         self.logger = WriteLog()
         self.requester = RequestFunction()
+        self.rate_limiter = TokenBucket(self.REQUEST_RATE, self.REQUEST_BURST)
+        self.controller = AdaptiveController(self.rate_limiter, concurrency=self.PAGE_WORKERS)
+        self.retry_policy = RetryPolicy()
+        # 令牌缓存在本地文件中，各同步脚本共用，过期前自动刷新
+        self.token_cache = TokenCache(self.fetch_token, cache_key=f"{self.api_base_url()}|{DataCenter.USER}")
         self.token = self.get_token()
         self.time_option = time_option
+        self.incremental = incremental and time_option in self.INCREMENTAL_TIME_OPTIONS
+        self.run_started = datetime.now()
+        self.run_id = f"{self.run_started.strftime('%H%M%S')}_{os.getpid()}"
+        self.watermarks: Dict[str, str] = {}
+        self.landing_zone = LandingZone(self.LANDING_DIR) if self.LANDING_ENABLED else None
 
         # 初始化数据库连接
-        self.db_operator = DBOperator(Config.DB_CONFIG)
-        self.data_saver = DataSaver(self.db_operator)
+        self.db_operator = DBOperator(db_config or Config.DB_CONFIG)
+        self.state_store = SyncStateStore(self.db_operator)
+        self.row_hash_store = RowHashStore(self.db_operator)
+        self.metrics = SyncMetrics(self.METRICS_RUN_NAME)
+        # 变更日志的运行ID带上日期，跨天不重复
+        self.changelog_run_id = f"{self.run_started.strftime('%Y%m%d')}_{self.run_id}" if self.CHANGELOG_ENABLED else None
+        self.changelog = ChangeLogStore(self.db_operator, self.changelog_run_id) if self.changelog_run_id else None
+        self.data_saver = DataSaver(self.db_operator, self.state_store, self.row_hash_store, self.metrics,
+                                    self.changelog)
+        self.polling_policy = None
+        if polling and self.incremental and time_option in self.POLLING_TIME_OPTIONS:
+            self.polling_policy = PollingPolicy(self.state_store, self.POLL_BASE_MINUTES,
+                                                self.POLL_MAX_STALENESS_MINUTES)
 
         # 初始化WebDAV客户端
         self.client = Client(Config.WEBDAV_CONFIG)
 
+    def api_base_url(self) -> str:
+        """API服务地址"""
+        return Config.API_BASE_URL
+
+    def get_apis(self) -> Dict[str, Dict[str, Any]]:
+        """获取本次同步的API配置"""
+        return DataCenter.get_apis_99(self.time_option)
+
+    def select_due_apis(self, apis: Dict[str, Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+        """
+        按轮询策略筛选本周期需要同步的API（未启用轮询策略时返回全部API）
+
+        Returns:
+            需要同步的API配置
+        """
+        if self.polling_policy is None:
+            return apis
+        due_names = set(self.polling_policy.due(list(apis), self.run_started))
+        skipped = [task_name for task_name in apis if task_name not in due_names]
+        if skipped:
+            self.logger.log_info(f"本周期跳过 {len(skipped)} 个变化较少的API: {', '.join(skipped)}")
+        return {task_name: api_config for task_name, api_config in apis.items() if task_name in due_names}
+
+    def record_poll(self, task_name: str, affected: int) -> None:
+        """记录一次成功同步的结果，供轮询策略学习变化频率（回放时不记录）"""
+        if self.polling_policy is None or not self.incremental:
+            return
+        self.polling_policy.observe(task_name, affected > 0, self.run_started)
+
     def get_token(self) -> str:
-        """获取API访问令牌"""
+        """获取API访问令牌（优先使用缓存，临近过期时自动刷新）"""
+        return self.token_cache.get()
+
+    def fetch_token(self) -> str:
+        """请求新的API访问令牌"""
         try:
             response = self.requester.request(
-                url=f'{Config.API_BASE_URL}/api/Values/GetToken',
+                url=f'{self.api_base_url()}/api/Values/GetToken',
                 method='GET',
                 params={"Account": DataCenter.USER, "PassWord": DataCenter.PWD},
             )
@@ -772,186 +1610,851 @@ class DataSyncManager:
             self.logger.log_error(error_msg)
             raise Exception(error_msg)
 
-    def fetch_single_api(self, task_name: str, api_config: Dict[str, Any]) -> Dict[str, List[Dict]]:
+    def parse_time_param(self, value: Any) -> Tuple[Optional[datetime], Optional[str]]:
+        """
+        解析接口的时间参数
+
+        Returns:
+            解析后的时间和所用格式，无法解析时返回(None, None)
+        """
+        for fmt in self.TIME_PARAM_FORMATS:
+            try:
+                return datetime.strptime(str(value), fmt), fmt
+            except (ValueError, TypeError):
+                continue
+        return None, None
+
+    def load_watermarks(self) -> Dict[str, str]:
+        """从同步状态表加载各API的水位线"""
+        if not self.incremental:
+            return {}
+        watermarks = self.state_store.get_all(SyncStateStore.WATERMARK_PREFIX)
+        self.logger.log_info(f"已加载 {len(watermarks)} 个API的同步水位线")
+        return watermarks
+
+    def apply_watermark(self, task_name: str, payload: Dict[str, Any]) -> Dict[str, Any]:
         """
-        处理单个API的所有分页请求
+        根据水位线调整请求的时间窗口
+
+        水位线早于配置的 beginTime 时（轮询策略跳过了跨天的周期，或上次同步失败），把 beginTime 放宽到
+        水位线所在日期，补上两次成功同步之间的数据。
+        接口没有按修改时间筛选的参数，beginTime/endTime 是业务日期筛选，不按水位线收窄
+        （会漏掉业务日期较早但之后被修改的行），未变化的行由行哈希在写库前跳过。
 
         Args:
             task_name: 任务名称
-            api_config: API配置
+            payload: 请求参数（会被就地修改）
 
         Returns:
-            包含所有数据的字典
+            修改后的请求参数
         """
-        url = api_config['url']
-        method = api_config['method']
-        payload = copy.deepcopy(api_config.get('payload', {}))
+        table_name = DataSaver.API_TABLE_MAPPING.get(task_name)
+        if not self.incremental or table_name in DataSaver.FULL_UPDATE_TABLES:
+            return payload
 
-        all_data = []
-        page_number = payload.get('PageNumber', 1)
-        page_size = payload.get('PageSize', Config.PAGE_SIZE)
+        watermark = self.watermarks.get(task_name)
+        if not watermark:
+            return payload
 
         try:
-            while True:
-                if 'PageNumber' in payload:
-                    payload['PageNumber'] = page_number
-
-                kwargs = {}
-                if method.upper() == 'GET':
-                    kwargs['params'] = payload
-                else:
-                    kwargs['json_data'] = payload
+            watermark_time = datetime.strptime(watermark, self.WATERMARK_FORMAT)
+        except ValueError:
+            self.logger.log_warning(f"{task_name} 水位线格式无效: {watermark}，按完整时间窗口请求")
+            return payload
+
+        begin_time, begin_format = self.parse_time_param(payload.get('beginTime'))
+        watermark_day = watermark_time.replace(hour=0, minute=0, second=0, microsecond=0)
+        if begin_time and watermark_day < begin_time:
+            payload['beginTime'] = watermark_day.strftime(begin_format)
+            self.logger.log_info(f"{task_name} 上次同步早于本次时间窗口: 起始时间 {begin_time.strftime(begin_format)} -> {payload['beginTime']}")
+        return payload
+
+    def advance_watermark(self, task_name: str, api_config: Dict[str, Any]) -> None:
+        """数据提交成功后推进API水位线（水位线为本次同步的开始时间）"""
+        table_name = DataSaver.API_TABLE_MAPPING.get(task_name)
+        if not self.incremental or table_name in DataSaver.FULL_UPDATE_TABLES:
+            return
+        if 'beginTime' not in api_config.get('payload', {}):
+            return
+
+        watermark = self.run_started.strftime(self.WATERMARK_FORMAT)
+        if self.state_store.set(SyncStateStore.watermark_key(task_name), watermark):
+            self.watermarks[task_name] = watermark
+
+    def request_page(self, task_name: str, url: str, method: str, payload: Dict[str, Any],
+                     page_number: int, landing: Optional[LandingStream] = None) -> Tuple[List[Dict], Optional[int]]:
+        """
+        请求单页数据（带重试），请求前从共享限流器获取令牌
 
-                payload['Token'] = self.token
+        Args:
+            task_name: 任务名称
+            url: 请求地址
+            method: 请求方法
+            payload: 请求参数（不会被修改）
+            page_number: 页码
+            landing: 落地文件，不为None时写入本页原始响应
 
-                # 添加重试机制
-                max_retries = 3
-                retry_delay = 5  # 秒
-                response = None
-                last_exception = None
+        Returns:
+            当前页数据列表和接口返回的总条数（未返回总条数时为None）
+        """
+        page_payload = dict(payload)
+        if 'PageNumber' in page_payload:
+            page_payload['PageNumber'] = page_number
 
-                for attempt in range(max_retries):
-                    self.logger.log_info(f"{task_name} 第{page_number}页 - 重试第{attempt + 1}次")
-                    try:
+        kwargs = {}
+        if method.upper() == 'GET':
+            kwargs['params'] = page_payload
+        else:
+            kwargs['json_data'] = page_payload
+
+        # 重试由本次运行共享的重试策略控制（指数退避加抖动、重试预算、按API熔断）
+        response = None
+        last_exception = None
+        attempt = 0
+
+        while True:
+            self.logger.log_info(f"{task_name} 第{page_number}页 - 第{attempt + 1}次请求")
+            # 熔断时直接抛出 CircuitOpenError，不再占用并发名额
+            self.retry_policy.before_attempt(task_name)
+            response = None
+            try:
+                page_payload['Token'] = self.get_token()
+                # 并发名额和请求速率由自适应控制器根据上游表现调整
+                with self.controller.slot():
+                    self.metrics.observe_throttle_wait(task_name, self.rate_limiter.acquire())
+                    started = monotonic()
+                    response = self.requester.request(
+                        url=url,
+                        method=method,
+                        **kwargs
+                    )
+
+                    # 令牌失效时刷新令牌并立即重发一次
+                    if is_auth_error(response):
+                        self.logger.log_warning(f"{task_name} 第{page_number}页令牌失效，刷新令牌后重试")
+                        self.metrics.observe_request(task_name, monotonic() - started, success=False)
+                        page_payload['Token'] = self.token_cache.invalidate(page_payload['Token'])
+                        self.metrics.observe_throttle_wait(task_name, self.rate_limiter.acquire())
+                        started = monotonic()
                         response = self.requester.request(
                             url=url,
                             method=method,
                             **kwargs
                         )
+                    latency = monotonic() - started
+                    self.metrics.observe_request(
+                        task_name, latency, response.get('content_length', 0) if isinstance(response, dict) else 0,
+                        success=isinstance(response, dict) and response.get('success', False))
+
+                # 检查响应结构
+                if not response or not isinstance(response, dict):
+                    raise KeyError(f"响应不是字典类型: {type(response)}")
+
+                if 'data' not in response:
+                    raise KeyError("响应中缺少 'data' 字段")
+
+                # 进一步检查 data 结构
+                validate_page_body(response['data'])
+
+                # 如果所有检查都通过，跳出重试循环
+                self.controller.on_success(latency)
+                self.retry_policy.record_success(task_name)
+                break
+
+            except KeyError as e:
+                # 专门处理数据结构错误
+                last_exception = e
+                self.controller.on_failure(throttled=is_throttled(response))
+                self.retry_policy.record_failure(task_name)
+                retry_delay = self.retry_policy.next_delay(task_name, attempt)
+                if retry_delay is not None:
+                    self.logger.log_warning(
+                        f"{task_name} 第{page_number}页第{attempt + 1}次请求数据结构错误: {str(e)}，{retry_delay:.1f}秒后重试")
+                    self.metrics.observe_retry(task_name, retry_delay)
+                    sleep(retry_delay)
+                else:
+                    raise Exception(
+                        f"{task_name} 第{page_number}页请求数据结构错误，已请求{attempt + 1}次: {str(e)}")
 
-                        # 检查响应结构
-                        if not response or not isinstance(response, dict):
-                            raise KeyError(f"响应不是字典类型: {type(response)}")
-
-                        if 'data' not in response:
-                            raise KeyError("响应中缺少 'data' 字段")
-
-                        # 进一步检查 data 结构
-                        page_data = response['data']
-                        if not page_data:
-                            raise KeyError("data 字段为空")
-
-                        # 检查嵌套的数据结构
-                        if 'Msg' in page_data:
-                            if 'Model' not in page_data['Msg']:
-                                raise KeyError("data.Msg 中缺少 'Model' 字段")
-                        else:
-                            if 'Data' not in page_data:
-                                raise KeyError("data 中缺少 'Data' 字段")
-
-                        # 如果所有检查都通过，跳出重试循环
-                        break
-
-                    except KeyError as e:
-                        # 专门处理数据结构错误
-                        last_exception = e
-                        if attempt < max_retries - 1:
-                            self.logger.log_warning(
-                                f"{task_name} 第{page_number}页第{attempt + 1}次请求数据结构错误: {str(e)}，{retry_delay}秒后重试")
-                            sleep(retry_delay)
-                        else:
-                            raise Exception(
-                                f"{task_name} 第{page_number}页请求数据结构错误，已重试{max_retries}次: {str(e)}")
-
-                    except Exception as e:
-                        last_exception = e
-                        if attempt < max_retries - 1:
-                            self.logger.log_warning(
-                                f"{task_name} 第{page_number}页第{attempt + 1}次请求失败: {str(e)}，{retry_delay}秒后重试")
-                            sleep(retry_delay)
-                        else:
-                            raise Exception(f"{task_name} 第{page_number}页请求失败，已重试{max_retries}次: {str(e)}")
-
-                # 如果经过重试后仍然没有有效响应，抛出异常
-                if not response or not isinstance(response, dict) or 'data' not in response:
-                    error_msg = f"{task_name} 第{page_number}页请求返回无效数据"
-                    if last_exception:
-                        error_msg += f"，最后一次错误: {str(last_exception)}"
-                    raise Exception(error_msg)
-
-                # 提取数据（这里应该不会再有KeyError，因为上面已经验证过数据结构）
-                page_data = response['data']
-                if 'Msg' in page_data:
-                    page_data = page_data['Msg']['Model']
+            except Exception as e:
+                last_exception = e
+                self.controller.on_failure(throttled=is_throttled(response))
+                self.retry_policy.record_failure(task_name)
+                retry_delay = self.retry_policy.next_delay(task_name, attempt)
+                if retry_delay is not None:
+                    self.logger.log_warning(
+                        f"{task_name} 第{page_number}页第{attempt + 1}次请求失败: {str(e)}，{retry_delay:.1f}秒后重试")
+                    self.metrics.observe_retry(task_name, retry_delay)
+                    sleep(retry_delay)
                 else:
-                    page_data = page_data['Data']
+                    raise Exception(f"{task_name} 第{page_number}页请求失败，已请求{attempt + 1}次: {str(e)}")
+            attempt += 1
+
+        # 如果经过重试后仍然没有有效响应，抛出异常
+        if not response or not isinstance(response, dict) or 'data' not in response:
+            error_msg = f"{task_name} 第{page_number}页请求返回无效数据"
+            if last_exception:
+                error_msg += f"，最后一次错误: {str(last_exception)}"
+            raise Exception(error_msg)
 
-                # 处理不同类型的数据结构
-                if isinstance(page_data, dict):
-                    page_data = page_data.get('list', page_data.get('items', []))
+        # 提取数据（这里应该不会再有KeyError，因为上面已经验证过数据结构）
+        body = response['data']
+        page_data = extract_page_items(body)
+        if not isinstance(page_data, list):
+            raise Exception(
+                f"{task_name} 第{page_number}页返回数据格式不正确，预期列表类型，实际得到: {type(page_data)}")
+
+        if landing is not None:
+            landing.write_page(page_number, body)
+        total = extract_total(body)
+        if 'PageSize' in payload:
+            self.controller.on_page(task_name, payload['PageSize'], len(page_data), latency, has_total=total is not None)
+        self.metrics.observe_page(task_name, len(page_data))
+        return page_data, total
+
+    def iter_pages(self, task_name: str, api_config: Dict[str, Any], land: bool = True) -> Iterator[List[Dict]]:
+        """
+        逐页产出单个API的数据
 
-                if not isinstance(page_data, list):
-                    raise Exception(
-                        f"{task_name} 第{page_number}页返回数据格式不正确，预期列表类型，实际得到: {type(page_data)}")
+        第一页返回总条数时，其余页并发请求（同时在途的页数不超过 PAGE_WORKERS，
+        消费端未取走的页不会继续请求）；否则按页码顺序翻页。
+        当月、全部数据的大窗口改为按日/周子窗口并行请求（见 plan_partitions），避免深分页。
+        所有请求共享同一个限流器，总请求速率不超过 REQUEST_RATE。
 
-                all_data.extend(page_data)
+        Args:
+            task_name: 任务名称
+            api_config: API配置
+            land: 是否把原始响应写入落地区
 
-                if should_fetch_next_page(page_data, page_size):
-                    page_number += 1
-                else:
-                    break
+        Yields:
+            每一页的数据列表（并发请求时不保证页码顺序）
+        """
+        url = api_config['url']
+        method = api_config['method']
+        payload = self.apply_watermark(task_name, copy.deepcopy(api_config.get('payload', {})))
 
-                # 添加随机延迟，避免请求过于频繁
-                sleep(random.uniform(*Config.REQUEST_DELAY))
+        page_number = payload.get('PageNumber', 1)
+        page_size = payload.get('PageSize', Config.PAGE_SIZE)
+        # 分页大小由自适应控制器在请求第一页前选定，翻页过程中不再改变
+        if 'PageSize' in payload:
+            page_size = payload['PageSize'] = self.controller.page_size_for(task_name, page_size)
 
+        landing = self.open_landing(task_name) if land else None
+        try:
+            page_data, total = self.request_page(task_name, url, method, payload, page_number, landing)
+            yield page_data
+
+            # 上游限制了分页大小（返回条数少于请求条数但总数更多）：按实际条数继续翻页
+            if 'PageSize' in payload and total and len(page_data) < min(page_size, total) and page_data:
+                self.logger.log_warning(f"{task_name} 分页大小上限为 {len(page_data)}，按该大小继续翻页")
+                self.controller.record_page_cap(task_name, len(page_data))
+                page_size = payload['PageSize'] = len(page_data)
+
+            # 大窗口按子窗口并行请求，子窗口已覆盖整个窗口，不再按页码翻页
+            windows = self.plan_partitions(task_name, payload, total, page_size)
+            if windows:
+                yield from self.iter_partitions(task_name, url, method, payload, windows, page_data, landing)
+                page_data = []
+
+            # 根据总条数并发请求剩余页
+            if total and 'PageNumber' in payload and should_fetch_next_page(page_data, page_size):
+                last_page = page_number + math.ceil(total / page_size) - 1
+                remaining_pages = list(range(page_number + 1, last_page + 1))
+                if remaining_pages:
+                    self.logger.log_info(f"{task_name} 共{total}条数据，并发请求剩余{len(remaining_pages)}页")
+                    pending_pages = iter(remaining_pages)
+                    with ThreadPoolExecutor(max_workers=self.PAGE_WORKERS) as page_executor:
+                        future_to_page = {}
+                        for page in islice(pending_pages, self.PAGE_WORKERS):
+                            future_to_page[page_executor.submit(
+                                self.request_page, task_name, url, method, payload, page, landing)] = page
+                        while future_to_page:
+                            done, _ = wait(future_to_page, return_when=FIRST_COMPLETED)
+                            for future in done:
+                                page = future_to_page.pop(future)
+                                current_data, _ = future.result()
+                                if page == last_page:
+                                    page_data = current_data
+                                yield current_data
+                                next_page = next(pending_pages, None)
+                                if next_page is not None:
+                                    future_to_page[page_executor.submit(
+                                        self.request_page, task_name, url, method, payload, next_page, landing)] = next_page
+                    page_number = last_page
+
+            # 未返回总条数，或翻页期间数据有新增时，继续顺序翻页
+            while 'PageNumber' in payload and should_fetch_next_page(page_data, page_size):
+                page_number += 1
+                page_data, _ = self.request_page(task_name, url, method, payload, page_number, landing)
+                yield page_data
+
+            # 所有页请求成功后才提交落地文件
+            if landing is not None:
+                landing.commit()
         except Exception as e:
             raise Exception(f"API请求过程出错: {str(e)}") from e
+        finally:
+            if landing is not None:
+                landing.abort()
+
+    def plan_partitions(self, task_name: str, payload: Dict[str, Any], total: Optional[int],
+                        page_size: int) -> List[Tuple[str, str]]:
+        """
+        规划大时间窗口的子窗口
+
+        只拆分当月、全部数据中总页数超过 PARTITION_MIN_PAGES、带 beginTime/endTime 且有主键（可去重）的API。
+        按平均每日条数估算，按周拆分时每个子窗口不超过 PARTITION_TARGET_PAGES 页则按周，否则按日。
+
+        Args:
+            task_name: 任务名称
+            payload: 请求参数
+            total: 整个窗口的总条数
+            page_size: 分页大小
+
+        Returns:
+            子窗口 (beginTime, endTime) 列表（格式与原参数相同），不需要拆分时返回空列表
+        """
+        table_name = DataSaver.API_TABLE_MAPPING.get(task_name)
+        if (self.time_option not in self.PARTITION_TIME_OPTIONS or 'PageNumber' not in payload
+                or not DataSaver.TABLE_PRIMARY_KEYS.get(table_name)
+                or not total or math.ceil(total / page_size) <= self.PARTITION_MIN_PAGES):
+            return []
+
+        begin_time, begin_format = self.parse_time_param(payload.get('beginTime'))
+        end_time, end_format = self.parse_time_param(payload.get('endTime'))
+        if not begin_time or not end_time or end_time <= begin_time:
+            return []
+
+        days = (end_time.date() - begin_time.date()).days + 1
+        weekly_pages = total / days * 7 / page_size
+        window_days = 7 if weekly_pages <= self.PARTITION_TARGET_PAGES else 1
+        # 结束时间精确到秒时子窗口结束于下个窗口开始前1秒，否则结束于前一天（接口日期参数含首尾）
+        end_step = timedelta(seconds=1) if '%H' in end_format else timedelta(days=1)
+
+        windows = []
+        window_begin = begin_time
+        while window_begin <= end_time:
+            next_begin = window_begin.replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=window_days)
+            window_end = min(end_time, next_begin - end_step)
+            windows.append((window_begin.strftime(begin_format), window_end.strftime(end_format)))
+            window_begin = next_begin
+        if len(windows) <= 1:
+            return []
+
+        self.logger.log_info(f"{task_name} 共{total}条数据，按{'周' if window_days == 7 else '日'}拆分为{len(windows)}个子窗口并行请求")
+        return windows
+
+    def fetch_partition(self, task_name: str, url: str, method: str, payload: Dict[str, Any],
+                        window: Tuple[str, str], landing: Optional[LandingStream] = None) -> List[Dict]:
+        """
+        按页码顺序请求单个子窗口的全部数据
+
+        Args:
+            window: 子窗口 (beginTime, endTime)
+
+        Returns:
+            子窗口的全部数据
+        """
+        window_payload = dict(payload)
+        window_payload['beginTime'], window_payload['endTime'] = window
+        page_number = window_payload.get('PageNumber', 1)
+        page_size = window_payload.get('PageSize', Config.PAGE_SIZE)
+
+        rows = []
+        while True:
+            page_data, _ = self.request_page(task_name, url, method, window_payload, page_number, landing)
+            rows.extend(page_data)
+            if not should_fetch_next_page(page_data, page_size):
+                return rows
+            page_number += 1
+
+    def iter_partitions(self, task_name: str, url: str, method: str, payload: Dict[str, Any],
+                        windows: List[Tuple[str, str]], first_page: List[Dict],
+                        landing: Optional[LandingStream] = None) -> Iterator[List[Dict]]:
+        """
+        并行请求各子窗口，按主键去重后逐批产出
+
+        子窗口边界上的数据和已产出的第一页数据可能重复返回，按 TABLE_PRIMARY_KEYS 中的主键去重。
+
+        Args:
+            windows: plan_partitions 返回的子窗口
+            first_page: 整个窗口已产出的第一页数据
+
+        Yields:
+            去重后的数据（每批不超过一页大小，不保证时间顺序）
+        """
+        primary_key = DataSaver.TABLE_PRIMARY_KEYS[DataSaver.API_TABLE_MAPPING[task_name]]
+        page_size = payload.get('PageSize', Config.PAGE_SIZE)
+        seen: Set[Any] = {item.get(primary_key) for item in first_page} - {None}
+        duplicates = 0
+
+        pending_windows = iter(windows)
+        with ThreadPoolExecutor(max_workers=self.PAGE_WORKERS) as partition_executor:
+            future_to_window = {}
+            for window in islice(pending_windows, self.PAGE_WORKERS):
+                future_to_window[partition_executor.submit(
+                    self.fetch_partition, task_name, url, method, payload, window, landing)] = window
+            while future_to_window:
+                done, _ = wait(future_to_window, return_when=FIRST_COMPLETED)
+                for future in done:
+                    future_to_window.pop(future)
+                    rows = []
+                    for item in future.result():
+                        key = item.get(primary_key)
+                        if key is not None:
+                            if key in seen:
+                                duplicates += 1
+                                continue
+                            seen.add(key)
+                        rows.append(item)
+                    for start in range(0, len(rows), page_size):
+                        yield rows[start:start + page_size]
+                    next_window = next(pending_windows, None)
+                    if next_window is not None:
+                        future_to_window[partition_executor.submit(
+                            self.fetch_partition, task_name, url, method, payload, next_window, landing)] = next_window
+
+        if duplicates:
+            self.logger.log_info(f"{task_name} 子窗口按 {primary_key} 去重 {duplicates} 条")
+
+    def open_landing(self, task_name: str) -> Optional[LandingStream]:
+        """打开本次运行该API的落地文件（未启用或打开失败时返回None，不影响同步）"""
+        if self.landing_zone is None:
+            return None
+        try:
+            return self.landing_zone.open_stream(task_name, self.run_id)
+        except Exception as e:
+            self.logger.log_warning(f"{task_name} 落地文件创建失败: {str(e)}")
+            return None
+
+    def fetch_single_api(self, task_name: str, api_config: Dict[str, Any]) -> Dict[str, List[Dict]]:
+        """
+        处理单个API的所有分页请求（一次性返回全部数据）
 
+        Args:
+            task_name: 任务名称
+            api_config: API配置
+
+        Returns:
+            包含所有数据的字典
+        """
+        all_data = []
+        for page_data in self.iter_pages(task_name, api_config):
+            all_data.extend(page_data)
         return {task_name: all_data}
 
-    def run_apis(self) -> Dict[str, List[Dict]]:
-        """使用线程池并发处理API请求"""
-        results = {}
-        apis = DataCenter.get_apis_99(self.time_option)
+    def produce_pages(self, task_name: str, api_config: Dict[str, Any], page_queue: queue.Queue) -> None:
+        """
+        生产者：把单个API的每一页放入有界队列，队列满时阻塞（背压）
+
+        队列元素为 (任务名, 页数据, 异常)：页数据为None表示该任务结束，异常不为None表示任务失败。
+        单页请求的重试由 retry_policy 统一控制，这里不再整体重试。
+
+        Args:
+            task_name: 任务名称
+            api_config: API配置
+            page_queue: 页数据队列
+        """
+        try:
+            for page_data in self.iter_pages(task_name, api_config):
+                page_queue.put((task_name, page_data, None))
+            page_queue.put((task_name, None, None))
+        except Exception as e:
+            page_queue.put((task_name, None, e))
+
+    def plan_coalesced_fetches(self, apis: Dict[str, Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+        """
+        找出可以合并请求的API
+
+        同一接口（地址和方法相同）、请求参数只有一个筛选参数不同且取值都不为空的API归为一组，
+        合并请求时该参数置空（接口约定空值表示不筛选），各API的水位线取最早的一个。
+
+        Args:
+            apis: 本次同步的API配置
+
+        Returns:
+            组名到合并请求配置的映射，配置包含 url、method、payload、param（筛选参数名）
+            和 members（各API名称到其筛选取值集合的映射）
+        """
+        candidates: Dict[Tuple, Dict[str, str]] = {}
+        for task_name, api_config in apis.items():
+            payload = api_config.get('payload', {})
+            if DataSaver.API_TABLE_MAPPING.get(task_name) == 'delete_log':
+                continue
+            for param, value in payload.items():
+                if param in self.COALESCE_EXCLUDED_PARAMS or value in ('', None):
+                    continue
+                rest = tuple(sorted((key, str(other)) for key, other in payload.items() if key != param))
+                signature = (api_config['url'], api_config['method'].upper(), param, rest)
+                candidates.setdefault(signature, {})[task_name] = str(value)
+
+        groups = {}
+        grouped: Set[str] = set()
+        for (url, method, param, _), members in candidates.items():
+            members = {task_name: value for task_name, value in members.items() if task_name not in grouped}
+            if len(members) < 2 or len(set(members.values())) < len(members):
+                continue
+
+            # 使用最早的水位线，保证合并请求覆盖每个API的增量窗口
+            member_payloads = [self.apply_watermark(task_name, copy.deepcopy(apis[task_name]['payload']))
+                               for task_name in members]
+            payload = min(member_payloads,
+                          key=lambda item: self.parse_time_param(item.get('beginTime'))[0] or datetime.min)
+            payload[param] = ''
+
+            group_name = '+'.join(members)
+            groups[group_name] = {
+                'url': url,
+                'method': apis[next(iter(members))]['method'],
+                'payload': payload,
+                'param': param,
+                'members': {task_name: set(value.split(',')) for task_name, value in members.items()},
+            }
+            grouped.update(members)
+            self.logger.log_info(f"合并请求 {group_name}（按 {param} 分发）")
+        return groups
+
+    @staticmethod
+    def find_route_field(item: Dict[str, Any], param: str) -> Optional[str]:
+        """在记录中查找与筛选参数同名（不区分大小写）的字段"""
+        if param in item:
+            return param
+        return next((key for key in item if key.lower() == param.lower()), None)
+
+    def produce_coalesced(self, group_name: str, group: Dict[str, Any], apis: Dict[str, Dict[str, Any]],
+                          page_queue: queue.Queue) -> None:
+        """
+        生产者：合并请求一组API，按筛选字段把每页记录分发到各API（队列元素格式同 produce_pages）
+
+        第一页为空或记录中没有筛选字段时无法分发，改为逐个API单独请求。
+        各API分得的数据以 {'Data': 记录} 的格式写入各自的落地文件，回放时与单独请求的API一致。
+        """
+        members: Dict[str, Set[str]] = group['members']
+        pages = self.iter_pages(group_name, group, land=False)
+        landings = {}
+        try:
+            first_page = next(pages, [])
+            route_field = self.find_route_field(first_page[0], group['param']) if first_page else None
+            if route_field is None:
+                pages.close()
+                self.logger.log_warning(f"{group_name} 合并请求无法按 {group['param']} 分发，改为单独请求")
+                for task_name in members:
+                    self.produce_pages(task_name, apis[task_name], page_queue)
+                return
+
+            landings = {task_name: self.open_landing(task_name) for task_name in members}
+            page_counts = {task_name: 0 for task_name in members}
+            unrouted = 0
+            for page_data in chain([first_page], pages):
+                routed: Dict[str, List[Dict]] = {task_name: [] for task_name in members}
+                for item in page_data:
+                    value = str(item.get(route_field))
+                    targets = [task_name for task_name, values in members.items() if value in values]
+                    for task_name in targets:
+                        routed[task_name].append(item)
+                    unrouted += not targets
+                for task_name, rows in routed.items():
+                    if not rows:
+                        continue
+                    page_counts[task_name] += 1
+                    if landings[task_name] is not None:
+                        landings[task_name].write_page(page_counts[task_name], {'Data': rows})
+                    page_queue.put((task_name, rows, None))
+
+            if unrouted:
+                self.logger.log_info(f"{group_name} 有 {unrouted} 条记录不属于任何API，已忽略")
+            for task_name in members:
+                if landings[task_name] is not None:
+                    landings[task_name].commit()
+                page_queue.put((task_name, None, None))
+        except Exception as e:
+            for task_name in members:
+                page_queue.put((task_name, None, e))
+        finally:
+            for landing in landings.values():
+                if landing is not None:
+                    landing.abort()
+
+    def run_apis(self) -> Dict[str, int]:
+        """
+        使用线程池并发请求API，主线程边接收边写库
+
+        工作线程逐页请求数据放入有界队列，主线程每收到一页就展平并写入数据库，
+        内存占用与单页大小相关，网络请求与数据库写入同时进行。
+        全量更新的表（FULL_UPDATE_TABLES）需要完整快照，仍在收齐后一次写入。
+
+        Returns:
+            各任务获取的数据条数
+        """
+        apis = self.select_due_apis(self.get_apis())
+
+        # 加载增量同步水位线（在主线程读取，工作线程只读内存副本）
+        self.watermarks = self.load_watermarks()
+        self.load_page_sizes()
+
+        # 同一接口只有一个筛选参数不同的API合并请求
+        groups = self.plan_coalesced_fetches(apis)
+        coalesced = {task_name for group in groups.values() for task_name in group['members']}
+
+        page_queue: queue.Queue = queue.Queue(maxsize=self.PIPELINE_QUEUE_SIZE)
+        try:
+            with ThreadPoolExecutor(max_workers=Config.MAX_WORKERS) as executor:
+                for task_name, api_config in apis.items():
+                    if task_name not in coalesced:
+                        executor.submit(self.produce_pages, task_name, api_config, page_queue)
+                for group_name, group in groups.items():
+                    executor.submit(self.produce_coalesced, group_name, group, apis, page_queue)
+
+                return self.consume_pages(apis, page_queue)
+        finally:
+            self.save_page_sizes()
+            self.write_metrics()
+            self.prune_landing()
+            self.prune_changelog()
+
+    def prune_changelog(self) -> None:
+        """清理超过保留天数的变更日志（失败不影响同步结果）"""
+        if self.changelog is not None:
+            self.changelog.prune(self.CHANGELOG_RETENTION_DAYS)
+
+    def prune_landing(self) -> None:
+        """清理落地区中超过保留天数的分区（失败不影响同步结果）"""
+        if self.landing_zone is None:
+            return
+        try:
+            self.landing_zone.prune(self.LANDING_RETENTION_DAYS)
+        except Exception as e:
+            self.logger.log_warning(f"落地区清理失败: {str(e)}")
+
+    def produce_landed_pages(self, task_name: str, files: List[Tuple[str, str]], page_queue: queue.Queue) -> None:
+        """生产者：从落地文件逐页读取数据放入队列（格式同 produce_pages）"""
+        try:
+            for _, body in self.landing_zone.iter_pages(files):
+                page_queue.put((task_name, extract_page_items(body), None))
+            page_queue.put((task_name, None, None))
+        except Exception as e:
+            page_queue.put((task_name, None, Exception(f"落地文件读取出错: {str(e)}")))
+
+    def replay_landing(self, date_from: Optional[str] = None, date_to: Optional[str] = None) -> Dict[str, int]:
+        """
+        回放落地区的原始响应重建表（不访问接口）
+
+        增量写入的表按时间顺序回放日期范围内的所有运行，
+        全量更新的表（FULL_UPDATE_TABLES）只回放范围内最近一次运行的完整快照。
+        回放前清除增量写入表的行哈希，否则表被清空或丢失数据后，回放的行与保存的哈希一致而不会写入。
+
+        Args:
+            date_from: 起始日期 YYYY-MM-DD（含），默认不限
+            date_to: 结束日期 YYYY-MM-DD（含），默认不限
+
+        Returns:
+            各任务回放的数据条数
+        """
+        if self.landing_zone is None:
+            raise Exception("未启用落地区，无法回放")
+
+        replay_files: Dict[str, List[Tuple[str, str]]] = {}
+        for task_name in self.get_apis():
+            files = self.landing_zone.list_files(task_name, date_from, date_to)
+            if not files:
+                continue
+            if DataSaver.API_TABLE_MAPPING.get(task_name) in DataSaver.FULL_UPDATE_TABLES:
+                files = files[-1:]
+            replay_files[task_name] = files
+        self.logger.log_info(f"从落地区回放 {len(replay_files)} 个API，共 {sum(map(len, replay_files.values()))} 个文件")
+
+        for task_name in replay_files:
+            table_name = DataSaver.API_TABLE_MAPPING.get(task_name)
+            if table_name in DataSaver.TABLE_PRIMARY_KEYS:
+                self.row_hash_store.clear(table_name)
+
+        # 回放不推进水位线
+        incremental, self.incremental = self.incremental, False
+        page_queue: queue.Queue = queue.Queue(maxsize=self.PIPELINE_QUEUE_SIZE)
+        try:
+            with ThreadPoolExecutor(max_workers=Config.MAX_WORKERS) as executor:
+                for task_name, files in replay_files.items():
+                    executor.submit(self.produce_landed_pages, task_name, files, page_queue)
+                return self.consume_pages(replay_files, page_queue)
+        finally:
+            self.incremental = incremental
+            self.write_metrics()
+
+    def save_with_metrics(self, data_saver: DataSaver, task_name: str,
+                          data_list: List[Dict]) -> Tuple[int, Optional[str], Optional[str]]:
+        """
+        写库并记录行数、影响行数和耗时
+
+        Returns:
+            影响行数、错误信息（成功时为None）和警告信息（跳过个别行时不为None）
+        """
+        started = monotonic()
+        affected = data_saver.save_data(task_name, data_list)
+        self.metrics.observe_write(task_name, len(data_list), affected, monotonic() - started)
+        return affected, data_saver.get_last_error(), data_saver.get_last_warning()
+
+    def create_writer_pool(self) -> Optional[WriterPool]:
+        """创建写库线程池，未启用或连接失败时返回None（退回主线程单连接写库）"""
+        if self.WRITER_POOL_SIZE <= 0:
+            return None
+        try:
+            return WriterPool(self.db_operator.db_config, self.WRITER_POOL_SIZE, self.metrics,
+                              changelog_run_id=self.changelog_run_id)
+        except Exception as e:
+            self.logger.log_warning(f"写库线程池创建失败: {str(e)}，改为单连接写库")
+            return None
+
+    def submit_write(self, writer_pool: Optional[WriterPool], task_name: str, data_list: List[Dict]) -> Future:
+        """提交一次写库：有线程池时按表路由到写库线程，否则在当前线程同步写入"""
+        if writer_pool is not None:
+            table_name = DataSaver.API_TABLE_MAPPING.get(task_name, task_name)
+            return writer_pool.submit(table_name, self.save_with_metrics, task_name, data_list)
+        future: Future = Future()
+        future.set_result(self.save_with_metrics(self.data_saver, task_name, data_list))
+        return future
+
+    def write_metrics(self) -> None:
+        """输出本次运行的JSON报告和 Prometheus textfile，并清理过期的JSON报告（失败不影响同步结果）"""
+        self.metrics.finish()
+        try:
+            paths = self.metrics.write_report(self.METRICS_DIR)
+            self.logger.log_info(f"运行指标已输出: {paths['json']}")
+        except Exception as e:
+            self.logger.log_warning(f"运行指标输出失败: {str(e)}")
+        try:
+            removed = self.metrics.prune_reports(self.METRICS_DIR, self.METRICS_RETENTION_DAYS)
+            if removed:
+                self.logger.log_info(f"已清理 {removed} 个过期的运行指标报告")
+        except Exception as e:
+            self.logger.log_warning(f"运行指标报告清理失败: {str(e)}")
+
+    def load_page_sizes(self) -> None:
+        """读取上次运行学习到的各API分页大小"""
+        for task_name, value in self.state_store.get_all(self.PAGE_SIZE_PREFIX).items():
+            try:
+                self.controller.page_sizes[task_name] = int(value)
+            except (TypeError, ValueError):
+                continue
+
+    def save_page_sizes(self) -> None:
+        """保存本次运行调整后的各API分页大小，供下次运行使用"""
+        for task_name, page_size in list(self.controller.page_sizes.items()):
+            self.state_store.set(f"{self.PAGE_SIZE_PREFIX}{task_name}", page_size)
+
+    def consume_pages(self, apis: Dict[str, Dict[str, Any]], page_queue: queue.Queue) -> Dict[str, int]:
+        """
+        消费者：从页队列接收数据并提交到写库线程池，直到所有任务结束，最后发送汇总通知
+
+        同一张表的写入按接收顺序执行，不同表并行写入；任务的所有写入完成后才推进水位线。
+
+        Args:
+            apis: 本次同步的API配置
+            page_queue: 生产者写入的页数据队列，元素格式见 produce_pages
+
+        Returns:
+            各任务获取的数据条数
+        """
+        results = {task_name: 0 for task_name in apis}
         total_affected = 0  # 统计总影响行数
         success_tasks = 0  # 统计成功的任务数
         failed_tasks = []  # 记录失败的任务及详细错误
         row_count_notifications = []  # 记录每条数据的影响行数，用于最终汇总
 
-        # 对容易失败的API进行特殊处理
-        problematic_apis = ['销售_衍生_订单查询', '装饰_订单管理_装饰订单']  # 根据经验添加容易失败的API
-
-        with ThreadPoolExecutor(max_workers=Config.MAX_WORKERS) as executor:
-            future_to_task = {}
-            for task_name, api_config in apis.items():
-                # 对容易失败的API使用带重试的包装函数
-                if task_name in problematic_apis:
-                    future = executor.submit(self.fetch_single_api_with_extra_retry, task_name, api_config)
-                else:
-                    future = executor.submit(self.fetch_single_api, task_name, api_config)
-                future_to_task[future] = task_name
+        task_affected = {task_name: 0 for task_name in apis}
+        task_errors: Dict[str, str] = {}
+        task_warnings: Dict[str, List[str]] = {}
+        snapshot_buffers: Dict[str, List[Dict]] = {}
+        task_writes: Dict[str, List[Future]] = {task_name: [] for task_name in apis}
+        finished_tasks: List[str] = []  # 数据已收齐的任务（按完成顺序），写库完成后统一汇总
 
-            for future in as_completed(future_to_task):
-                task_name = future_to_task[future]
-                try:
-                    result = future.result()
-                    results.update(result)
-                    data_count = len(result[task_name])
-                    self.logger.log_info(f"任务 {task_name} 完成, 获取{data_count}条数据")
-
-                    # 保存数据并记录影响行数
-                    affected = self.data_saver.save_data(task_name, result[task_name])
-
-                    # 检查数据保存过程中是否有错误
-                    if self.data_saver.get_last_error():
-                        error_msg = f"任务 {task_name} 数据保存失败: {self.data_saver.get_last_error()}"
-                        self.logger.log_error(error_msg)
-                        failed_tasks.append(error_msg)
-                    else:
-                        total_affected += affected
-                        success_tasks += 1
-                        # 记录影响行数
-                        row_count_msg = f"{task_name} 数据保存完成，影响 {affected} 行"
-                        row_count_notifications.append(row_count_msg)
+        writer_pool = self.create_writer_pool()
+        try:
+            pending_tasks = len(apis)
+            while pending_tasks:
+                task_name, page_data, error = page_queue.get()
+                table_name = DataSaver.API_TABLE_MAPPING.get(task_name)
+                is_snapshot = table_name in DataSaver.FULL_UPDATE_TABLES
 
-                except Exception as e:
+                if error is not None:
                     # 捕获API请求和处理过程中的所有异常
-                    error_msg = f"任务 {task_name} 处理失败: {str(e)}"
+                    pending_tasks -= 1
+                    error_msg = f"任务 {task_name} 处理失败: {str(error)}"
                     self.logger.log_error(error_msg)
                     failed_tasks.append(error_msg)
-
+                    snapshot_buffers.pop(task_name, None)
+                    continue
+
+                if page_data is not None:
+                    results[task_name] += len(page_data)
+                    if is_snapshot:
+                        snapshot_buffers.setdefault(task_name, []).extend(page_data)
+                    elif page_data:
+                        # 每收到一页立即提交写库
+                        task_writes[task_name].append(self.submit_write(writer_pool, task_name, page_data))
+                    continue
+
+                # 任务结束
+                pending_tasks -= 1
+                self.logger.log_info(f"任务 {task_name} 完成, 获取{results[task_name]}条数据")
+                # 没有数据的任务不写库，按成功处理（推进水位线，并让轮询策略记录为无变化）
+                if is_snapshot and results[task_name]:
+                    task_writes[task_name].append(
+                        self.submit_write(writer_pool, task_name, snapshot_buffers.pop(task_name)))
+                finished_tasks.append(task_name)
+
+            # 等待各任务的写库结果
+            for task_name in finished_tasks:
+                for future in task_writes[task_name]:
+                    try:
+                        affected, save_error, save_warning = future.result()
+                    except Exception as e:
+                        affected, save_error, save_warning = 0, str(e), None
+                    if save_error:
+                        task_errors.setdefault(task_name, save_error)
+                    else:
+                        task_affected[task_name] += affected
+                    if save_warning:
+                        task_warnings.setdefault(task_name, []).append(save_warning)
+        finally:
+            if writer_pool is not None:
+                writer_pool.close()
+
+        for task_name in finished_tasks:
+            # 检查数据保存过程中是否有错误
+            if task_name in task_errors:
+                error_msg = f"任务 {task_name} 数据保存失败: {task_errors[task_name]}"
+                self.logger.log_error(error_msg)
+                failed_tasks.append(error_msg)
+            else:
+                # 数据已提交，推进水位线
+                self.advance_watermark(task_name, apis[task_name])
+                affected = task_affected[task_name]
+                self.record_poll(task_name, affected)
+                total_affected += affected
+                success_tasks += 1
+                # 记录影响行数（跳过个别无法写入的行时附加警告，不算任务失败）
+                row_count_msg = f"{task_name} 数据保存完成，影响 {affected} 行"
+                if task_name in task_warnings:
+                    row_count_msg += f"（警告: {'; '.join(task_warnings[task_name])}）"
+                row_count_notifications.append(row_count_msg)
 
         # 所有任务完成后汇总并发送企微通知
+        self.send_summary(len(apis), success_tasks, failed_tasks, total_affected, row_count_notifications)
+
+        return results
+
+    def send_summary(self, total_tasks: int, success_tasks: int, failed_tasks: List[str], total_affected: int,
+                     row_count_notifications: List[str]) -> None:
+        """
+        汇总同步结果并发送企微通知
+
+        Args:
+            total_tasks: 总任务数
+            success_tasks: 成功任务数
+            failed_tasks: 失败任务详情
+            total_affected: 总影响行数
+            row_count_notifications: 各任务影响行数说明
+        """
         completion_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         time_range_desc = {
             1: "当日",
@@ -963,7 +2466,7 @@ class DataSyncManager:
             f"数据同步任务已完成\n"
             f"完成时间: {completion_time}\n"
             f"时间范围: {time_range_desc}\n"
-            f"总任务数: {len(apis)}\n"
+            f"总任务数: {total_tasks}\n"
             f"成功任务数: {success_tasks}\n"
             f"失败任务数: {len(failed_tasks)}\n"
             f"总影响行数: {total_affected}\n"
@@ -980,29 +2483,9 @@ class DataSyncManager:
         # 发送汇总通知
         send_wechat_notification(notification_content)
 
-        return results
-
-    def fetch_single_api_with_extra_retry(self, task_name: str, api_config: Dict[str, Any]) -> Dict[str, List[Dict]]:
-        """
-        对容易失败的API使用额外的重试机制
-        """
-        max_extra_retries = 2
-        extra_retry_delay = 10  # 更长的重试间隔
-
-        for extra_attempt in range(max_extra_retries + 1):
-            try:
-                return self.fetch_single_api(task_name, api_config)
-            except Exception as e:
-                if extra_attempt < max_extra_retries:
-                    self.logger.log_warning(
-                        f"{task_name} 额外重试第{extra_attempt + 1}次: {str(e)}，{extra_retry_delay}秒后重试")
-                    sleep(extra_retry_delay)
-                else:
-                    self.logger.log_error(f"{task_name} 额外重试{max_extra_retries}次后仍然失败: {str(e)}")
-                    raise
-
     def close(self) -> None:
         """关闭资源"""
+        self.requester.close()
         self.db_operator.close()
 
 
@@ -1011,8 +2494,14 @@ if __name__ == "__main__":
     # 1: 当日数据, 2: 当月数据, 3: 输入'01'-'12',获取当月的数据
     sync_manager = None
     try:
-        sync_manager = DataSyncManager(time_option=1)  # 默认下载当月数据
-        sync_manager.run_apis()
+        # 传入 --all 时不按轮询策略跳过API
+        sync_manager = DataSyncManager(time_option=1, polling='--all' not in sys.argv[1:])  # 默认下载当日数据
+        if '--replay' in sys.argv[1:]:
+            # 离线重建：python cyy_to_mysql_99.py --replay [起始日期] [结束日期]
+            dates = [arg for arg in sys.argv[1:] if arg != '--replay']
+            sync_manager.replay_landing(*dates[:2])
+        else:
+            sync_manager.run_apis()
     except Exception as e:
         error_msg = f"数据同步主程序异常: {str(e)}"
         print(error_msg)
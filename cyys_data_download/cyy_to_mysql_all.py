@@ -1,4 +1,4 @@
-from common_code import RequestFunction, collect_nested_keys, WriteLog
+from common_code import RequestFunction, collect_nested_keys, WriteLog, RetryPolicy
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime, timedelta
 from webdav3.client import Client
@@ -239,6 +239,53 @@ class DBOperator:
             self.reconnect()
             return 0
 
+    def replace_table(self, table_name: str, data_list: List[Tuple], fieldnames: List[str]) -> int:
+        """
+        用影子表整体替换表数据：数据先写入 {table}__staging，再通过 RENAME TABLE 原子切换，
+        读取方不会看到空表或只写了一半的表，写入失败时原表保持不变
+
+        Args:
+            table_name: 表名
+            data_list: 数据列表
+            fieldnames: 字段名列表
+
+        Returns:
+            写入的行数
+        """
+        staging_table = f"{table_name}__staging"
+        old_table = f"{table_name}__old"
+        self.last_error = None
+
+        try:
+            with self.connection.cursor() as cursor:
+                cursor.execute(f"DROP TABLE IF EXISTS {staging_table}")
+                cursor.execute(f"CREATE TABLE {staging_table} LIKE {table_name}")
+
+                quoted_fields = [f"`{field}`" for field in fieldnames]
+                placeholders = ', '.join(['%s'] * len(fieldnames))
+                cursor.executemany(
+                    f"INSERT INTO {staging_table} ({', '.join(quoted_fields)}) VALUES ({placeholders})", data_list)
+                affected_rows = cursor.rowcount
+                self.connection.commit()
+
+                # 原子切换
+                cursor.execute(f"DROP TABLE IF EXISTS {old_table}")
+                cursor.execute(f"RENAME TABLE {table_name} TO {old_table}, {staging_table} TO {table_name}")
+                cursor.execute(f"DROP TABLE {old_table}")
+            self.connection.commit()
+            return affected_rows
+        except Exception as e:
+            error_msg = f"表 {table_name} 整体替换失败: {str(e)}"
+            self.logger.log_error(error_msg)
+            try:
+                self.reconnect()
+                with self.connection.cursor() as cursor:
+                    cursor.execute(f"DROP TABLE IF EXISTS {staging_table}")
+            except Exception:
+                pass
+            self.last_error = error_msg
+            return 0
+
     def get_last_error(self) -> Optional[str]:
         """获取最后一次错误信息"""
         return self.last_error
@@ -418,7 +465,7 @@ class DataSaver:
 
     def save_full_update_data(self, api_name: str, data_list: List[Dict]) -> int:
         """
-        全量更新数据到数据库（先删除所有数据，再插入新数据）
+        全量更新数据到数据库（写入影子表后原子切换，写入失败时保留原数据）
 
         Args:
             api_name: API名称
@@ -457,13 +504,9 @@ class DataSaver:
                 self.last_error = f"无法构建SQL查询，无法保存 {api_name} 数据"
                 return 0
 
-            # 先删除表中所有数据（全量更新核心逻辑）
-            delete_query = f"DELETE FROM {table_name}"
-            self.db_operator.execute_query(delete_query)
-            self.logger.log_info(f"{api_name} - 表 {table_name} 已清空所有数据")
-
-            # 执行批量插入
-            affected_rows = self.db_operator.execute_many(query, params_list)
+            # 写入影子表后原子替换原表（与 build_insert_query 使用相同的有效字段）
+            valid_fields = [field for field in fieldnames if field in table_schema]
+            affected_rows = self.db_operator.replace_table(table_name, params_list, valid_fields)
 
             # 检查是否有数据库错误
             if self.db_operator.get_last_error():
@@ -658,6 +701,7 @@ class DataSyncManager:
         """初始化数据同步管理器（无时间限制，全量更新）"""
         self.logger = WriteLog()
         self.requester = RequestFunction()
+        self.retry_policy = RetryPolicy()
         self.token = self.get_token()
 
         # 初始化数据库连接
@@ -713,14 +757,14 @@ class DataSyncManager:
 
                 payload['Token'] = self.token
 
-                # 添加重试机制
-                max_retries = 3
-                retry_delay = 5  # 秒
+                # 重试由共享的重试策略控制（指数退避加抖动、重试预算、按API熔断）
                 response = None
                 last_exception = None
+                attempt = 0
 
-                for attempt in range(max_retries):
-                    self.logger.log_info(f"{task_name} 第{page_number}页 - 重试第{attempt + 1}次")
+                while True:
+                    self.logger.log_info(f"{task_name} 第{page_number}页 - 第{attempt + 1}次请求")
+                    self.retry_policy.before_attempt(task_name)
                     try:
                         response = self.requester.request(
                             url=url,
@@ -749,27 +793,33 @@ class DataSyncManager:
                                 raise KeyError("data 中缺少 'Data' 字段")
 
                         # 如果所有检查都通过，跳出重试循环
+                        self.retry_policy.record_success(task_name)
                         break
 
                     except KeyError as e:
                         # 专门处理数据结构错误
                         last_exception = e
-                        if attempt < max_retries - 1:
+                        self.retry_policy.record_failure(task_name)
+                        retry_delay = self.retry_policy.next_delay(task_name, attempt)
+                        if retry_delay is not None:
                             self.logger.log_warning(
-                                f"{task_name} 第{page_number}页第{attempt + 1}次请求数据结构错误: {str(e)}，{retry_delay}秒后重试")
+                                f"{task_name} 第{page_number}页第{attempt + 1}次请求数据结构错误: {str(e)}，{retry_delay:.1f}秒后重试")
                             sleep(retry_delay)
                         else:
                             raise Exception(
-                                f"{task_name} 第{page_number}页请求数据结构错误，已重试{max_retries}次: {str(e)}")
+                                f"{task_name} 第{page_number}页请求数据结构错误，已请求{attempt + 1}次: {str(e)}")
 
                     except Exception as e:
                         last_exception = e
-                        if attempt < max_retries - 1:
+                        self.retry_policy.record_failure(task_name)
+                        retry_delay = self.retry_policy.next_delay(task_name, attempt)
+                        if retry_delay is not None:
                             self.logger.log_warning(
-                                f"{task_name} 第{page_number}页第{attempt + 1}次请求失败: {str(e)}，{retry_delay}秒后重试")
+                                f"{task_name} 第{page_number}页第{attempt + 1}次请求失败: {str(e)}，{retry_delay:.1f}秒后重试")
                             sleep(retry_delay)
                         else:
-                            raise Exception(f"{task_name} 第{page_number}页请求失败，已重试{max_retries}次: {str(e)}")
+                            raise Exception(f"{task_name} 第{page_number}页请求失败，已请求{attempt + 1}次: {str(e)}")
+                    attempt += 1
 
                 # 如果经过重试后仍然没有有效响应，抛出异常
                 if not response or not isinstance(response, dict) or 'data' not in response:
@@ -817,17 +867,10 @@ class DataSyncManager:
         failed_tasks = []  # 记录失败的任务及详细错误
         row_count_notifications = []  # 记录每条数据的影响行数，用于最终汇总
 
-        # 对容易失败的API进行特殊处理
-        problematic_apis = ['销售_衍生_订单查询', '装饰_订单管理_装饰订单']  # 根据经验添加容易失败的API
-
         with ThreadPoolExecutor(max_workers=Config.MAX_WORKERS) as executor:
             future_to_task = {}
             for task_name, api_config in apis.items():
-                # 对容易失败的API使用带重试的包装函数
-                if task_name in problematic_apis:
-                    future = executor.submit(self.fetch_single_api_with_extra_retry, task_name, api_config)
-                else:
-                    future = executor.submit(self.fetch_single_api, task_name, api_config)
+                future = executor.submit(self.fetch_single_api, task_name, api_config)
                 future_to_task[future] = task_name
 
             for future in as_completed(future_to_task):
@@ -885,25 +928,6 @@ class DataSyncManager:
 
         return results
 
-    def fetch_single_api_with_extra_retry(self, task_name: str, api_config: Dict[str, Any]) -> Dict[str, List[Dict]]:
-        """
-        对容易失败的API使用额外的重试机制
-        """
-        max_extra_retries = 2
-        extra_retry_delay = 10  # 更长的重试间隔
-
-        for extra_attempt in range(max_extra_retries + 1):
-            try:
-                return self.fetch_single_api(task_name, api_config)
-            except Exception as e:
-                if extra_attempt < max_extra_retries:
-                    self.logger.log_warning(
-                        f"{task_name} 额外重试第{extra_attempt + 1}次: {str(e)}，{extra_retry_delay}秒后重试")
-                    sleep(extra_retry_delay)
-                else:
-                    self.logger.log_error(f"{task_name} 额外重试{max_extra_retries}次后仍然失败: {str(e)}")
-                    raise
-
     def close(self) -> None:
         """关闭资源"""
         self.db_operator.close()
@@ -1,9 +1,14 @@
-from common_code import RequestFunction, WriteLog
+from common_code import RequestFunction, WriteLog, TokenBucket, TokenCache, RetryPolicy, is_auth_error
+from sync_state import RowHashStore, SyncStateStore
+from cyy_to_mysql_99 import extract_total
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from webdav3.client import Client
 from time import sleep
-import random
 import copy
+import queue
+import threading
+import hashlib
+import os
 import pymysql
 import requests
 from typing import Dict, Any, Optional, Tuple, Set
@@ -296,8 +301,14 @@ class DataSaver:
         'used_car_services': 'BillCode'
     }
 
-    def __init__(self, db_operator: DBOperator):
+    def __init__(self, db_operator: DBOperator, row_hash_store: Optional[RowHashStore] = None):
+        """
+        Args:
+            db_operator: 数据库操作对象
+            row_hash_store: 行哈希存储（默认在第一次写库时使用 db_operator 创建），写库后删除被改写行的哈希
+        """
         self.db_operator = db_operator
+        self.row_hash_store = row_hash_store
         self.table_schema: Dict[str, Dict[str, str]] = {}
         self.last_error: Optional[str] = None  # 记录最后一次错误信息
 
@@ -415,6 +426,16 @@ class DataSaver:
                 self.last_error = self.db_operator.get_last_error()
                 return 0
 
+            # 增量同步按行哈希跳过未变化的行，被改写行的哈希需要删除，下次增量同步时重新写入并记录哈希
+            primary_key = self.TABLE_PRIMARY_KEYS.get(table_name)
+            if primary_key:
+                if self.row_hash_store is None:
+                    self.row_hash_store = RowHashStore(self.db_operator)
+                pk_values = [str(item[primary_key]) for item in flattened_data if item.get(primary_key) is not None]
+                if not self.row_hash_store.delete_hashes(table_name, pk_values):
+                    self.last_error = f"删除 {table_name} 行哈希失败: {self.db_operator.get_last_error()}"
+                    return affected_rows
+
             print(f"{api_name} 数据保存完成，影响 {affected_rows} 行")
             return affected_rows
         except Exception as e:
@@ -528,12 +549,17 @@ class DataSaver:
             每个表清空结果的字典
         """
         clear_results = {}
+        row_hash_store = RowHashStore(self.db_operator)
 
         for api_name, table_name in self.API_TABLE_MAPPING.items():
             print(f"正在清空表: {table_name} ({api_name})")
             success = self.db_operator.truncate_table(table_name)
             clear_results[table_name] = success
 
+            # 表被清空后，增量同步保存的行哈希随之失效
+            if success:
+                row_hash_store.clear(table_name)
+
             if not success:
                 error_msg = self.db_operator.get_last_error()
                 print(f"清空表 {table_name} 失败: {error_msg}")
@@ -559,27 +585,47 @@ class DataSaver:
 class DataSyncManager:
     """数据同步管理器"""
 
-    def __init__(self, time_option: int = 2):
+    # 请求限流（每秒请求数、突发容量），共用同一个限流器的线程合计不超过该速率
+    REQUEST_RATE = 1.0
+    REQUEST_BURST = 3
+
+    def __init__(self, time_option: int = 2, requester: Optional[RequestFunction] = None,
+                 token: Optional[str] = None, db_operator: Optional[DBOperator] = None,
+                 rate_limiter: Optional[TokenBucket] = None):
         """
         初始化数据同步管理器
 
         Args:
             time_option: 时间选项 1-当日 2-当月 3-全部数据
+            requester: 共用的请求对象，为None时新建
+            token: 共用的API令牌，为None时重新获取
+            db_operator: 共用的数据库连接，为None时新建（只关闭自己创建的资源）
+            rate_limiter: 共用的请求限流器，为None时按 REQUEST_RATE 新建
         """
         self.logger = WriteLog()
-        self.requester = RequestFunction()
-        self.token = self.get_token()
+        self.owns_requester = requester is None
+        self.requester = requester or RequestFunction()
+        self.rate_limiter = rate_limiter or TokenBucket(self.REQUEST_RATE, self.REQUEST_BURST)
+        self.retry_policy = RetryPolicy()
+        # 令牌缓存在本地文件中，各同步脚本共用，过期前自动刷新
+        self.token_cache = TokenCache(self.fetch_token, cache_key=f"{Config.API_BASE_URL}|{DataCenter.USER}")
+        self.token = token or self.get_token()
         self.time_option = time_option
 
         # 初始化数据库连接
-        self.db_operator = DBOperator(Config.DB_CONFIG)
+        self.owns_db_operator = db_operator is None
+        self.db_operator = db_operator or DBOperator(Config.DB_CONFIG)
         self.data_saver = DataSaver(self.db_operator)
 
         # 初始化WebDAV客户端
         self.client = Client(Config.WEBDAV_CONFIG)
 
     def get_token(self) -> str:
-        """获取API访问令牌"""
+        """获取API访问令牌（优先使用缓存，临近过期时自动刷新）"""
+        return self.token_cache.get()
+
+    def fetch_token(self) -> str:
+        """请求新的API访问令牌"""
         try:
             response = self.requester.request(
                 url=f'{Config.API_BASE_URL}/api/Values/GetToken',
@@ -592,6 +638,41 @@ class DataSyncManager:
             self.logger.log_error(error_msg)
             raise Exception(error_msg)
 
+    def probe_total(self, task_name: str, api_config: Dict[str, Any]) -> Optional[int]:
+        """
+        只请求一条数据，读取接口返回的总条数（用于对账，代价远小于完整下载）
+
+        Args:
+            task_name: 任务名称
+            api_config: API配置
+
+        Returns:
+            总条数，接口不分页、未返回总条数或请求失败时返回None
+        """
+        payload = copy.deepcopy(api_config.get('payload', {}))
+        if 'PageSize' not in payload:
+            return None
+        payload['PageSize'] = 1
+        if 'PageNumber' in payload:
+            payload['PageNumber'] = 1
+
+        method = api_config['method']
+        kwargs = {'params': payload} if method.upper() == 'GET' else {'json_data': payload}
+        try:
+            payload['Token'] = self.get_token()
+            self.rate_limiter.acquire()
+            response = self.requester.request(url=api_config['url'], method=method, **kwargs)
+            if is_auth_error(response):
+                payload['Token'] = self.token_cache.invalidate(payload['Token'])
+                self.rate_limiter.acquire()
+                response = self.requester.request(url=api_config['url'], method=method, **kwargs)
+            if not response.get('success'):
+                raise Exception(response.get('error'))
+            return extract_total(response.get('data'))
+        except Exception as e:
+            self.logger.log_warning(f"{task_name} 总条数探测失败: {str(e)}")
+            return None
+
     def fetch_single_api(self, task_name: str, api_config: Dict[str, Any]) -> Dict[str, List[Dict]]:
         """
         处理单个API的所有分页请求
@@ -622,23 +703,35 @@ class DataSyncManager:
                 else:
                     kwargs['json_data'] = payload
 
-                payload['Token'] = self.token
+                payload['Token'] = self.get_token()
 
-                # 添加重试机制
-                max_retries = 3
-                retry_delay = 5  # 秒
+                # 重试由共享的重试策略控制（指数退避加抖动、重试预算、按API熔断）
                 response = None
                 last_exception = None
+                attempt = 0
 
-                for attempt in range(max_retries):
-                    self.logger.log_info(f"{task_name} 第{page_number}页 - 重试第{attempt + 1}次")
+                while True:
+                    self.logger.log_info(f"{task_name} 第{page_number}页 - 第{attempt + 1}次请求")
+                    self.retry_policy.before_attempt(task_name)
                     try:
+                        self.rate_limiter.acquire()
                         response = self.requester.request(
                             url=url,
                             method=method,
                             **kwargs
                         )
 
+                        # 令牌失效时刷新令牌并立即重发一次
+                        if is_auth_error(response):
+                            self.logger.log_warning(f"{task_name} 第{page_number}页令牌失效，刷新令牌后重试")
+                            payload['Token'] = self.token_cache.invalidate(payload['Token'])
+                            self.rate_limiter.acquire()
+                            response = self.requester.request(
+                                url=url,
+                                method=method,
+                                **kwargs
+                            )
+
                         # 检查响应结构
                         if not response or not isinstance(response, dict):
                             raise KeyError(f"响应不是字典类型: {type(response)}")
@@ -660,27 +753,33 @@ class DataSyncManager:
                                 raise KeyError("data 中缺少 'Data' 字段")
 
                         # 如果所有检查都通过，跳出重试循环
+                        self.retry_policy.record_success(task_name)
                         break
 
                     except KeyError as e:
                         # 专门处理数据结构错误
                         last_exception = e
-                        if attempt < max_retries - 1:
+                        self.retry_policy.record_failure(task_name)
+                        retry_delay = self.retry_policy.next_delay(task_name, attempt)
+                        if retry_delay is not None:
                             self.logger.log_warning(
-                                f"{task_name} 第{page_number}页第{attempt + 1}次请求数据结构错误: {str(e)}，{retry_delay}秒后重试")
+                                f"{task_name} 第{page_number}页第{attempt + 1}次请求数据结构错误: {str(e)}，{retry_delay:.1f}秒后重试")
                             sleep(retry_delay)
                         else:
                             raise Exception(
-                                f"{task_name} 第{page_number}页请求数据结构错误，已重试{max_retries}次: {str(e)}")
+                                f"{task_name} 第{page_number}页请求数据结构错误，已请求{attempt + 1}次: {str(e)}")
 
                     except Exception as e:
                         last_exception = e
-                        if attempt < max_retries - 1:
+                        self.retry_policy.record_failure(task_name)
+                        retry_delay = self.retry_policy.next_delay(task_name, attempt)
+                        if retry_delay is not None:
                             self.logger.log_warning(
-                                f"{task_name} 第{page_number}页第{attempt + 1}次请求失败: {str(e)}，{retry_delay}秒后重试")
+                                f"{task_name} 第{page_number}页第{attempt + 1}次请求失败: {str(e)}，{retry_delay:.1f}秒后重试")
                             sleep(retry_delay)
                         else:
-                            raise Exception(f"{task_name} 第{page_number}页请求失败，已重试{max_retries}次: {str(e)}")
+                            raise Exception(f"{task_name} 第{page_number}页请求失败，已请求{attempt + 1}次: {str(e)}")
+                    attempt += 1
 
                 # 如果经过重试后仍然没有有效响应，抛出异常
                 if not response or not isinstance(response, dict) or 'data' not in response:
@@ -706,13 +805,11 @@ class DataSyncManager:
 
                 all_data.extend(page_data)
 
+                # 请求速率由共用的限流器控制，翻页之间不再额外等待
                 if should_fetch_next_page(page_data, page_size):
                     page_number += 1
                 else:
                     break
-
-                # 添加随机延迟，避免请求过于频繁
-                sleep(random.uniform(*Config.REQUEST_DELAY))
         except Exception as e:
             raise Exception(f"API请求过程出错: {str(e)}") from e
 
@@ -799,7 +896,536 @@ class DataSyncManager:
 
     def close(self) -> None:
         """关闭资源"""
-        self.db_operator.close()
+        if self.owns_requester:
+            self.requester.close()
+        if self.owns_db_operator:
+            self.db_operator.close()
+
+
+class MonthBackfillPlanner:
+    """
+    按月回填规划器
+
+    把回填拆分为 (月份, API) 单元，在一个共享线程池中执行：所有单元共用一个请求对象和令牌，
+    写库从固定大小的连接池借用连接。每完成一个单元写一次检查点文件，中断后再次运行时
+    跳过已完成的单元继续执行（续跑时不清空数据表）。
+
+    对账模式（reconcile=True）下不清空数据表：每个单元成功写库后在 sync_state 中保存该月数据的指纹
+    （行数、金额字段合计、主键哈希），下次运行时：
+    - 超过 freeze_months 个月的已冻结月份只请求一条数据读取总条数，与指纹行数一致、
+      且本地表该月的主键数和金额合计与上游一致时跳过；
+    - 其余月份重新请求后计算指纹，与上次一致且本地表该月数据与指纹一致则不写库，否则写库。
+    本地表该月数据按 TABLE_MONTH_FIELDS 中的日期字段统计；未配置日期字段的表无法只凭总条数核对本地数据，
+    已冻结月份也重新请求，再按上游数据的主键统计本地表。
+    上游删除的数据不会在对账中删除，由删除日志同步处理。
+
+    删除日志表每次写库都先清空再插入，不能按月份并行写库：各月份单元只请求数据，
+    所有单元完成后合并为一次写库（续跑时删除日志的所有月份都重新请求）。
+    示例：
+    planner = MonthBackfillPlanner(reconcile=True)
+    resuming = planner.load_checkpoint()
+    result = planner.run()
+    """
+
+    # 回填线程数（同时也是数据库连接池大小）
+    BACKFILL_WORKERS = 6
+    # 回填起始年份
+    START_YEAR = 2025
+    # 检查点文件路径
+    CHECKPOINT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'month_backfill_checkpoint.json')
+    # 超过该时长（小时）的检查点视为过期，重新全量回填
+    CHECKPOINT_MAX_AGE_HOURS = 20
+    # 月份指纹在 sync_state 中的键前缀
+    FINGERPRINT_PREFIX = 'month_fingerprint:'
+    # 早于当月该月数的月份视为已冻结，只核对总条数
+    FREEZE_AFTER_MONTHS = 3
+    # 字段名包含这些关键字的数值字段计入金额合计
+    AMOUNT_FIELD_KEYWORDS = ('Amount', 'Money', 'Price', 'Cost', 'Fee')
+    # 各表按月筛选数据的日期字段（与接口按月请求时的筛选日期一致），用于统计本地表每月的数据
+    TABLE_MONTH_FIELDS: Dict[str, str] = {
+        'bill_management': 'PledgeDate',
+    }
+    # 本地金额合计与上游指纹的允许误差
+    AMOUNT_TOLERANCE = 0.01
+
+    def __init__(self, workers: Optional[int] = None, reconcile: bool = False,
+                 freeze_months: Optional[int] = None):
+        """
+        Args:
+            workers: 回填线程数，默认 BACKFILL_WORKERS
+            reconcile: 是否按月份指纹对账（只写入有变化的月份）
+            freeze_months: 冻结月数，默认 FREEZE_AFTER_MONTHS
+        """
+        self.logger = WriteLog()
+        self.workers = workers or self.BACKFILL_WORKERS
+        self.reconcile = reconcile
+        self.freeze_months = self.FREEZE_AFTER_MONTHS if freeze_months is None else freeze_months
+        self.months = self.backfill_months()
+        self.started_at = datetime.now()
+        self.completed: Dict[str, int] = {}
+        self.failed: Dict[str, str] = {}
+        self.checkpoint_lock = threading.Lock()
+        # 删除日志各月份请求到的数据，等待合并写库
+        self.delete_log_rows: Dict[str, List[Dict]] = {}
+
+        # 共用的请求对象、令牌、限流器和数据库连接池（所有线程合计的请求速率不超过 REQUEST_RATE）
+        self.rate_limiter = TokenBucket(DataSyncManager.REQUEST_RATE, DataSyncManager.REQUEST_BURST)
+        self.fetcher = DataSyncManager(time_option=self.months[-1], rate_limiter=self.rate_limiter)
+        self.saver_pool: queue.Queue = queue.Queue()
+        self.db_operators: List[DBOperator] = []
+        for _ in range(self.workers):
+            db_operator = DBOperator(Config.DB_CONFIG)
+            self.db_operators.append(db_operator)
+            self.saver_pool.put(DataSaver(db_operator))
+
+        # 月份指纹只在主线程读写，使用请求对象自带的数据库连接
+        self.state_store = SyncStateStore(self.fetcher.db_operator)
+        self.fingerprints: Dict[str, Dict[str, Any]] = self.load_fingerprints()
+        self.status_counts: Dict[str, int] = {}
+
+    @classmethod
+    def backfill_months(cls) -> List[str]:
+        """从起始年份到当月的所有月份（YYYYMM）"""
+        now = datetime.now()
+        months = []
+        for year in range(cls.START_YEAR, now.year + 1):
+            for month in range(1, 13 if year < now.year else now.month + 1):
+                months.append(f"{year}{month:02d}")
+        return months
+
+    @staticmethod
+    def unit_key(month: str, task_name: str) -> str:
+        """回填单元在检查点中的键"""
+        return f"{month}|{task_name}"
+
+    def is_frozen(self, month: str) -> bool:
+        """月份是否已超过冻结月数"""
+        now = datetime.now()
+        age = (now.year - int(month[:4])) * 12 + now.month - int(month[4:])
+        return age >= self.freeze_months
+
+    def load_fingerprints(self) -> Dict[str, Dict[str, Any]]:
+        """
+        读取已保存的月份指纹
+
+        Returns:
+            回填单元键到指纹的映射
+        """
+        fingerprints = {}
+        for key, value in self.state_store.get_all(self.FINGERPRINT_PREFIX).items():
+            try:
+                fingerprints[key] = json.loads(value)
+            except (TypeError, ValueError):
+                self.logger.log_warning(f"月份指纹无法解析，忽略: {key}")
+        return fingerprints
+
+    def save_fingerprint(self, key: str, fingerprint: Dict[str, Any]) -> None:
+        """保存单个回填单元的指纹"""
+        if self.fingerprints.get(key) == fingerprint:
+            return
+        if self.state_store.set(f"{self.FINGERPRINT_PREFIX}{key}", json.dumps(fingerprint, ensure_ascii=False)):
+            self.fingerprints[key] = fingerprint
+
+    def clear_fingerprints(self) -> None:
+        """删除所有月份指纹（数据表被清空后调用）"""
+        for key in list(self.fingerprints):
+            self.state_store.delete(f"{self.FINGERPRINT_PREFIX}{key}")
+        self.fingerprints.clear()
+
+    @classmethod
+    def compute_fingerprint(cls, task_name: str, data_list: List[Dict]) -> Dict[str, Any]:
+        """
+        计算一个月数据的指纹
+
+        Args:
+            task_name: 任务名称
+            data_list: 该月的全部数据
+
+        Returns:
+            指纹 {'rows': 行数, 'pk_count': 主键数, 'pk_hash': 主键哈希, 'amounts': {金额字段: 合计}}
+        """
+        table_name = DataSaver.API_TABLE_MAPPING.get(task_name)
+        primary_key = DataSaver.TABLE_PRIMARY_KEYS.get(table_name)
+
+        amounts: Dict[str, float] = {}
+        pk_values = set()
+        for item in data_list:
+            if primary_key and item.get(primary_key) is not None:
+                pk_values.add(str(item[primary_key]))
+            for field, value in item.items():
+                if not any(keyword in field for keyword in cls.AMOUNT_FIELD_KEYWORDS):
+                    continue
+                try:
+                    amount = float(value)
+                except (TypeError, ValueError):
+                    continue
+                amounts[field] = amounts.get(field, 0.0) + amount
+
+        return {
+            'rows': len(data_list),
+            'pk_count': len(pk_values),
+            'pk_hash': hashlib.md5('\n'.join(sorted(pk_values)).encode('utf-8')).hexdigest(),
+            'amounts': {field: round(total, 2) for field, total in sorted(amounts.items())},
+        }
+
+    @staticmethod
+    def primary_key_values(task_name: str, data_list: List[Dict]) -> Optional[List[str]]:
+        """上游数据的主键值（表没有主键时返回None）"""
+        primary_key = DataSaver.TABLE_PRIMARY_KEYS.get(DataSaver.API_TABLE_MAPPING.get(task_name))
+        if not primary_key:
+            return None
+        return [str(item[primary_key]) for item in data_list if item.get(primary_key) is not None]
+
+    @staticmethod
+    def month_range(month: str) -> Tuple[datetime, datetime]:
+        """月份（YYYYMM）的起止时间（左闭右开）"""
+        year, month_number = int(month[:4]), int(month[4:])
+        start = datetime(year, month_number, 1)
+        end = datetime(year + 1, 1, 1) if month_number == 12 else datetime(year, month_number + 1, 1)
+        return start, end
+
+    def local_month_stats(self, task_name: str, month: str, amount_fields: List[str],
+                          pk_values: Optional[List[str]] = None) -> Optional[Dict[str, Any]]:
+        """
+        统计本地表中某月的数据（从连接池借用连接，可在工作线程中调用）
+
+        表配置了 TABLE_MONTH_FIELDS 时按日期字段筛选该月数据，否则按上游该月数据的主键在本地表中查找。
+
+        Args:
+            task_name: 任务名称
+            month: 月份（YYYYMM）
+            amount_fields: 需要合计的金额字段（表中不存在的字段忽略）
+            pk_values: 上游该月数据的主键值（未配置日期字段时使用）
+
+        Returns:
+            {'pk_count': 主键数, 'amounts': {金额字段: 合计}}，无法统计或查询失败时返回None
+        """
+        table_name = DataSaver.API_TABLE_MAPPING.get(task_name)
+        primary_key = DataSaver.TABLE_PRIMARY_KEYS.get(table_name)
+        month_field = self.TABLE_MONTH_FIELDS.get(table_name)
+        if not month_field and (not primary_key or pk_values is None):
+            return None
+
+        data_saver = self.saver_pool.get()
+        try:
+            table_schema = data_saver.get_table_schema(table_name)
+            if not table_schema:
+                return None
+            fields = [field for field in amount_fields if field in table_schema]
+            columns = [f"COUNT(DISTINCT `{primary_key}`)" if primary_key else "COUNT(*)"]
+            columns += [f"COALESCE(SUM(`{field}`), 0)" for field in fields]
+            select = f"SELECT {', '.join(columns)} FROM `{table_name}`"
+
+            if month_field and month_field in table_schema:
+                conditions = [(f"`{month_field}` >= %s AND `{month_field}` < %s", self.month_range(month))]
+            elif primary_key and pk_values is not None:
+                unique_values = list(dict.fromkeys(pk_values))
+                chunk_size = RowHashStore.LOOKUP_CHUNK_SIZE
+                conditions = [
+                    (f"`{primary_key}` IN ({', '.join(['%s'] * len(chunk))})", tuple(chunk))
+                    for chunk in (unique_values[i:i + chunk_size] for i in range(0, len(unique_values), chunk_size))
+                ]
+            else:
+                return None
+
+            totals = [0.0] * len(columns)
+            for condition, params in conditions:
+                result = data_saver.db_operator.execute_query(f"{select} WHERE {condition}", params)
+                if not result:
+                    return None
+                totals = [total + float(value or 0) for total, value in zip(totals, result[0])]
+        finally:
+            self.saver_pool.put(data_saver)
+
+        return {
+            'pk_count': int(totals[0]),
+            'amounts': {field: round(total, 2) for field, total in zip(fields, totals[1:])},
+        }
+
+    def local_matches(self, task_name: str, month: str, upstream_rows: int, fingerprint: Dict[str, Any],
+                      pk_values: Optional[List[str]] = None) -> bool:
+        """
+        本地表该月数据是否与上游一致：主键数等于上游总条数（扣除上游重复主键的行），金额合计与指纹一致
+
+        Args:
+            task_name: 任务名称
+            month: 月份（YYYYMM）
+            upstream_rows: 上游该月的总条数
+            fingerprint: 上游该月数据的指纹（提供重复主键数和金额合计）
+            pk_values: 上游该月数据的主键值（表未配置日期字段时按主键核对本地数据）
+
+        Returns:
+            一致返回True；不一致或无法统计本地数据时返回False（由调用方重新请求或写库）
+        """
+        amounts = fingerprint.get('amounts', {})
+        local = self.local_month_stats(task_name, month, list(amounts), pk_values)
+        if local is None:
+            return False
+
+        duplicate_rows = fingerprint.get('rows', 0) - fingerprint.get('pk_count', 0)
+        expected_pk_count = upstream_rows - duplicate_rows
+        if local['pk_count'] != expected_pk_count:
+            self.logger.log_warning(
+                f"回填 {month} {task_name} 本地表有 {local['pk_count']} 个主键，上游应为 {expected_pk_count} 个")
+            return False
+        for field, total in local['amounts'].items():
+            if abs(total - amounts[field]) > self.AMOUNT_TOLERANCE:
+                self.logger.log_warning(
+                    f"回填 {month} {task_name} 本地表 {field} 合计 {total}，上游为 {amounts[field]}")
+                return False
+        return True
+
+    def verify_local_tables(self) -> None:
+        """
+        核对本地数据表：表中行数少于指纹记录的单月主键数时（表被清空或数据丢失），
+        删除该表对应API的指纹，使其所有月份重新写库
+        """
+        max_pk_counts: Dict[str, int] = {}
+        for key, fingerprint in self.fingerprints.items():
+            task_name = key.split('|', 1)[1]
+            max_pk_counts[task_name] = max(max_pk_counts.get(task_name, 0), fingerprint.get('pk_count', 0))
+
+        db_operator = self.fetcher.db_operator
+        for task_name, max_pk_count in max_pk_counts.items():
+            table_name = DataSaver.API_TABLE_MAPPING.get(task_name)
+            if not table_name:
+                continue
+            result = db_operator.execute_query(f"SELECT COUNT(*) FROM `{table_name}`")
+            if not result:
+                continue
+            local_rows = result[0][0]
+            if local_rows < max_pk_count:
+                self.logger.log_warning(
+                    f"表 {table_name} 仅有 {local_rows} 行，少于指纹记录的 {max_pk_count} 行，{task_name} 所有月份重新写库")
+                for key in [key for key in self.fingerprints if key.split('|', 1)[1] == task_name]:
+                    self.state_store.delete(f"{self.FINGERPRINT_PREFIX}{key}")
+                    self.fingerprints.pop(key)
+
+    @staticmethod
+    def is_delete_log(task_name: str) -> bool:
+        """API是否写入删除日志表（先清空再插入，需要合并所有月份后写库）"""
+        return DataSaver.API_TABLE_MAPPING.get(task_name) == 'delete_log'
+
+    def plan_units(self) -> List[Tuple[str, str, Dict[str, Any]]]:
+        """
+        生成尚未完成的回填单元（按月份优先排列，同一时间各线程分散在不同API/表上）
+
+        删除日志的单元始终重新请求：合并写库时会清空表，需要所有月份的数据。
+
+        Returns:
+            (月份, 任务名, API配置) 列表
+        """
+        units = []
+        for month in self.months:
+            for task_name, api_config in DataCenter.get_apis(month).items():
+                if self.is_delete_log(task_name) or self.unit_key(month, task_name) not in self.completed:
+                    units.append((month, task_name, api_config))
+        return units
+
+    def load_checkpoint(self) -> bool:
+        """
+        读取检查点
+
+        Returns:
+            存在未过期的检查点（本次为续跑）返回True，否则返回False
+        """
+        if not os.path.exists(self.CHECKPOINT_PATH):
+            return False
+        try:
+            with open(self.CHECKPOINT_PATH, 'r', encoding='utf-8') as f:
+                checkpoint = json.load(f)
+            started_at = datetime.strptime(checkpoint['started_at'], '%Y-%m-%d %H:%M:%S')
+        except Exception as e:
+            self.logger.log_warning(f"检查点文件无法读取，重新全量回填: {str(e)}")
+            return False
+
+        age_hours = (datetime.now() - started_at).total_seconds() / 3600
+        if age_hours > self.CHECKPOINT_MAX_AGE_HOURS:
+            self.logger.log_info(f"检查点已过期（{age_hours:.1f}小时前开始），重新全量回填")
+            return False
+
+        self.started_at = started_at
+        self.completed = checkpoint.get('completed', {})
+        self.logger.log_info(f"从检查点续跑，已完成 {len(self.completed)} 个回填单元")
+        return True
+
+    def save_checkpoint(self) -> None:
+        """写入检查点（先写临时文件再替换，避免中断时留下不完整的文件）"""
+        checkpoint = {
+            'started_at': self.started_at.strftime('%Y-%m-%d %H:%M:%S'),
+            'completed': self.completed,
+            'failed': self.failed,
+        }
+        temp_path = f"{self.CHECKPOINT_PATH}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(checkpoint, f, ensure_ascii=False, indent=2)
+        os.replace(temp_path, self.CHECKPOINT_PATH)
+
+    def run_unit(self, month: str, task_name: str,
+                 api_config: Dict[str, Any]) -> Tuple[int, str, Dict[str, Any]]:
+        """
+        执行单个回填单元：请求该API该月的全部数据并写库（对账模式下指纹未变化时不写库）
+
+        Returns:
+            影响的行数、处理结果（probe_match-总条数一致未请求、unchanged-指纹一致未写库、reloaded-已写库、
+            deferred-删除日志等待合并写库）和指纹
+        """
+        key = self.unit_key(month, task_name)
+
+        # 删除日志只请求数据，由 write_delete_logs 在所有单元完成后合并写库
+        if self.is_delete_log(task_name):
+            data_list = self.fetcher.fetch_single_api(task_name, api_config)[task_name]
+            with self.checkpoint_lock:
+                self.delete_log_rows[key] = data_list
+            self.logger.log_info(f"回填 {month} {task_name} 获取{len(data_list)}条数据，等待合并写库")
+            return 0, 'deferred', self.compute_fingerprint(task_name, data_list)
+
+        stored = self.fingerprints.get(key) if self.reconcile else None
+
+        # 已冻结的月份只核对总条数（与指纹和本地表该月数据比较）
+        if stored is not None and self.is_frozen(month):
+            total = self.fetcher.probe_total(task_name, api_config)
+            if total is not None and total == stored.get('rows') and self.local_matches(task_name, month, total, stored):
+                self.logger.log_info(f"回填 {month} {task_name} 已冻结，总条数 {total} 与指纹和本地表一致，跳过")
+                return 0, 'probe_match', stored
+
+        result = self.fetcher.fetch_single_api(task_name, api_config)
+        data_list = result[task_name]
+        fingerprint = self.compute_fingerprint(task_name, data_list)
+        if (stored is not None and stored == fingerprint
+                and self.local_matches(task_name, month, len(data_list), fingerprint,
+                                       self.primary_key_values(task_name, data_list))):
+            self.logger.log_info(f"回填 {month} {task_name} 指纹一致（{len(data_list)}条数据），不写库")
+            return 0, 'unchanged', fingerprint
+
+        data_saver = self.saver_pool.get()
+        try:
+            affected = data_saver.save_data(task_name, data_list)
+            # 该月无数据不算失败
+            if data_saver.get_last_error() and data_list:
+                raise Exception(f"数据保存失败: {data_saver.get_last_error()}")
+        finally:
+            self.saver_pool.put(data_saver)
+
+        self.logger.log_info(f"回填 {month} {task_name} 完成，获取{len(data_list)}条数据，影响 {affected} 行")
+        return affected, 'reloaded', fingerprint
+
+    def run(self) -> Dict[str, Any]:
+        """
+        在线程池中执行所有未完成的回填单元
+
+        Returns:
+            回填结果统计
+        """
+        if self.reconcile:
+            self.verify_local_tables()
+        units = self.plan_units()
+        self.logger.log_info(f"共 {len(units)} 个待回填单元（{len(self.months)} 个月），线程数 {self.workers}，"
+                             f"{'对账模式' if self.reconcile else '全量模式'}")
+        total_affected = 0
+        deferred: Dict[str, Dict[str, Any]] = {}
+        with self.checkpoint_lock:
+            self.save_checkpoint()
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            future_to_unit = {
+                executor.submit(self.run_unit, month, task_name, api_config): (month, task_name)
+                for month, task_name, api_config in units
+            }
+            for future in as_completed(future_to_unit):
+                month, task_name = future_to_unit[future]
+                key = self.unit_key(month, task_name)
+                try:
+                    affected, status, fingerprint = future.result()
+                    if status == 'deferred':
+                        deferred[key] = fingerprint
+                        continue
+                    total_affected += affected
+                    self.status_counts[status] = self.status_counts.get(status, 0) + 1
+                    self.save_fingerprint(key, fingerprint)
+                    with self.checkpoint_lock:
+                        self.completed[key] = affected
+                        self.failed.pop(key, None)
+                        self.save_checkpoint()
+                except Exception as e:
+                    error_msg = f"回填 {month} {task_name} 失败: {str(e)}"
+                    self.logger.log_error(error_msg)
+                    with self.checkpoint_lock:
+                        self.failed[key] = str(e)
+                        self.save_checkpoint()
+
+        total_affected += self.write_delete_logs(deferred)
+
+        # 全部完成后删除检查点，下次重新全量回填
+        if not self.failed and os.path.exists(self.CHECKPOINT_PATH):
+            os.remove(self.CHECKPOINT_PATH)
+
+        return {
+            'total_units': len(units),
+            'successful_units': len(units) - len(self.failed),
+            'failed_units': list(self.failed),
+            'total_affected': total_affected,
+            'probe_match_units': self.status_counts.get('probe_match', 0),
+            'unchanged_units': self.status_counts.get('unchanged', 0),
+            'reloaded_units': self.status_counts.get('reloaded', 0),
+        }
+
+    def write_delete_logs(self, deferred: Dict[str, Dict[str, Any]]) -> int:
+        """
+        合并删除日志各月份的数据，一次写库（写库会先清空表）
+
+        有月份请求失败时不写库，避免清空表后只写入部分月份，这些单元记为失败，下次续跑时重新请求。
+
+        Args:
+            deferred: 等待合并写库的回填单元键到指纹的映射
+
+        Returns:
+            影响的行数
+        """
+        if not deferred:
+            return 0
+
+        failed_keys = [key for key in self.failed if self.is_delete_log(key.split('|', 1)[1])]
+        error = None
+        affected = 0
+        if failed_keys:
+            error = f"删除日志 {', '.join(failed_keys)} 请求失败，未写库"
+        else:
+            keys = sorted(deferred)
+            unit_rows = {key: len(self.delete_log_rows.get(key, [])) for key in keys}
+            data_list = [item for key in keys for item in self.delete_log_rows.get(key, [])]
+            data_saver = self.saver_pool.get()
+            try:
+                affected = data_saver.save_data(keys[0].split('|', 1)[1], data_list)
+                if data_saver.get_last_error() and data_list:
+                    error = f"删除日志合并写库失败: {data_saver.get_last_error()}"
+            finally:
+                self.saver_pool.put(data_saver)
+        self.delete_log_rows.clear()
+
+        if error:
+            self.logger.log_error(error)
+            with self.checkpoint_lock:
+                for key in deferred:
+                    self.failed[key] = error
+                self.save_checkpoint()
+            return 0
+
+        self.logger.log_info(f"删除日志合并 {len(deferred)} 个单元写库完成，影响 {affected} 行")
+        with self.checkpoint_lock:
+            for key, fingerprint in deferred.items():
+                self.save_fingerprint(key, fingerprint)
+                self.completed[key] = unit_rows[key]
+                self.failed.pop(key, None)
+                self.status_counts['reloaded'] = self.status_counts.get('reloaded', 0) + 1
+            self.save_checkpoint()
+        return affected
+
+    def close(self) -> None:
+        """关闭资源"""
+        self.fetcher.close()
+        for db_operator in self.db_operators:
+            db_operator.close()
 
 
 def clear_database_tables():
@@ -843,59 +1469,30 @@ def clear_database_tables():
 
 # 程序入口
 if __name__ == "__main__":
-    # 设置是否先清空数据（默认True，即先清空再同步）
-    CLEAR_DATA_FIRST = True
+    # 默认按月份指纹对账，只写入有变化的月份；传入 --full 时先清空数据表再全量回填
+    FULL_RELOAD = '--full' in sys.argv[1:]
 
     # 记录开始时间
     total_start_time = datetime.now()
 
+    planner = None
     try:
-        # 第一步：清空数据库中的所有相关表
-        if CLEAR_DATA_FIRST:
+        planner = MonthBackfillPlanner(reconcile=not FULL_RELOAD)
+        resuming = planner.load_checkpoint()
+
+        # 第一步：全量模式下清空数据库中的所有相关表（从检查点续跑时不清空）
+        if FULL_RELOAD and not resuming:
             clear_results = clear_database_tables()
+            planner.clear_fingerprints()
 
             # 如果有表清空失败，可以决定是否继续执行
             failed_tables = [table for table, success in clear_results.items() if not success]
             if failed_tables:
                 print(f"警告: {len(failed_tables)} 个表清空失败，但将继续执行数据同步")
 
-        # 第二步：循环每个月下载并插入数据
+        # 第二步：按 (月份, API) 单元并发回填
         print("\n开始下载并插入每个月的数据...")
-        current_year = datetime.now().year
-        current_month = datetime.now().month
-
-        total_months = 0
-        successful_months = 0
-        failed_months = []
-
-        for year in range(2025, current_year + 1):
-            for month in range(1, 13 if year < current_year else current_month + 1):
-                total_months += 1
-                time_option = f"{year}{month:02d}"
-                print(f"\n{'=' * 60}")
-                print(f"开始同步 {year}年{month:02d}月 的数据")
-                print(f"{'=' * 60}")
-
-                sync_manager = None
-                try:
-                    sync_manager = DataSyncManager(time_option=time_option)
-                    sync_manager.run_apis()
-                    successful_months += 1
-                    print(f"\n{year}年{month:02d}月 数据同步完成")
-                except Exception as e:
-                    error_msg = f"{year}年{month:02d}月 数据同步失败: {str(e)}"
-                    print(error_msg)
-                    failed_months.append(f"{year}年{month:02d}月")
-                    send_wechat_notification(error_msg)
-                finally:
-                    if sync_manager:
-                        sync_manager.close()
-                        sync_manager = None
-
-                print(f"{'=' * 60}\n")
-
-                # 添加延迟，避免请求过于频繁
-                sleep(2)
+        result = planner.run()
 
         # 第三步：发送总体验收通知
         total_end_time = datetime.now()
@@ -906,17 +1503,25 @@ if __name__ == "__main__":
             f"总开始时间: {total_start_time.strftime('%Y-%m-%d %H:%M:%S')}\n"
             f"总完成时间: {total_end_time.strftime('%Y-%m-%d %H:%M:%S')}\n"
             f"总耗时: {total_duration:.2f}秒\n"
-            f"总共处理: {total_months} 个月份\n"
-            f"成功月份: {successful_months} 个\n"
-            f"失败月份: {len(failed_months)} 个\n"
+            f"同步模式: {'全量回填' if FULL_RELOAD else '指纹对账'}\n"
+            f"本次回填单元: {result['total_units']} 个\n"
+            f"成功单元: {result['successful_units']} 个\n"
+            f"失败单元: {len(result['failed_units'])} 个\n"
+            f"冻结月份核对一致: {result['probe_match_units']} 个\n"
+            f"指纹一致未写库: {result['unchanged_units']} 个\n"
+            f"重新写库: {result['reloaded_units']} 个\n"
+            f"总影响行数: {result['total_affected']}\n"
         )
 
-        if failed_months:
-            notification_content += f"失败的月份: {', '.join(failed_months)}"
+        if result['failed_units']:
+            notification_content += f"失败的单元（再次运行时从检查点续跑）: {', '.join(result['failed_units'])}"
 
         send_wechat_notification(notification_content)
 
     except Exception as e:
         error_msg = f"数据同步主程序异常: {str(e)}"
         print(error_msg)
-        send_wechat_notification(error_msg)
\ No newline at end of file
+        send_wechat_notification(error_msg)
+    finally:
+        if planner:
+            planner.close()
\ No newline at end of file
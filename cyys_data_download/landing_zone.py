@@ -0,0 +1,256 @@
+from common_code import WriteLog, decode_json, orjson
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple, Any, Iterator
+import threading
+import shutil
+import gzip
+import io
+import json
+import os
+
+try:
+    # 可选依赖：zstandard 压缩率和速度都优于 gzip，未安装时使用 gzip
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+def encode_json_line(record: Dict[str, Any]) -> bytes:
+    """把一条记录编码为 NDJSON 的一行（优先使用 orjson）"""
+    if orjson is not None:
+        return orjson.dumps(record) + b'\n'
+    return json.dumps(record, ensure_ascii=False).encode('utf-8') + b'\n'
+
+
+class LandingStream:
+    """
+    单个API一次运行的落地文件
+
+    先写入临时文件，commit 后才改名为正式文件，回放时只读取正式文件，
+    因此请求失败或中途重试的运行不会被回放。写入失败只记录日志，不影响同步。
+    """
+
+    def __init__(self, final_path: str, compression: str):
+        self.final_path = final_path
+        self.temp_path = f"{final_path}.tmp"
+        self.logger = WriteLog()
+        self.lock = threading.Lock()
+        self.pages = 0
+        self.failed = False
+        self.closed = False
+        os.makedirs(os.path.dirname(final_path), exist_ok=True)
+        self.raw = open(self.temp_path, 'wb')
+        if compression == 'zstd':
+            self.writer = zstandard.ZstdCompressor(level=LandingZone.ZSTD_LEVEL).stream_writer(self.raw)
+        else:
+            self.writer = gzip.GzipFile(fileobj=self.raw, mode='wb', compresslevel=LandingZone.GZIP_LEVEL)
+
+    def write_page(self, page_number: int, body: Any) -> None:
+        """
+        写入一页原始响应
+
+        Args:
+            page_number: 页码
+            body: 接口响应的 data 部分
+        """
+        if self.failed:
+            return
+        line = encode_json_line({
+            'page': page_number,
+            'fetched_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'body': body,
+        })
+        with self.lock:
+            if self.closed:
+                return
+            try:
+                self.writer.write(line)
+                self.pages += 1
+            except Exception as e:
+                self.failed = True
+                self.logger.log_warning(f"落地文件写入失败 {self.temp_path}: {str(e)}")
+
+    def _close(self) -> None:
+        with self.lock:
+            if self.closed:
+                return
+            self.closed = True
+            try:
+                self.writer.close()
+            finally:
+                if not self.raw.closed:
+                    self.raw.close()
+
+    def commit(self) -> Optional[str]:
+        """
+        完成写入并改名为正式文件
+
+        Returns:
+            正式文件路径，写入失败或没有数据时返回None
+        """
+        try:
+            self._close()
+        except Exception as e:
+            self.failed = True
+            self.logger.log_warning(f"落地文件关闭失败 {self.temp_path}: {str(e)}")
+        if self.failed or not self.pages:
+            self.abort()
+            return None
+        try:
+            os.replace(self.temp_path, self.final_path)
+        except OSError as e:
+            self.failed = True
+            self.logger.log_warning(f"落地文件改名失败 {self.temp_path}: {str(e)}")
+            self.abort()
+            return None
+        return self.final_path
+
+    def abort(self) -> None:
+        """放弃本次写入，删除临时文件"""
+        try:
+            self._close()
+        except Exception:
+            pass
+        try:
+            if os.path.exists(self.temp_path):
+                os.remove(self.temp_path)
+        except OSError as e:
+            self.logger.log_warning(f"落地临时文件删除失败 {self.temp_path}: {str(e)}")
+
+
+class LandingZone:
+    """
+    接口原始响应落地区（本地压缩 NDJSON，按API和日期分区）
+
+    目录结构：<root>/api=<API名称>/date=<YYYY-MM-DD>/<运行ID>.ndjson.zst（未安装 zstandard 时为 .ndjson.gz），
+    每行是一页原始响应 {"page": 页码, "fetched_at": 获取时间, "body": 响应的 data 部分}。
+    示例：
+    zone = LandingZone(r'E:\\powerbi_data\\data\\cyy_landing')
+    stream = zone.open_stream('按揭业务', run_id='083000_1234')
+    stream.write_page(1, body)
+    stream.commit()
+    for page_number, body in zone.iter_pages(zone.list_files('按揭业务')):
+        ...
+    """
+
+    FILE_SUFFIXES = {'zstd': '.ndjson.zst', 'gzip': '.ndjson.gz'}
+    ZSTD_LEVEL = 3
+    GZIP_LEVEL = 6
+    DATE_FORMAT = '%Y-%m-%d'
+
+    def __init__(self, root_dir: str, compression: Optional[str] = None):
+        """
+        Args:
+            root_dir: 落地区根目录
+            compression: 压缩方式 zstd/gzip，默认已安装 zstandard 时用 zstd，否则用 gzip
+        """
+        if compression is None:
+            compression = 'zstd' if zstandard is not None else 'gzip'
+        if compression not in self.FILE_SUFFIXES:
+            raise ValueError(f"不支持的压缩方式: {compression}")
+        if compression == 'zstd' and zstandard is None:
+            raise ValueError("未安装 zstandard，无法使用 zstd 压缩")
+        self.root_dir = root_dir
+        self.compression = compression
+        self.logger = WriteLog()
+
+    @staticmethod
+    def _safe_name(api_name: str) -> str:
+        return ''.join('_' if char in '\\/:*?"<>|' else char for char in api_name)
+
+    def api_dir(self, api_name: str) -> str:
+        return os.path.join(self.root_dir, f"api={self._safe_name(api_name)}")
+
+    def open_stream(self, api_name: str, run_id: str, day: Optional[str] = None) -> LandingStream:
+        """
+        打开一个API本次运行的落地文件
+
+        Args:
+            api_name: API名称
+            run_id: 运行ID（同一日期内按字典序即时间顺序）
+            day: 日期分区，默认今天
+        """
+        day = day or datetime.now().strftime(self.DATE_FORMAT)
+        file_name = f"{run_id}{self.FILE_SUFFIXES[self.compression]}"
+        return LandingStream(os.path.join(self.api_dir(api_name), f"date={day}", file_name), self.compression)
+
+    def list_dates(self, api_name: str) -> List[str]:
+        """API已有的日期分区（升序）"""
+        api_dir = self.api_dir(api_name)
+        if not os.path.isdir(api_dir):
+            return []
+        return sorted(name[len('date='):] for name in os.listdir(api_dir) if name.startswith('date='))
+
+    def list_files(self, api_name: str, date_from: Optional[str] = None,
+                   date_to: Optional[str] = None) -> List[Tuple[str, str]]:
+        """
+        列出API在日期范围内已提交的落地文件
+
+        Args:
+            api_name: API名称
+            date_from: 起始日期（含），默认不限
+            date_to: 结束日期（含），默认不限
+
+        Returns:
+            (日期, 文件路径) 列表，按时间先后排序
+        """
+        files = []
+        for day in self.list_dates(api_name):
+            if (date_from and day < date_from) or (date_to and day > date_to):
+                continue
+            day_dir = os.path.join(self.api_dir(api_name), f"date={day}")
+            for file_name in sorted(os.listdir(day_dir)):
+                if file_name.endswith(tuple(self.FILE_SUFFIXES.values())):
+                    files.append((day, os.path.join(day_dir, file_name)))
+        return files
+
+    @staticmethod
+    def _open_reader(path: str):
+        if path.endswith(LandingZone.FILE_SUFFIXES['zstd']):
+            if zstandard is None:
+                raise ValueError(f"未安装 zstandard，无法读取 {path}")
+            return io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(open(path, 'rb'), closefd=True))
+        return gzip.open(path, 'rb')
+
+    def iter_pages(self, files: List[Tuple[str, str]]) -> Iterator[Tuple[int, Any]]:
+        """
+        逐页读取落地文件
+
+        Args:
+            files: list_files 返回的文件列表
+
+        Yields:
+            (页码, 响应的 data 部分)
+        """
+        for _, path in files:
+            with self._open_reader(path) as reader:
+                for line in reader:
+                    if line.strip():
+                        record = decode_json(line)
+                        yield record['page'], record['body']
+
+    def prune(self, keep_days: int) -> int:
+        """
+        删除超过保留天数的日期分区
+
+        Args:
+            keep_days: 保留天数
+
+        Returns:
+            删除的分区数
+        """
+        if not os.path.isdir(self.root_dir):
+            return 0
+        cutoff = (datetime.now() - timedelta(days=keep_days)).strftime(self.DATE_FORMAT)
+        removed = 0
+        for api_dir_name in os.listdir(self.root_dir):
+            api_dir = os.path.join(self.root_dir, api_dir_name)
+            if not api_dir_name.startswith('api=') or not os.path.isdir(api_dir):
+                continue
+            for day_dir_name in os.listdir(api_dir):
+                if day_dir_name.startswith('date=') and day_dir_name[len('date='):] < cutoff:
+                    shutil.rmtree(os.path.join(api_dir, day_dir_name), ignore_errors=True)
+                    removed += 1
+        if removed:
+            self.logger.log_info(f"落地区已清理 {removed} 个过期日期分区")
+        return removed
@@ -0,0 +1,94 @@
+from common_code import WriteLog
+from datetime import datetime
+from typing import Dict, List, Optional, Any
+import json
+
+
+class PollingPolicy:
+    """
+    按数据变化频率决定各API的轮询间隔（状态保存在 sync_state 表中）
+
+    每次同步后记录API是否有数据变化（影响行数大于0），用指数加权平均估计每次轮询的变化概率，
+    轮询间隔 = 基础间隔 / 变化概率，限制在 [基础间隔, 最长间隔] 之间：变化频繁的API每个周期都轮询，
+    长期不变的API逐渐降低频率，但任何API都不会超过最长间隔（最低新鲜度）不轮询。
+    示例：
+    policy = PollingPolicy(state_store, base_minutes=30, max_staleness_minutes=120)
+    due_apis = policy.due(['按揭业务', '调车结算查询'])
+    policy.observe('按揭业务', changed=True)
+    """
+
+    STATE_PREFIX = 'poll:'
+    TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+    # 变化概率的平滑系数（越大越看重最近几次轮询）
+    SMOOTHING = 0.3
+    # 变化概率下限，避免间隔无限增长
+    MIN_CHANGE_RATE = 0.05
+
+    def __init__(self, state_store, base_minutes: float = 30, max_staleness_minutes: float = 120):
+        """
+        Args:
+            state_store: 同步状态存储对象（SyncStateStore）
+            base_minutes: 基础轮询间隔（调度周期，分钟）
+            max_staleness_minutes: 最长轮询间隔（每个API至少每隔该时长同步一次，分钟）
+        """
+        if base_minutes <= 0 or max_staleness_minutes < base_minutes:
+            raise ValueError("base_minutes 必须大于0且不大于 max_staleness_minutes")
+        self.state_store = state_store
+        self.base_minutes = float(base_minutes)
+        self.max_staleness_minutes = float(max_staleness_minutes)
+        self.logger = WriteLog()
+        self.states: Dict[str, Dict[str, Any]] = self.load()
+
+    def load(self) -> Dict[str, Dict[str, Any]]:
+        """读取各API的轮询状态"""
+        states = {}
+        for api_name, value in self.state_store.get_all(self.STATE_PREFIX).items():
+            try:
+                states[api_name] = json.loads(value)
+            except (TypeError, ValueError):
+                self.logger.log_warning(f"{api_name} 轮询状态无法解析，按需立即轮询")
+        return states
+
+    def interval_minutes(self, api_name: str) -> float:
+        """API当前的轮询间隔（分钟）"""
+        state = self.states.get(api_name)
+        if not state:
+            return self.base_minutes
+        change_rate = max(float(state.get('change_rate', 1.0)), self.MIN_CHANGE_RATE)
+        return min(self.max_staleness_minutes, max(self.base_minutes, self.base_minutes / change_rate))
+
+    def is_due(self, api_name: str, now: Optional[datetime] = None) -> bool:
+        """
+        API本周期是否需要轮询
+
+        调度时间有抖动，距上次轮询的时长只要超过间隔减去半个基础周期即视为到期。
+        """
+        state = self.states.get(api_name)
+        if not state or not state.get('last_polled'):
+            return True
+        try:
+            last_polled = datetime.strptime(state['last_polled'], self.TIME_FORMAT)
+        except ValueError:
+            return True
+        elapsed = ((now or datetime.now()) - last_polled).total_seconds() / 60
+        return elapsed >= self.interval_minutes(api_name) - self.base_minutes / 2
+
+    def due(self, api_names: List[str], now: Optional[datetime] = None) -> List[str]:
+        """筛选本周期需要轮询的API"""
+        return [api_name for api_name in api_names if self.is_due(api_name, now)]
+
+    def observe(self, api_name: str, changed: bool, polled_at: Optional[datetime] = None) -> None:
+        """
+        记录一次成功的轮询结果并保存
+
+        Args:
+            api_name: API名称
+            changed: 本次是否有数据变化
+            polled_at: 轮询开始时间，默认当前时间
+        """
+        state = self.states.get(api_name) or {'change_rate': 1.0}
+        change_rate = float(state.get('change_rate', 1.0))
+        state['change_rate'] = round(self.SMOOTHING * (1.0 if changed else 0.0) + (1 - self.SMOOTHING) * change_rate, 4)
+        state['last_polled'] = (polled_at or datetime.now()).strftime(self.TIME_FORMAT)
+        self.states[api_name] = state
+        self.state_store.set(f"{self.STATE_PREFIX}{api_name}", json.dumps(state))
@@ -0,0 +1,262 @@
+from typing import Dict, List, Optional, Any
+from datetime import datetime, timedelta
+import threading
+import json
+import os
+
+
+class ApiMetrics:
+    """单个API在一次同步中的统计数据"""
+
+    def __init__(self, bucket_count: int):
+        self.requests = 0
+        self.failed_requests = 0
+        self.retries = 0
+        self.pages = 0
+        self.rows = 0
+        self.bytes = 0
+        self.latency_sum = 0.0
+        self.latency_buckets = [0] * bucket_count  # 各区间计数（非累计），最后一个为 +Inf
+        self.retry_sleep_seconds = 0.0
+        self.throttle_wait_seconds = 0.0
+        self.encode_seconds = 0.0
+        self.write_seconds = 0.0
+        self.rows_written = 0
+        self.affected_rows = 0
+
+
+class SyncMetrics:
+    """
+    同步运行指标收集类（线程安全）
+    按API记录请求数、页数、行数、字节数、请求耗时分布、重试、等待时间、编码耗时和写库速度，
+    运行结束时输出JSON报告和 Prometheus textfile（供 node_exporter textfile collector 采集）；
+    textfile 每次运行覆盖，各指标都是本次运行的值，因此按 gauge 输出
+    示例：
+    metrics = SyncMetrics('cyy_to_mysql_99')
+    metrics.observe_request('按揭业务', latency=0.8, size=52341)
+    metrics.observe_page('按揭业务', rows=3000)
+    metrics.observe_write('按揭业务', rows=3000, affected=12, seconds=0.4)
+    metrics.write_report(r'E:\\powerbi_data\\data\\cyy_metrics')
+    metrics.prune_reports(r'E:\\powerbi_data\\data\\cyy_metrics', keep_days=30)
+    """
+
+    # 请求耗时直方图的区间上限（秒）
+    LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+    # Prometheus 指标名前缀
+    METRIC_PREFIX = 'cyy_sync'
+    # JSON报告文件名中的时间格式
+    REPORT_TIME_FORMAT = '%Y%m%d_%H%M%S'
+
+    def __init__(self, run_name: str):
+        """
+        Args:
+            run_name: 运行名称（报告文件名和 Prometheus job 标签）
+        """
+        self.run_name = run_name
+        self.started_at = datetime.now()
+        self.finished_at: Optional[datetime] = None
+        self.apis: Dict[str, ApiMetrics] = {}
+        self._lock = threading.Lock()
+
+    def _api(self, api_name: str) -> ApiMetrics:
+        api = self.apis.get(api_name)
+        if api is None:
+            api = self.apis[api_name] = ApiMetrics(len(self.LATENCY_BUCKETS) + 1)
+        return api
+
+    def observe_request(self, api_name: str, latency: float, size: int = 0, success: bool = True) -> None:
+        """记录一次HTTP请求（耗时、响应字节数、是否成功）"""
+        index = next((i for i, bound in enumerate(self.LATENCY_BUCKETS) if latency <= bound), len(self.LATENCY_BUCKETS))
+        with self._lock:
+            api = self._api(api_name)
+            api.requests += 1
+            api.bytes += size
+            api.latency_sum += latency
+            api.latency_buckets[index] += 1
+            if not success:
+                api.failed_requests += 1
+
+    def observe_retry(self, api_name: str, sleep_seconds: float) -> None:
+        """记录一次重试及重试前的等待时间"""
+        with self._lock:
+            api = self._api(api_name)
+            api.retries += 1
+            api.retry_sleep_seconds += sleep_seconds
+
+    def observe_throttle_wait(self, api_name: str, seconds: float) -> None:
+        """记录在限流器上等待的时间"""
+        if seconds <= 0:
+            return
+        with self._lock:
+            self._api(api_name).throttle_wait_seconds += seconds
+
+    def observe_page(self, api_name: str, rows: int) -> None:
+        """记录获取到的一页数据"""
+        with self._lock:
+            api = self._api(api_name)
+            api.pages += 1
+            api.rows += rows
+
+    def observe_encode(self, api_name: str, seconds: float) -> None:
+        """记录展平和类型转换耗时"""
+        with self._lock:
+            self._api(api_name).encode_seconds += seconds
+
+    def observe_write(self, api_name: str, rows: int, affected: int, seconds: float) -> None:
+        """记录一次写库（包含编码）的行数、影响行数和耗时"""
+        with self._lock:
+            api = self._api(api_name)
+            api.rows_written += rows
+            api.affected_rows += affected
+            api.write_seconds += seconds
+
+    def finish(self) -> None:
+        """标记运行结束"""
+        self.finished_at = datetime.now()
+
+    def report(self) -> Dict[str, Any]:
+        """
+        生成运行报告
+
+        Returns:
+            包含运行信息和各API指标的字典
+        """
+        finished_at = self.finished_at or datetime.now()
+        apis = {}
+        with self._lock:
+            for api_name, api in sorted(self.apis.items()):
+                cumulative = 0
+                histogram = {}
+                for bound, count in zip(list(self.LATENCY_BUCKETS) + ['+Inf'], api.latency_buckets):
+                    cumulative += count
+                    histogram[str(bound)] = cumulative
+                apis[api_name] = {
+                    'requests': api.requests,
+                    'failed_requests': api.failed_requests,
+                    'retries': api.retries,
+                    'pages': api.pages,
+                    'rows': api.rows,
+                    'bytes': api.bytes,
+                    'latency_avg_seconds': round(api.latency_sum / api.requests, 4) if api.requests else 0,
+                    'latency_sum_seconds': round(api.latency_sum, 4),
+                    'latency_histogram': histogram,
+                    'retry_sleep_seconds': round(api.retry_sleep_seconds, 4),
+                    'throttle_wait_seconds': round(api.throttle_wait_seconds, 4),
+                    'encode_seconds': round(api.encode_seconds, 4),
+                    'write_seconds': round(api.write_seconds, 4),
+                    'rows_written': api.rows_written,
+                    'affected_rows': api.affected_rows,
+                    'rows_per_second_written': round(api.rows_written / api.write_seconds, 2) if api.write_seconds else 0,
+                }
+        return {
+            'run_name': self.run_name,
+            'started_at': self.started_at.strftime('%Y-%m-%d %H:%M:%S'),
+            'finished_at': finished_at.strftime('%Y-%m-%d %H:%M:%S'),
+            'duration_seconds': round((finished_at - self.started_at).total_seconds(), 3),
+            'apis': apis,
+        }
+
+    @staticmethod
+    def _label(value: str) -> str:
+        return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+    def prometheus_text(self) -> str:
+        """生成 Prometheus 文本格式的指标"""
+        report = self.report()
+        job = self._label(self.run_name)
+        prefix = self.METRIC_PREFIX
+        # 各值只是最近一次运行的统计（下次运行会变小），不是单调递增的计数器
+        gauges = [
+            ('requests', 'last_run_requests', '最近一次运行的HTTP请求数'),
+            ('failed_requests', 'last_run_failed_requests', '最近一次运行失败的HTTP请求数'),
+            ('retries', 'last_run_retries', '最近一次运行的重试次数'),
+            ('pages', 'last_run_pages', '最近一次运行获取的页数'),
+            ('rows', 'last_run_rows_fetched', '最近一次运行获取的行数'),
+            ('bytes', 'last_run_response_bytes', '最近一次运行的响应字节数'),
+            ('retry_sleep_seconds', 'last_run_retry_sleep_seconds', '最近一次运行的重试等待秒数'),
+            ('throttle_wait_seconds', 'last_run_throttle_wait_seconds', '最近一次运行的限流器等待秒数'),
+            ('encode_seconds', 'last_run_encode_seconds', '最近一次运行的展平和类型转换秒数'),
+            ('write_seconds', 'last_run_write_seconds', '最近一次运行的写库秒数'),
+            ('rows_written', 'last_run_rows_written', '最近一次运行提交写库的行数'),
+            ('affected_rows', 'last_run_affected_rows', '最近一次运行的数据库影响行数'),
+            ('rows_per_second_written', 'last_run_rows_per_second_written', '最近一次运行的写库速度（行/秒）'),
+            ('latency_sum_seconds', 'last_run_request_latency_seconds_sum', '最近一次运行的HTTP请求耗时合计秒数'),
+        ]
+
+        lines: List[str] = []
+        for key, name, help_text in gauges:
+            lines.append(f"# HELP {prefix}_{name} {help_text}")
+            lines.append(f"# TYPE {prefix}_{name} gauge")
+            for api_name, api in report['apis'].items():
+                lines.append(f'{prefix}_{name}{{job="{job}",api="{self._label(api_name)}"}} {api[key]}')
+
+        # 耗时分布同样只是本次运行的统计，按 le 标签输出各区间的累计请求数（请求总数即 last_run_requests）
+        name = f"{prefix}_last_run_request_latency_seconds_le"
+        lines.append(f"# HELP {name} 最近一次运行耗时不超过 le 秒的HTTP请求数")
+        lines.append(f"# TYPE {name} gauge")
+        for api_name, api in report['apis'].items():
+            labels = f'job="{job}",api="{self._label(api_name)}"'
+            for bound, count in api['latency_histogram'].items():
+                lines.append(f'{name}{{{labels},le="{bound}"}} {count}')
+
+        lines.append(f"# HELP {prefix}_last_run_duration_seconds 最近一次运行耗时")
+        lines.append(f"# TYPE {prefix}_last_run_duration_seconds gauge")
+        lines.append(f'{prefix}_last_run_duration_seconds{{job="{job}"}} {report["duration_seconds"]}')
+        lines.append(f"# HELP {prefix}_last_run_timestamp_seconds 最近一次运行结束时间")
+        lines.append(f"# TYPE {prefix}_last_run_timestamp_seconds gauge")
+        finished_at = self.finished_at or datetime.now()
+        lines.append(f'{prefix}_last_run_timestamp_seconds{{job="{job}"}} {finished_at.timestamp():.0f}')
+        return '\n'.join(lines) + '\n'
+
+    @staticmethod
+    def _write_atomic(path: str, content: str) -> None:
+        temp_path = f"{path}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            f.write(content)
+        os.replace(temp_path, path)
+
+    def write_report(self, output_dir: str) -> Dict[str, str]:
+        """
+        输出JSON运行报告（按时间命名）和 Prometheus textfile（固定文件名，每次覆盖）
+
+        Args:
+            output_dir: 输出目录
+
+        Returns:
+            输出文件路径字典
+        """
+        os.makedirs(output_dir, exist_ok=True)
+        started = self.started_at.strftime(self.REPORT_TIME_FORMAT)
+        json_path = os.path.join(output_dir, f"{self.run_name}_{started}.json")
+        prom_path = os.path.join(output_dir, f"{self.run_name}.prom")
+        self._write_atomic(json_path, json.dumps(self.report(), ensure_ascii=False, indent=2))
+        self._write_atomic(prom_path, self.prometheus_text())
+        return {'json': json_path, 'prometheus': prom_path}
+
+    def prune_reports(self, output_dir: str, keep_days: int) -> int:
+        """
+        删除本运行名称下超过保留天数的JSON报告（按文件名中的开始时间判断）
+
+        Args:
+            output_dir: 输出目录
+            keep_days: 保留天数
+
+        Returns:
+            删除的报告数
+        """
+        if not os.path.isdir(output_dir):
+            return 0
+        cutoff = datetime.now() - timedelta(days=keep_days)
+        prefix = f"{self.run_name}_"
+        removed = 0
+        for file_name in os.listdir(output_dir):
+            if not file_name.startswith(prefix) or not file_name.endswith('.json'):
+                continue
+            try:
+                started = datetime.strptime(file_name[len(prefix):-len('.json')], self.REPORT_TIME_FORMAT)
+            except ValueError:
+                continue  # 其他运行名称的报告（如 cyy_to_mysql_99_xxx）或非报告文件
+            if started < cutoff:
+                os.remove(os.path.join(output_dir, file_name))
+                removed += 1
+        return removed
@@ -0,0 +1,298 @@
+from common_code import WriteLog
+from typing import Dict, List, Optional, Tuple, Any
+import hashlib
+
+
+class SyncStateStore:
+    """
+    同步状态存储类（本地 sync_state 表，键值形式）
+    示例：
+    store = SyncStateStore(db_operator)
+    store.set(SyncStateStore.watermark_key('按揭业务'), '2025-10-01 08:30:00')
+    store.get(SyncStateStore.watermark_key('按揭业务'))
+    """
+
+    TABLE_NAME = 'sync_state'
+    WATERMARK_PREFIX = 'watermark:'
+
+    def __init__(self, db_operator):
+        """
+        Args:
+            db_operator: 数据库操作对象（需提供 execute_query、connection、get_last_error）
+        """
+        self.db_operator = db_operator
+        self.logger = WriteLog()
+        self.ensure_table()
+
+    @classmethod
+    def watermark_key(cls, api_name: str) -> str:
+        """API水位线对应的状态键"""
+        return f"{cls.WATERMARK_PREFIX}{api_name}"
+
+    def ensure_table(self) -> None:
+        """创建同步状态表（如不存在）"""
+        query = f"""
+        CREATE TABLE IF NOT EXISTS {self.TABLE_NAME} (
+            `state_key` VARCHAR(191) NOT NULL PRIMARY KEY,
+            `state_value` TEXT,
+            `updated_at` DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+        ) DEFAULT CHARSET=utf8mb4
+        """
+        self.db_operator.execute_query(query)
+        if self.db_operator.get_last_error():
+            self.logger.log_error(f"创建同步状态表失败: {self.db_operator.get_last_error()}")
+
+    def get(self, key: str) -> Optional[str]:
+        """读取单个状态值，不存在时返回None"""
+        result = self.db_operator.execute_query(
+            f"SELECT `state_value` FROM {self.TABLE_NAME} WHERE `state_key` = %s", (key,)
+        )
+        if not result:
+            return None
+        return result[0][0]
+
+    def get_all(self, prefix: str = '') -> Dict[str, str]:
+        """
+        按前缀批量读取状态值
+
+        Args:
+            prefix: 状态键前缀，返回的字典键已去掉该前缀
+
+        Returns:
+            状态键到状态值的映射
+        """
+        result = self.db_operator.execute_query(
+            f"SELECT `state_key`, `state_value` FROM {self.TABLE_NAME} WHERE `state_key` LIKE %s",
+            (f"{prefix}%",)
+        )
+        return {row[0][len(prefix):]: row[1] for row in result or []}
+
+    def set(self, key: str, value: Any) -> bool:
+        """
+        写入状态值（存在则覆盖），写入后立即提交
+
+        Returns:
+            成功返回True，否则返回False
+        """
+        self.db_operator.execute_query(
+            f"INSERT INTO {self.TABLE_NAME} (`state_key`, `state_value`) VALUES (%s, %s) "
+            f"ON DUPLICATE KEY UPDATE `state_value` = VALUES(`state_value`)",
+            (key, None if value is None else str(value))
+        )
+        if self.db_operator.get_last_error():
+            self.logger.log_error(f"写入同步状态 {key} 失败: {self.db_operator.get_last_error()}")
+            return False
+        self.db_operator.connection.commit()
+        return True
+
+    def delete(self, key: str) -> bool:
+        """删除状态值"""
+        self.db_operator.execute_query(f"DELETE FROM {self.TABLE_NAME} WHERE `state_key` = %s", (key,))
+        if self.db_operator.get_last_error():
+            return False
+        self.db_operator.connection.commit()
+        return True
+
+
+class RowHashStore:
+    """
+    行内容哈希存储类（本地 sync_row_hash 表，按 表名+主键值 保存上次写入行的哈希）
+    示例：
+    hash_store = RowHashStore(db_operator)
+    stored = hash_store.get_hashes('car_sales_invoice_date', ['1001', '1002'])
+    hash_store.set_hashes('car_sales_invoice_date', [('1001', 'e3b0c442...')])
+    """
+
+    TABLE_NAME = 'sync_row_hash'
+    # 单条 IN 查询/删除的主键数量上限
+    LOOKUP_CHUNK_SIZE = 1000
+
+    def __init__(self, db_operator):
+        """
+        Args:
+            db_operator: 数据库操作对象（需提供 execute_query、execute_batched、connection、get_last_error）
+        """
+        self.db_operator = db_operator
+        self.logger = WriteLog()
+        self.ensure_table()
+
+    @staticmethod
+    def row_hash(fieldnames: List[str], row: Tuple) -> str:
+        """计算一行（已转换为入库参数）的内容哈希，与字段顺序无关，字段增减时哈希随之变化"""
+        return hashlib.md5(repr(sorted(zip(fieldnames, row), key=lambda item: item[0])).encode('utf-8')).hexdigest()
+
+    def ensure_table(self) -> None:
+        """创建行哈希表（如不存在）"""
+        query = f"""
+        CREATE TABLE IF NOT EXISTS {self.TABLE_NAME} (
+            `table_name` VARCHAR(64) NOT NULL,
+            `pk_value` VARCHAR(191) NOT NULL,
+            `row_hash` CHAR(32) NOT NULL,
+            `updated_at` DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+            PRIMARY KEY (`table_name`, `pk_value`)
+        ) DEFAULT CHARSET=utf8mb4
+        """
+        self.db_operator.execute_query(query)
+        if self.db_operator.get_last_error():
+            self.logger.log_error(f"创建行哈希表失败: {self.db_operator.get_last_error()}")
+
+    def get_hashes(self, table_name: str, pk_values: List[str]) -> Optional[Dict[str, str]]:
+        """
+        批量读取已保存的行哈希
+
+        Args:
+            table_name: 业务表名
+            pk_values: 主键值列表
+
+        Returns:
+            主键值到哈希的映射，查询失败时返回None
+        """
+        hashes: Dict[str, str] = {}
+        unique_values = list(dict.fromkeys(pk_values))
+        for start in range(0, len(unique_values), self.LOOKUP_CHUNK_SIZE):
+            chunk = unique_values[start:start + self.LOOKUP_CHUNK_SIZE]
+            placeholders = ', '.join(['%s'] * len(chunk))
+            result = self.db_operator.execute_query(
+                f"SELECT `pk_value`, `row_hash` FROM {self.TABLE_NAME} "
+                f"WHERE `table_name` = %s AND `pk_value` IN ({placeholders})",
+                (table_name, *chunk)
+            )
+            if result is None:
+                return None
+            hashes.update({row[0]: row[1] for row in result})
+        return hashes
+
+    def set_hashes(self, table_name: str, items: List[Tuple[str, str]]) -> bool:
+        """
+        写入行哈希（存在则覆盖）
+
+        Args:
+            table_name: 业务表名
+            items: (主键值, 哈希) 列表
+
+        Returns:
+            成功返回True，否则返回False
+        """
+        if not items:
+            return True
+        self.db_operator.execute_batched(
+            f"INSERT INTO {self.TABLE_NAME} (`table_name`, `pk_value`, `row_hash`) VALUES (%s, %s, %s) "
+            f"ON DUPLICATE KEY UPDATE `row_hash` = VALUES(`row_hash`)",
+            [(table_name, pk_value, row_hash) for pk_value, row_hash in items]
+        )
+        if self.db_operator.get_last_error():
+            self.logger.log_error(f"写入 {table_name} 行哈希失败: {self.db_operator.get_last_error()}")
+            return False
+        return True
+
+    def delete_hashes(self, table_name: str, pk_values: List[str]) -> bool:
+        """删除指定主键的行哈希（业务表删除行后调用，保证行重新出现时会被写入）"""
+        unique_values = list(dict.fromkeys(pk_values))
+        for start in range(0, len(unique_values), self.LOOKUP_CHUNK_SIZE):
+            chunk = unique_values[start:start + self.LOOKUP_CHUNK_SIZE]
+            placeholders = ', '.join(['%s'] * len(chunk))
+            self.db_operator.execute_query(
+                f"DELETE FROM {self.TABLE_NAME} WHERE `table_name` = %s AND `pk_value` IN ({placeholders})",
+                (table_name, *chunk)
+            )
+            if self.db_operator.get_last_error():
+                return False
+            self.db_operator.connection.commit()
+        return True
+
+    def clear(self, table_name: str) -> bool:
+        """清除某张表的全部行哈希（业务表被清空或重建后调用）"""
+        self.db_operator.execute_query(f"DELETE FROM {self.TABLE_NAME} WHERE `table_name` = %s", (table_name,))
+        if self.db_operator.get_last_error():
+            self.logger.log_error(f"清除 {table_name} 行哈希失败: {self.db_operator.get_last_error()}")
+            return False
+        self.db_operator.connection.commit()
+        return True
+
+
+class ChangeLogStore:
+    """
+    变更日志存储类（本地 sync_changelog 表，只追加）
+
+    写库成功后记录实际新增(I)、更新(U)、删除(D)的行主键，整表替换的快照表记一条主键为空的替换(R)记录。
+    下游按自增 id 读取上次处理之后的变更，只重算有变化的数据。
+    示例：
+    changelog = ChangeLogStore(db_operator, run_id='083000_1234')
+    changelog.append('mortgage_business', [('1001', ChangeLogStore.OP_INSERT), ('1002', ChangeLogStore.OP_UPDATE)])
+    changelog.prune(keep_days=14)
+    """
+
+    TABLE_NAME = 'sync_changelog'
+    OP_INSERT = 'I'
+    OP_UPDATE = 'U'
+    OP_DELETE = 'D'
+    OP_REPLACE = 'R'
+    # 单条 INSERT 语句的行数上限
+    APPEND_CHUNK_SIZE = 1000
+
+    def __init__(self, db_operator, run_id: str):
+        """
+        Args:
+            db_operator: 数据库操作对象（需提供 execute_query、connection、get_last_error）
+            run_id: 本次运行ID
+        """
+        self.db_operator = db_operator
+        self.run_id = run_id
+        self.logger = WriteLog()
+        self.ensure_table()
+
+    def ensure_table(self) -> None:
+        """创建变更日志表（如不存在）"""
+        query = f"""
+        CREATE TABLE IF NOT EXISTS {self.TABLE_NAME} (
+            `id` BIGINT NOT NULL AUTO_INCREMENT PRIMARY KEY,
+            `run_id` VARCHAR(32) NOT NULL,
+            `table_name` VARCHAR(64) NOT NULL,
+            `pk_value` VARCHAR(191) NOT NULL DEFAULT '',
+            `op` CHAR(1) NOT NULL,
+            `changed_at` DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            KEY `idx_table_id` (`table_name`, `id`),
+            KEY `idx_changed_at` (`changed_at`)
+        ) DEFAULT CHARSET=utf8mb4
+        """
+        self.db_operator.execute_query(query)
+        if self.db_operator.get_last_error():
+            self.logger.log_error(f"创建变更日志表失败: {self.db_operator.get_last_error()}")
+
+    def append(self, table_name: str, changes: List[Tuple[str, str]]) -> bool:
+        """
+        追加变更记录
+
+        Args:
+            table_name: 业务表名
+            changes: (主键值, 操作类型) 列表
+
+        Returns:
+            成功返回True，否则返回False（变更日志写入失败不影响业务数据）
+        """
+        for start in range(0, len(changes), self.APPEND_CHUNK_SIZE):
+            chunk = changes[start:start + self.APPEND_CHUNK_SIZE]
+            placeholders = ', '.join(['(%s, %s, %s, %s)'] * len(chunk))
+            params = []
+            for pk_value, op in chunk:
+                params.extend((self.run_id, table_name, pk_value, op))
+            self.db_operator.execute_query(
+                f"INSERT INTO {self.TABLE_NAME} (`run_id`, `table_name`, `pk_value`, `op`) VALUES {placeholders}",
+                tuple(params)
+            )
+            if self.db_operator.get_last_error():
+                self.logger.log_error(f"写入 {table_name} 变更日志失败: {self.db_operator.get_last_error()}")
+                return False
+            self.db_operator.connection.commit()
+        return True
+
+    def prune(self, keep_days: int) -> bool:
+        """删除超过保留天数的变更记录"""
+        self.db_operator.execute_query(
+            f"DELETE FROM {self.TABLE_NAME} WHERE `changed_at` < NOW() - INTERVAL %s DAY", (keep_days,)
+        )
+        if self.db_operator.get_last_error():
+            self.logger.log_error(f"清理变更日志失败: {self.db_operator.get_last_error()}")
+            return False
+        self.db_operator.connection.commit()
+        return True
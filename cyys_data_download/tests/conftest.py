@@ -0,0 +1,190 @@
+import os
+import sys
+import types
+
+import pytest
+
+# 测试直接导入 cyys_data_download 下的脚本模块
+PACKAGE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PACKAGE_DIR)
+
+
+class Config:
+    """测试用配置（真实配置位于 E:\\powerbi_data\\config，不在仓库中）"""
+    WECHAT_WEBHOOK = None
+    DB_CONFIG = {}
+    WEBDAV_CONFIG = {}
+    API_BASE_URL = 'http://127.0.0.1:1'
+    MAX_WORKERS = 3
+    REQUEST_DELAY = (0, 0)
+    PAGE_SIZE = 3
+
+
+class DataCenter:
+    USER = 'user'
+    PWD = 'password'
+    APIS: dict = {}
+
+    @classmethod
+    def get_apis(cls, time_option):
+        return dict(cls.APIS)
+
+    @classmethod
+    def get_apis_99(cls, time_option):
+        return dict(cls.APIS)
+
+
+def get_time_range(time_option):
+    return ['2025/01/01', '2025/01/31']
+
+
+def _install_config_module() -> None:
+    """注册 config.cyys_data_download.config 模块"""
+    config_module = types.ModuleType('config.cyys_data_download.config')
+    config_module.Config = Config
+    config_module.DataCenter = DataCenter
+    config_module.get_time_range = get_time_range
+    package = types.ModuleType('config')
+    package.__path__ = []
+    subpackage = types.ModuleType('config.cyys_data_download')
+    subpackage.__path__ = []
+    subpackage.config = config_module
+    package.cyys_data_download = subpackage
+    sys.modules.setdefault('config', package)
+    sys.modules.setdefault('config.cyys_data_download', subpackage)
+    sys.modules.setdefault('config.cyys_data_download.config', config_module)
+
+
+_install_config_module()
+
+import common_code  # noqa: E402
+from sync_state import RowHashStore  # noqa: E402
+
+# 日志只输出到控制台，不在固定目录下创建日志文件
+common_code.WriteLog._configured = True
+
+
+class FakeStateStore:
+    """内存版 SyncStateStore"""
+
+    def __init__(self, values=None):
+        self.values = dict(values or {})
+
+    def get(self, key):
+        return self.values.get(key)
+
+    def get_all(self, prefix=''):
+        return {key[len(prefix):]: value for key, value in self.values.items() if key.startswith(prefix)}
+
+    def set(self, key, value):
+        self.values[key] = None if value is None else str(value)
+        return True
+
+    def delete(self, key):
+        self.values.pop(key, None)
+        return True
+
+
+class FakeRowHashStore:
+    """内存版 RowHashStore"""
+
+    def __init__(self, hashes=None):
+        self.hashes = {table_name: dict(items) for table_name, items in (hashes or {}).items()}
+        self.cleared = []
+
+    row_hash = staticmethod(RowHashStore.row_hash)
+
+    def get_hashes(self, table_name, pk_values):
+        stored = self.hashes.get(table_name, {})
+        return {pk: stored[pk] for pk in pk_values if pk in stored}
+
+    def set_hashes(self, table_name, items):
+        self.hashes.setdefault(table_name, {}).update(items)
+        return True
+
+    def delete_hashes(self, table_name, pk_values):
+        for pk in pk_values:
+            self.hashes.get(table_name, {}).pop(pk, None)
+        return True
+
+    def clear(self, table_name):
+        self.cleared.append(table_name)
+        self.hashes.pop(table_name, None)
+        return True
+
+
+class FakeDataSaver:
+    """记录写库调用的 DataSaver 替身"""
+
+    def __init__(self):
+        self.saved = {}
+        self.last_error = None
+
+    def save_data(self, api_name, data_list):
+        self.last_error = None
+        if not data_list:
+            self.last_error = f"{api_name} 无数据可保存"
+            return 0
+        self.saved.setdefault(api_name, []).extend(data_list)
+        return len(data_list)
+
+    def get_last_error(self):
+        return self.last_error
+
+    def get_last_warning(self):
+        return None
+
+
+class FakeTokenCache:
+    """固定令牌的 TokenCache 替身"""
+
+    def get(self):
+        return 'token'
+
+    def invalidate(self, token=None):
+        return 'new-token'
+
+
+@pytest.fixture
+def state_store():
+    return FakeStateStore()
+
+
+@pytest.fixture
+def make_manager(tmp_path, monkeypatch):
+    """
+    不连接接口和数据库，构造 cyy_to_mysql_99.DataSyncManager
+    示例：
+    manager = make_manager(time_option=1, incremental=True)
+    """
+    import cyy_to_mysql_99
+    from common_code import AdaptiveController, RetryPolicy, TokenBucket
+    from sync_metrics import SyncMetrics
+
+    monkeypatch.setattr(cyy_to_mysql_99, 'send_wechat_notification', lambda content: True)
+
+    def factory(time_option=2, incremental=True, watermarks=None, landing_zone=None):
+        manager = cyy_to_mysql_99.DataSyncManager.__new__(cyy_to_mysql_99.DataSyncManager)
+        manager.logger = common_code.WriteLog()
+        manager.time_option = time_option
+        manager.incremental = incremental
+        manager.run_started = cyy_to_mysql_99.datetime(2025, 10, 15, 8, 30, 0)
+        manager.run_id = '083000_1'
+        manager.watermarks = dict(watermarks or {})
+        manager.state_store = FakeStateStore()
+        manager.row_hash_store = FakeRowHashStore()
+        manager.rate_limiter = TokenBucket(1000, 100)
+        manager.controller = AdaptiveController(manager.rate_limiter, concurrency=manager.PAGE_WORKERS)
+        manager.retry_policy = RetryPolicy(base_delay=0)
+        manager.token_cache = FakeTokenCache()
+        manager.metrics = SyncMetrics('test')
+        manager.landing_zone = landing_zone
+        manager.changelog = None
+        manager.changelog_run_id = None
+        manager.polling_policy = None
+        manager.data_saver = FakeDataSaver()
+        manager.WRITER_POOL_SIZE = 0
+        manager.METRICS_DIR = str(tmp_path / 'metrics')
+        return manager
+
+    return factory
@@ -0,0 +1,240 @@
+from concurrent.futures import ThreadPoolExecutor
+import threading
+
+import pytest
+from curl_cffi import requests
+
+from common_code import (AdaptiveController, CircuitOpenError, RequestFunction, RetryPolicy, SessionPool, TokenBucket,
+                         is_auth_error, is_throttled)
+
+
+def test_token_bucket_allows_burst_then_waits():
+    limiter = TokenBucket(rate=50, capacity=2)
+    assert limiter.acquire() == 0
+    assert limiter.acquire() == 0
+    # 突发容量用完后按速率等待（约 1/50 秒）
+    assert limiter.acquire() > 0
+
+
+def test_token_bucket_rejects_invalid_rate():
+    with pytest.raises(ValueError):
+        TokenBucket(rate=0)
+    limiter = TokenBucket(rate=1)
+    with pytest.raises(ValueError):
+        limiter.set_rate(-1)
+
+
+def test_token_bucket_set_rate_keeps_tokens():
+    limiter = TokenBucket(rate=1, capacity=3)
+    limiter.set_rate(10)
+    assert limiter.rate == 10
+    assert limiter.tokens <= limiter.capacity
+    assert limiter.acquire() == 0
+
+
+def test_page_size_growth_needs_total():
+    controller = AdaptiveController()
+    controller.MIN_PAGE_SIZE = 1
+    assert controller.page_size_for('按揭业务', 100) == 100
+    controller.on_page('按揭业务', 100, rows=100, latency=0.1, has_total=False)
+    assert controller.page_size_for('按揭业务', 100) == 100
+    controller.on_page('按揭业务', 100, rows=100, latency=0.1, has_total=True)
+    assert controller.page_size_for('按揭业务', 100) == 200
+    # 不再返回总条数时回到配置的分页大小
+    controller.on_page('按揭业务', 200, rows=50, latency=0.1, has_total=False)
+    assert controller.page_size_for('按揭业务', 100) == 100
+
+
+def test_retry_policy_stops_after_max_attempts():
+    policy = RetryPolicy(max_attempts=3, base_delay=0.5, max_delay=1)
+    delays = [policy.next_delay('按揭业务', attempt) for attempt in range(3)]
+    assert delays[2] is None
+    for attempt, delay in enumerate(delays[:2]):
+        assert 0 <= delay <= min(1, 0.5 * 2 ** attempt)
+
+
+def test_retry_policy_budget_is_shared_between_apis():
+    policy = RetryPolicy(retry_budget=2, base_delay=0)
+    assert policy.next_delay('按揭业务', 0) is not None
+    assert policy.next_delay('保险业务', 0) is not None
+    assert policy.next_delay('保险业务', 1) is None
+
+
+def test_circuit_opens_after_consecutive_failures():
+    policy = RetryPolicy(base_delay=0)
+    for _ in range(RetryPolicy.FAILURE_THRESHOLD - 1):
+        policy.record_failure('按揭业务')
+    assert not policy.is_open('按揭业务')
+    policy.record_failure('按揭业务')
+
+    assert policy.is_open('按揭业务')
+    assert policy.next_delay('按揭业务', 0) is None
+    with pytest.raises(CircuitOpenError):
+        policy.before_attempt('按揭业务')
+    # 其他API不受影响
+    policy.before_attempt('保险业务')
+
+
+def test_circuit_success_resets_failure_count():
+    policy = RetryPolicy()
+    for _ in range(RetryPolicy.FAILURE_THRESHOLD - 1):
+        policy.record_failure('按揭业务')
+    policy.record_success('按揭业务')
+    policy.record_failure('按揭业务')
+    assert not policy.is_open('按揭业务')
+
+
+def test_circuit_half_open_allows_single_probe():
+    policy = RetryPolicy()
+    policy.OPEN_SECONDS = 0
+    for _ in range(RetryPolicy.FAILURE_THRESHOLD):
+        policy.record_failure('按揭业务')
+
+    policy.before_attempt('按揭业务')
+    # 探测请求未返回前，其他请求仍被拒绝
+    with pytest.raises(CircuitOpenError):
+        policy.before_attempt('按揭业务')
+
+    # 探测失败重新打开，探测成功关闭
+    policy.record_failure('按揭业务')
+    assert '按揭业务' in policy.opened_at
+    policy.before_attempt('按揭业务')
+    policy.record_success('按揭业务')
+    assert not policy.is_open('按揭业务')
+    policy.before_attempt('按揭业务')
+    policy.before_attempt('按揭业务')
+
+
+class ErrorSession:
+    """返回指定HTTP状态码响应的会话（raise_for_status 抛出真实的 curl_cffi HTTPError）"""
+
+    def __init__(self, status_code, reason):
+        self.status_code = status_code
+        self.reason = reason
+
+    def request(self, **kwargs):
+        response = requests.Response()
+        response.url = kwargs['url']
+        response.status_code = self.status_code
+        response.reason = self.reason
+        response.ok = False
+        return response
+
+
+def request_with_status(monkeypatch, status_code, reason):
+    requester = RequestFunction()
+    monkeypatch.setattr(requester.session_pool, 'get_session', lambda: ErrorSession(status_code, reason))
+    try:
+        return requester.request('http://127.0.0.1:1/api/list', method='POST', json_data={'PageNumber': 1})
+    finally:
+        requester.close()
+
+
+def test_http_error_carries_real_status_code():
+    response = requests.Response()
+    response.status_code, response.reason, response.ok = 429, 'Too Many Requests', False
+    with pytest.raises(requests.exceptions.HTTPError) as error:
+        response.raise_for_status()
+    # curl_cffi 的 HTTPError.code 是 curl 错误码，HTTP 状态码只在 response 上
+    assert error.value.code == 0
+    assert error.value.response.status_code == 429
+
+
+@pytest.mark.parametrize('status_code, reason', [(429, 'Too Many Requests'), (503, 'Service Unavailable')])
+def test_request_reports_throttling_status(monkeypatch, status_code, reason):
+    result = request_with_status(monkeypatch, status_code, reason)
+    assert result['success'] is False
+    assert result['status_code'] == status_code
+    assert is_throttled(result)
+    assert not is_auth_error(result)
+
+
+@pytest.mark.parametrize('status_code, reason', [(401, 'Unauthorized'), (403, 'Forbidden')])
+def test_request_reports_auth_status(monkeypatch, status_code, reason):
+    result = request_with_status(monkeypatch, status_code, reason)
+    assert result['success'] is False
+    assert result['status_code'] == status_code
+    assert is_auth_error(result)
+    assert not is_throttled(result)
+
+
+def test_request_without_response_has_no_status_code(monkeypatch):
+    class FailingSession:
+        def request(self, **kwargs):
+            raise requests.RequestsError('Failed to connect', 7)
+
+    requester = RequestFunction()
+    monkeypatch.setattr(requester.session_pool, 'get_session', lambda: FailingSession())
+    result = requester.request('http://127.0.0.1:1/api/list')
+    requester.close()
+    assert result['success'] is False
+    assert 'status_code' not in result
+    assert not is_throttled(result) and not is_auth_error(result)
+
+
+class FakeSession:
+    closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class CountingSessionPool(SessionPool):
+    """记录新建会话的会话池（不创建真实的 curl 会话）"""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.created = 0
+
+    def create_session(self):
+        self.created += 1
+        return FakeSession()
+
+
+def test_session_pool_reuses_sessions_across_short_lived_threads():
+    pool = CountingSessionPool(max_host_connections=2)
+
+    def use_session():
+        with pool.session_for('http://127.0.0.1:1/api/list'):
+            pass
+
+    # 每个API新建一个翻页线程池，线程结束后会话留在池中给下一个API使用
+    for _ in range(5):
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            for future in [executor.submit(use_session) for _ in range(4)]:
+                future.result()
+    assert pool.created <= 2
+
+
+def test_session_pool_blocks_at_max_sessions():
+    pool = CountingSessionPool(max_host_connections=4, max_sessions=1)
+    first = pool.get_session()
+    borrowed = []
+    waiter = threading.Thread(target=lambda: borrowed.append(pool.get_session()))
+    waiter.start()
+    waiter.join(0.1)
+    assert not borrowed
+
+    pool.release_session(first)
+    waiter.join(1)
+    assert borrowed == [first]
+    assert pool.created == 1
+
+
+def test_session_pool_close_closes_idle_and_returned_sessions():
+    pool = CountingSessionPool()
+    idle, in_use = pool.get_session(), pool.get_session()
+    pool.release_session(idle)
+    pool.close()
+    assert idle.closed and not in_use.closed
+    pool.release_session(in_use)
+    assert in_use.closed
+
+
+def test_session_pool_creates_real_sessions():
+    pool = SessionPool()
+    session = pool.get_session()
+    assert isinstance(session, requests.Session)
+    pool.release_session(session)
+    assert pool.get_session() is session
+    pool.close()
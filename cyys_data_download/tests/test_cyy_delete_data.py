@@ -0,0 +1,102 @@
+import logging
+from datetime import datetime
+from unittest import mock
+
+import pytest
+
+from conftest import FakeRowHashStore
+
+
+@pytest.fixture(scope='module')
+def cyy_delete_data():
+    # 日志路径是 Windows 路径，导入时不创建日志目录和文件
+    with mock.patch('os.makedirs'), mock.patch('logging.FileHandler', lambda *args, **kwargs: logging.NullHandler()):
+        import cyy_delete_data
+    return cyy_delete_data
+
+
+class FakeDeleteOperator:
+    """按 (字段, 值) 查找和删除行的内存表"""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.deleted = []
+
+    def execute_query(self, query, params=None):
+        key_field, field = query.split('`')[1], query.split('`')[5]
+        return [(row[key_field],) for row in self.rows if str(row[field]) in params]
+
+    def execute_delete(self, table_name, condition, params=None):
+        field = condition.split('`')[1]
+        matched = [row for row in self.rows if str(row[field]) in params]
+        self.rows = [row for row in self.rows if row not in matched]
+        self.deleted.append((table_name, field, params))
+        return len(matched)
+
+    def get_last_error(self):
+        return None
+
+
+class FakeChangeLog:
+    OP_DELETE = 'D'
+    OP_REPLACE = 'R'
+    entries = []
+
+    def __init__(self, db_operator, run_id):
+        FakeChangeLog.entries = self.entries = []
+
+    def append(self, table_name, items):
+        self.entries.append((table_name, items))
+
+
+@pytest.fixture
+def row_hash_store():
+    return FakeRowHashStore({'decoration_orders': {'1': 'a', '2': 'b', '3': 'c'}})
+
+
+@pytest.fixture
+def make_processor(cyy_delete_data, state_store, row_hash_store, monkeypatch):
+    monkeypatch.setattr(cyy_delete_data, 'SyncStateStore', lambda db_operator: state_store)
+    monkeypatch.setattr(cyy_delete_data, 'RowHashStore', lambda db_operator: row_hash_store)
+    monkeypatch.setattr(cyy_delete_data, 'ChangeLogStore', FakeChangeLog)
+
+    def factory(rows, delete_logs, targets):
+        processor = cyy_delete_data.DeleteLogProcessor.__new__(cyy_delete_data.DeleteLogProcessor)
+        processor.db_operator = FakeDeleteOperator(rows)
+        processor.logger = logging.getLogger('test_delete_log')
+        processor.processed_count = 0
+        processor.deleted_count = 0
+        processor.errors = []
+        processor.get_delete_logs = lambda since=None: delete_logs
+        processor.resolve_delete_targets = lambda title: targets
+        return processor
+
+    return factory
+
+
+def test_non_primary_key_delete_clears_hashes_of_deleted_rows(make_processor, row_hash_store):
+    rows = [{'ID': '1', 'OutId': 'o1'}, {'ID': '2', 'OutId': 'o1'}, {'ID': '3', 'OutId': 'o2'}]
+    delete_logs = [{'title': '删除装饰出库数据', 'logo_id_or_code': 'o1', 'write_time': datetime(2025, 10, 1, 9, 0)}]
+    processor = make_processor(rows, delete_logs, [('decoration_orders', 'OutId')])
+
+    result = processor.reconcile_delete_logs()
+
+    assert result['total_deleted'] == 2
+    assert row_hash_store.hashes == {'decoration_orders': {'3': 'c'}}
+    assert FakeChangeLog.entries == [('decoration_orders', [('1', 'D'), ('2', 'D')])]
+
+
+def test_watermark_uses_latest_write_time(make_processor, state_store, cyy_delete_data):
+    delete_logs = [
+        {'title': '删除装饰业务数据', 'logo_id_or_code': '1', 'write_time': datetime(2025, 10, 9, 23, 0)},
+        {'title': '删除装饰业务数据', 'logo_id_or_code': '2', 'write_time': datetime(2025, 10, 10, 8, 0)},
+        {'title': '删除装饰业务数据', 'logo_id_or_code': '3', 'write_time': '2025/10/9 23:30:00'},
+    ]
+    processor = make_processor([{'ID': '1'}, {'ID': '2'}], delete_logs, [('decoration_orders', 'ID')])
+
+    processor.reconcile_delete_logs()
+
+    # 字符串比较时 '2025/10/9 ...' 会大于 '2025-10-10 ...'
+    assert state_store.values[cyy_delete_data.Config.DELETE_LOG_WATERMARK_KEY] == '2025-10-10 08:00:00'
+    # 按主键删除时只删除实际存在的ID
+    assert processor.db_operator.deleted == [('decoration_orders', 'ID', ('1', '2'))]
@@ -0,0 +1,352 @@
+import queue
+
+import pymysql
+import pytest
+
+import cyy_to_mysql_99
+from config.cyys_data_download.config import DataCenter
+from conftest import FakeRowHashStore
+from cyy_to_mysql_99 import DataSaver, DBOperator
+from landing_zone import LandingZone
+from polling_policy import PollingPolicy
+from sync_state import ChangeLogStore, RowHashStore
+
+
+def api_config(**payload):
+    return {'url': '/api/list', 'method': 'POST', 'payload': payload}
+
+
+# 水位线
+
+def test_watermark_widens_begin_time(make_manager):
+    manager = make_manager(watermarks={'按揭业务': '2025-09-28 08:00:00'})
+    payload = manager.apply_watermark('按揭业务', {'beginTime': '2025/10/01', 'endTime': '2025/10/31'})
+    assert payload['beginTime'] == '2025/09/28'
+    assert payload['endTime'] == '2025/10/31'
+
+
+def test_watermark_does_not_narrow_business_dates(make_manager):
+    manager = make_manager(watermarks={'按揭业务': '2025-10-10 08:00:00'})
+    payload = manager.apply_watermark('按揭业务', {'beginTime': '2025/10/01', 'endTime': '2025/10/31'})
+    assert payload['beginTime'] == '2025/10/01'
+
+
+def test_watermark_ignored_for_full_update_tables(make_manager):
+    manager = make_manager(watermarks={'计划车辆': '2025-09-28 08:00:00'})
+    payload = manager.apply_watermark('计划车辆', {'beginTime': '2025/10/01'})
+    assert payload['beginTime'] == '2025/10/01'
+
+
+def test_advance_watermark_uses_run_start(make_manager):
+    manager = make_manager()
+    manager.advance_watermark('按揭业务', api_config(beginTime='2025/10/01'))
+    assert manager.watermarks['按揭业务'] == '2025-10-15 08:30:00'
+    assert manager.state_store.values['watermark:按揭业务'] == '2025-10-15 08:30:00'
+
+    # 没有时间参数的API不记录水位线
+    manager.advance_watermark('保险业务', api_config(Status='1'))
+    assert '保险业务' not in manager.watermarks
+
+
+# 行哈希过滤
+
+def make_hash_saver(hashes=None):
+    saver = DataSaver.__new__(DataSaver)
+    saver.row_hash_store = FakeRowHashStore(hashes)
+    return saver
+
+
+def test_filter_changed_rows_skips_unchanged_rows():
+    fieldnames = ['ID', 'Name']
+    rows = [('1', 'a'), ('2', 'b'), ('3', 'c')]
+    saver = make_hash_saver({'mortgage_business': {
+        '1': RowHashStore.row_hash(fieldnames, ('1', 'a')),
+        '2': RowHashStore.row_hash(fieldnames, ('2', 'old')),
+    }})
+
+    changed, hashes, changes = saver.filter_changed_rows('mortgage_business', rows, fieldnames, 'ID')
+
+    assert changed == [('2', 'b'), ('3', 'c')]
+    assert [pk for pk, _ in hashes] == ['2', '3']
+    assert changes == [('2', ChangeLogStore.OP_UPDATE), ('3', ChangeLogStore.OP_INSERT)]
+
+
+def test_filter_changed_rows_always_writes_duplicates_and_null_keys():
+    fieldnames = ['ID', 'Name']
+    rows = [('1', 'a'), ('1', 'a'), (None, 'x')]
+    saver = make_hash_saver({'mortgage_business': {'1': RowHashStore.row_hash(fieldnames, ('1', 'a'))}})
+
+    changed, _, _ = saver.filter_changed_rows('mortgage_business', rows, fieldnames, 'ID')
+    assert changed == rows
+
+
+def test_filter_changed_rows_writes_everything_when_lookup_fails():
+    saver = make_hash_saver()
+    saver.row_hash_store.get_hashes = lambda table_name, pk_values: None
+    rows = [('1', 'a'), ('2', 'b')]
+
+    changed, hashes, changes = saver.filter_changed_rows('mortgage_business', rows, ['ID', 'Name'], 'ID')
+    assert changed == rows
+    assert len(hashes) == 2
+    assert {op for _, op in changes} == {ChangeLogStore.OP_UPDATE}
+
+
+# 分块写入
+
+class FakeCursor:
+    def __init__(self, executed):
+        self.executed = executed
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+    def execute(self, sql):
+        if "'bad'" in sql:
+            raise pymysql.err.DataError(1366, 'Incorrect value')
+        self.executed.append(sql)
+        return sql.count("('")
+
+
+class FakeConnection:
+    def __init__(self):
+        self.executed = []
+
+    def literal(self, value):
+        return f"'{value}'"
+
+    def cursor(self):
+        return FakeCursor(self.executed)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+
+def make_db_operator():
+    db_operator = DBOperator.__new__(DBOperator)
+    db_operator.connection = FakeConnection()
+    db_operator.last_error = None
+    db_operator.skipped_rows = []
+    db_operator.logger = cyy_to_mysql_99.WriteLog()
+    return db_operator
+
+
+def test_execute_batched_skips_bad_rows_as_warning():
+    db_operator = make_db_operator()
+    db_operator.CHUNK_MAX_ROWS = 4
+    rows = [(str(index), 'bad' if index in (2, 5) else 'ok') for index in range(8)]
+
+    affected = db_operator.execute_batched(
+        "INSERT INTO t (ID, Name) VALUES (%s, %s) ON DUPLICATE KEY UPDATE Name=VALUES(Name)", rows)
+
+    assert affected == 6
+    assert db_operator.skipped_rows == [2, 5]
+    assert db_operator.get_last_error() is None
+    assert all(sql.endswith('ON DUPLICATE KEY UPDATE Name=VALUES(Name)') for sql in db_operator.connection.executed)
+
+
+# 时间窗口拆分
+
+def test_plan_partitions_by_week(make_manager):
+    manager = make_manager(time_option=2)
+    payload = {'beginTime': '2025/10/01', 'endTime': '2025/10/31', 'PageNumber': 1}
+    windows = manager.plan_partitions('按揭业务', payload, total=1500, page_size=100)
+    assert windows == [('2025/10/01', '2025/10/07'), ('2025/10/08', '2025/10/14'), ('2025/10/15', '2025/10/21'),
+                       ('2025/10/22', '2025/10/28'), ('2025/10/29', '2025/10/31')]
+
+
+def test_plan_partitions_by_day_with_seconds(make_manager):
+    manager = make_manager(time_option=2)
+    payload = {'beginTime': '2025/10/01 00:00:00', 'endTime': '2025/10/03 23:59:59', 'PageNumber': 1}
+    windows = manager.plan_partitions('按揭业务', payload, total=3000, page_size=100)
+    assert windows == [('2025/10/01 00:00:00', '2025/10/01 23:59:59'), ('2025/10/02 00:00:00', '2025/10/02 23:59:59'),
+                       ('2025/10/03 00:00:00', '2025/10/03 23:59:59')]
+
+
+@pytest.mark.parametrize('time_option, task_name, total', [
+    (1, '按揭业务', 5000),  # 当日不拆分
+    (2, '按揭业务', 500),  # 页数不足
+    (2, '删除日志', 5000),  # 无主键无法去重
+])
+def test_plan_partitions_not_needed(make_manager, time_option, task_name, total):
+    manager = make_manager(time_option=time_option)
+    payload = {'beginTime': '2025/10/01', 'endTime': '2025/10/31', 'PageNumber': 1}
+    assert manager.plan_partitions(task_name, payload, total=total, page_size=100) == []
+
+
+# 合并请求
+
+def test_plan_coalesced_fetches_groups_single_param_difference(make_manager):
+    manager = make_manager(time_option=2, watermarks={'保险业务': '2025-09-20 10:00:00'})
+    apis = {
+        '按揭业务': api_config(Status='1,2', beginTime='2025/10/01', PageNumber=1),
+        '保险业务': api_config(Status='3', beginTime='2025/10/01', PageNumber=1),
+        '汇票管理': api_config(Status='4', beginTime='2025/10/02', PageNumber=1),
+        '删除日志': api_config(Status='5', beginTime='2025/10/01', PageNumber=1),
+    }
+
+    groups = manager.plan_coalesced_fetches(apis)
+
+    assert list(groups) == ['按揭业务+保险业务']
+    group = groups['按揭业务+保险业务']
+    assert group['param'] == 'Status'
+    assert group['payload']['Status'] == ''
+    # 使用最早的水位线
+    assert group['payload']['beginTime'] == '2025/09/20'
+    assert group['members'] == {'按揭业务': {'1', '2'}, '保险业务': {'3'}}
+    # 合并时不修改各API自己的配置
+    assert apis['按揭业务']['payload']['Status'] == '1,2'
+
+
+def test_plan_coalesced_fetches_requires_distinct_values(make_manager):
+    manager = make_manager()
+    apis = {
+        '按揭业务': api_config(Status='1', beginTime='2025/10/01'),
+        '保险业务': api_config(Status='1', beginTime='2025/10/01'),
+    }
+    assert manager.plan_coalesced_fetches(apis) == {}
+
+
+# 写库与汇总
+
+@pytest.fixture
+def notifications(monkeypatch):
+    sent = []
+    monkeypatch.setattr(cyy_to_mysql_99, 'send_wechat_notification', lambda content: sent.append(content) or True)
+    return sent
+
+
+def test_consume_pages_counts_empty_api_as_success(make_manager, notifications):
+    manager = make_manager(time_option=1)
+    manager.polling_policy = PollingPolicy(manager.state_store)
+    page_queue = queue.Queue()
+    page_queue.put(('按揭业务', [], None))
+    page_queue.put(('按揭业务', None, None))
+
+    results = manager.consume_pages({'按揭业务': api_config(beginTime='2025/10/15')}, page_queue)
+
+    assert results == {'按揭业务': 0}
+    assert manager.data_saver.saved == {}
+    assert manager.watermarks['按揭业务'] == '2025-10-15 08:30:00'
+    assert manager.polling_policy.states['按揭业务']['change_rate'] < 1
+    assert '失败任务数: 0' in notifications[0]
+
+
+def test_consume_pages_failed_api_keeps_watermark(make_manager, notifications):
+    manager = make_manager()
+    page_queue = queue.Queue()
+    page_queue.put(('按揭业务', [{'ID': '1'}], None))
+    page_queue.put(('按揭业务', None, Exception('接口超时')))
+    page_queue.put(('保险业务', [{'ID': '2'}], None))
+    page_queue.put(('保险业务', None, None))
+
+    apis = {'按揭业务': api_config(beginTime='2025/10/01'), '保险业务': api_config(beginTime='2025/10/01')}
+    results = manager.consume_pages(apis, page_queue)
+
+    assert results == {'按揭业务': 1, '保险业务': 1}
+    assert '按揭业务' not in manager.watermarks
+    assert '保险业务' in manager.watermarks
+    assert '接口超时' in notifications[0]
+
+
+def test_consume_pages_buffers_full_update_snapshot(make_manager, notifications):
+    manager = make_manager()
+    page_queue = queue.Queue()
+    page_queue.put(('计划车辆', [{'OrderCode': 'A'}], None))
+    page_queue.put(('计划车辆', [{'OrderCode': 'B'}], None))
+    page_queue.put(('计划车辆', None, None))
+
+    manager.consume_pages({'计划车辆': api_config()}, page_queue)
+
+    assert manager.data_saver.saved == {'计划车辆': [{'OrderCode': 'A'}, {'OrderCode': 'B'}]}
+
+
+# 落地区回放
+
+def land(zone, api_name, run_id, day, items):
+    stream = zone.open_stream(api_name, run_id, day)
+    stream.write_page(1, {'Data': items})
+    stream.commit()
+
+
+def test_replay_landing_clears_hashes_and_replays_rows(make_manager, monkeypatch, tmp_path, notifications):
+    zone = LandingZone(str(tmp_path / 'landing'), compression='gzip')
+    land(zone, '按揭业务', '080000_1', '2025-10-14', [{'ID': '1'}, {'ID': '2'}])
+    land(zone, '按揭业务', '080000_1', '2025-10-15', [{'ID': '2'}, {'ID': '3'}])
+    land(zone, '计划车辆', '080000_1', '2025-10-14', [{'OrderCode': 'old'}])
+    land(zone, '计划车辆', '080000_1', '2025-10-15', [{'OrderCode': 'new'}])
+    monkeypatch.setattr(DataCenter, 'APIS', {'按揭业务': api_config(beginTime='2025/10/01'),
+                                             '计划车辆': api_config(), '保险业务': api_config()})
+    manager = make_manager(landing_zone=zone)
+    manager.row_hash_store = FakeRowHashStore({'mortgage_business': {'1': 'stale'}})
+
+    results = manager.replay_landing('2025-10-01', '2025-10-31')
+
+    assert results == {'按揭业务': 4, '计划车辆': 1}
+    assert 'mortgage_business' in manager.row_hash_store.cleared
+    assert 'insurance_business' not in manager.row_hash_store.cleared
+    assert [row['ID'] for row in manager.data_saver.saved['按揭业务']] == ['1', '2', '2', '3']
+    assert manager.data_saver.saved['计划车辆'] == [{'OrderCode': 'new'}]
+    # 回放不推进水位线
+    assert manager.incremental
+    assert manager.watermarks == {}
+
+
+def test_replay_landing_requires_landing_zone(make_manager):
+    with pytest.raises(Exception, match='未启用落地区'):
+        make_manager(landing_zone=None).replay_landing()
+
+
+# 自适应分页
+
+class CappedRequester:
+    """上游最多返回 cap 条数据的分页接口"""
+
+    def __init__(self, rows, cap, with_total):
+        self.rows = rows
+        self.cap = cap
+        self.with_total = with_total
+        self.page_sizes = []
+
+    def request(self, url, method='GET', json_data=None, **kwargs):
+        page_size = json_data['PageSize']
+        self.page_sizes.append(page_size)
+        size = min(page_size, self.cap)
+        start = (json_data['PageNumber'] - 1) * size
+        body = {'Data': self.rows[start:start + size]}
+        if self.with_total:
+            body['Total'] = len(self.rows)
+        return {'success': True, 'data': body}
+
+
+def fetch_all(manager, task_name='按揭业务', page_size=4):
+    return [item for page in manager.iter_pages(task_name, api_config(PageNumber=1, PageSize=page_size), land=False)
+            for item in page]
+
+
+def test_page_size_does_not_grow_past_config_without_total(make_manager):
+    manager = make_manager(time_option=1)
+    rows = [{'ID': str(index)} for index in range(12)]
+    manager.requester = CappedRequester(rows, cap=5, with_total=False)
+
+    # 多次运行：没有总条数时分页大小不超过配置值，不会被上游上限截断
+    for _ in range(3):
+        assert fetch_all(manager) == rows
+    assert max(manager.requester.page_sizes) == 4
+
+
+def test_page_size_grows_and_detects_cap_with_total(make_manager):
+    manager = make_manager(time_option=1)
+    rows = [{'ID': str(index)} for index in range(12)]
+    manager.requester = CappedRequester(rows, cap=5, with_total=True)
+
+    assert fetch_all(manager) == rows
+    assert manager.controller.page_sizes['按揭业务'] == 8
+    # 分页大小增长到超过上游上限后，按总条数发现上限并按实际条数翻页
+    assert sorted(item['ID'] for item in fetch_all(manager)) == sorted(row['ID'] for row in rows)
+    assert manager.controller.page_caps['按揭业务'] == 5
@@ -0,0 +1,75 @@
+from common_code import WriteLog
+from cyy_to_mysql_all import DBOperator
+
+
+class FakeCursor:
+    def __init__(self, connection):
+        self.connection = connection
+        self.rowcount = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def execute(self, query, params=None):
+        self.connection.statements.append(query)
+
+    def executemany(self, query, data_list):
+        self.connection.statements.append(query)
+        if self.connection.fail_insert:
+            raise Exception('Data too long')
+        self.rowcount = len(data_list)
+
+
+class FakeConnection:
+    def __init__(self, fail_insert=False):
+        self.statements = []
+        self.fail_insert = fail_insert
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def commit(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def make_operator(connection):
+    operator = DBOperator.__new__(DBOperator)
+    operator.db_config = {}
+    operator.connection = connection
+    operator.last_error = None
+    operator.logger = WriteLog()
+    operator.reconnect = lambda: None
+    return operator
+
+
+def test_replace_table_swaps_staging_table_in():
+    connection = FakeConnection()
+    operator = make_operator(connection)
+
+    assert operator.replace_table('mortgage_business', [(1, 'a'), (2, 'b')], ['ID', 'Name']) == 2
+    assert operator.get_last_error() is None
+    assert connection.statements == [
+        'DROP TABLE IF EXISTS mortgage_business__staging',
+        'CREATE TABLE mortgage_business__staging LIKE mortgage_business',
+        'INSERT INTO mortgage_business__staging (`ID`, `Name`) VALUES (%s, %s)',
+        'DROP TABLE IF EXISTS mortgage_business__old',
+        'RENAME TABLE mortgage_business TO mortgage_business__old, mortgage_business__staging TO mortgage_business',
+        'DROP TABLE mortgage_business__old',
+    ]
+
+
+def test_replace_table_keeps_original_when_insert_fails():
+    connection = FakeConnection(fail_insert=True)
+    operator = make_operator(connection)
+
+    assert operator.replace_table('mortgage_business', [(1, 'a')], ['ID', 'Name']) == 0
+    assert 'Data too long' in operator.get_last_error()
+    assert not any(statement.startswith(('RENAME', 'DELETE')) for statement in connection.statements)
+    assert connection.statements[-1] == 'DROP TABLE IF EXISTS mortgage_business__staging'
+
@@ -0,0 +1,240 @@
+import queue
+from datetime import datetime
+
+import pytest
+
+import cyy_to_mysql_month_all
+from cyy_to_mysql_month_all import DataSaver, DataSyncManager, MonthBackfillPlanner
+from common_code import TokenBucket
+from conftest import FakeDataSaver, FakeRowHashStore, FakeStateStore, FakeTokenCache
+
+
+class FakeMonthDataSaver(FakeDataSaver):
+    """带本地表结构和按月统计结果的 DataSaver 替身"""
+
+    def __init__(self, table_schema=None, month_stats=None):
+        super().__init__()
+        self.table_schema = table_schema
+        self.db_operator = self
+        self.month_stats = month_stats
+        self.queries = []
+
+    def get_table_schema(self, table_name):
+        return self.table_schema
+
+    def execute_query(self, query, params=None):
+        self.queries.append((query, params))
+        # 列表按查询次数依次返回（分批查询）
+        if isinstance(self.month_stats, list):
+            return self.month_stats.pop(0)
+        return self.month_stats
+
+
+@pytest.fixture
+def make_planner(tmp_path, monkeypatch):
+    monkeypatch.setattr(MonthBackfillPlanner, 'CHECKPOINT_PATH', str(tmp_path / 'checkpoint.json'))
+
+    def factory(data_saver=None, reconcile=True):
+        planner = MonthBackfillPlanner.__new__(MonthBackfillPlanner)
+        planner.logger = cyy_to_mysql_month_all.WriteLog()
+        planner.reconcile = reconcile
+        planner.freeze_months = MonthBackfillPlanner.FREEZE_AFTER_MONTHS
+        planner.started_at = datetime(2025, 10, 15, 8, 0, 0)
+        planner.completed = {}
+        planner.failed = {}
+        planner.checkpoint_lock = cyy_to_mysql_month_all.threading.Lock()
+        planner.delete_log_rows = {}
+        planner.saver_pool = queue.Queue()
+        planner.saver_pool.put(data_saver or FakeMonthDataSaver())
+        planner.state_store = FakeStateStore()
+        planner.fingerprints = {}
+        planner.status_counts = {}
+        return planner
+
+    return factory
+
+
+def test_compute_fingerprint_counts_duplicates_and_amounts():
+    data_list = [
+        {'ID': 1, 'LoanAmount': '100.50', 'Name': 'a'},
+        {'ID': 1, 'LoanAmount': 20, 'Name': 'a'},
+        {'ID': 2, 'LoanAmount': None, 'Name': 'b'},
+    ]
+    fingerprint = MonthBackfillPlanner.compute_fingerprint('按揭业务', data_list)
+    assert fingerprint['rows'] == 3
+    assert fingerprint['pk_count'] == 2
+    assert fingerprint['amounts'] == {'LoanAmount': 120.5}
+    # 与行顺序无关
+    assert fingerprint == MonthBackfillPlanner.compute_fingerprint('按揭业务', data_list[::-1])
+
+
+def test_month_range_crosses_year():
+    assert MonthBackfillPlanner.month_range('202512') == (datetime(2025, 12, 1), datetime(2026, 1, 1))
+    assert MonthBackfillPlanner.month_range('202502') == (datetime(2025, 2, 1), datetime(2025, 3, 1))
+
+
+BILL_FINGERPRINT = {'rows': 5, 'pk_count': 4, 'pk_hash': '', 'amounts': {'BillAmount': 300.0}}
+
+
+@pytest.mark.parametrize('month_stats, expected', [
+    (((4, 300.0),), True),
+    (((3, 300.0),), False),  # 本地缺少主键
+    (((4, 250.0),), False),  # 金额合计不一致
+    (None, False),  # 查询失败无法核对，重新写库
+])
+def test_local_matches_compares_local_month(make_planner, month_stats, expected):
+    data_saver = FakeMonthDataSaver({'ID': 'varchar', 'PledgeDate': 'datetime', 'BillAmount': 'decimal'},
+                                    month_stats)
+    planner = make_planner(data_saver)
+
+    assert planner.local_matches('汇票管理', '202501', 5, BILL_FINGERPRINT) is expected
+    query, params = data_saver.queries[0]
+    assert 'COUNT(DISTINCT `ID`)' in query and 'SUM(`BillAmount`)' in query
+    assert params == (datetime(2025, 1, 1), datetime(2025, 2, 1))
+    # 连接归还到连接池
+    assert planner.saver_pool.qsize() == 1
+
+
+def test_local_matches_fails_without_month_field_or_primary_keys(make_planner):
+    data_saver = FakeMonthDataSaver({'ID': 'varchar'}, ((0,),))
+    planner = make_planner(data_saver)
+    # 只有总条数时无法核对本地数据，已冻结月份需要重新请求
+    assert not planner.local_matches('按揭业务', '202501', 5, BILL_FINGERPRINT)
+    assert data_saver.queries == []
+
+
+def test_local_matches_counts_upstream_primary_keys_without_month_field(make_planner, monkeypatch):
+    monkeypatch.setattr(cyy_to_mysql_month_all.RowHashStore, 'LOOKUP_CHUNK_SIZE', 2)
+    data_saver = FakeMonthDataSaver({'ID': 'varchar', 'LoanAmount': 'decimal'}, [((2, 100.0),), ((1, 50.0),)])
+    planner = make_planner(data_saver)
+    fingerprint = {'rows': 3, 'pk_count': 3, 'pk_hash': '', 'amounts': {'LoanAmount': 150.0}}
+
+    assert planner.local_matches('按揭业务', '202501', 3, fingerprint, ['1', '2', '3'])
+    assert [params for _, params in data_saver.queries] == [('1', '2'), ('3',)]
+    assert '`ID` IN (%s, %s)' in data_saver.queries[0][0]
+
+    # 本地缺少部分主键
+    data_saver.month_stats = [((2, 100.0),), ((0, 0),)]
+    assert not planner.local_matches('按揭业务', '202501', 3, fingerprint, ['1', '2', '3'])
+
+
+class FakeUpsertOperator:
+    def __init__(self):
+        self.rows = []
+
+    def execute_many(self, query, params_list):
+        self.rows.extend(params_list)
+        return len(params_list)
+
+    def get_last_error(self):
+        return None
+
+
+def test_save_data_deletes_row_hashes_of_rewritten_rows():
+    row_hash_store = FakeRowHashStore({'mortgage_business': {'1': 'old', '2': 'old', '9': 'kept'}})
+    data_saver = DataSaver(FakeUpsertOperator(), row_hash_store)
+    data_saver.table_schema['mortgage_business'] = {'ID': 'varchar', 'LoanAmount': 'decimal'}
+
+    assert data_saver.save_data('按揭业务', [{'ID': 1, 'LoanAmount': 10}, {'ID': '2', 'LoanAmount': 20}]) == 2
+    assert data_saver.get_last_error() is None
+    # 增量同步下次会重新写入被改写的行
+    assert row_hash_store.hashes == {'mortgage_business': {'9': 'kept'}}
+
+
+@pytest.fixture
+def delete_log_mapping(monkeypatch):
+    monkeypatch.setitem(DataSaver.API_TABLE_MAPPING, '删除日志', 'delete_log')
+
+
+def test_write_delete_logs_merges_months(make_planner, delete_log_mapping):
+    data_saver = FakeMonthDataSaver()
+    planner = make_planner(data_saver)
+    planner.delete_log_rows = {'202501|删除日志': [{'ID': 'a'}], '202502|删除日志': [{'ID': 'b'}, {'ID': 'c'}]}
+    deferred = {key: MonthBackfillPlanner.compute_fingerprint('删除日志', rows)
+                for key, rows in planner.delete_log_rows.items()}
+
+    affected = planner.write_delete_logs(deferred)
+
+    assert affected == 3
+    assert data_saver.saved == {'删除日志': [{'ID': 'a'}, {'ID': 'b'}, {'ID': 'c'}]}
+    assert planner.completed == {'202501|删除日志': 1, '202502|删除日志': 2}
+    assert planner.status_counts == {'reloaded': 2}
+    assert planner.delete_log_rows == {}
+
+
+def test_write_delete_logs_skips_write_when_a_month_failed(make_planner, delete_log_mapping):
+    data_saver = FakeMonthDataSaver()
+    planner = make_planner(data_saver)
+    planner.failed = {'202503|删除日志': '请求超时'}
+    planner.delete_log_rows = {'202501|删除日志': [{'ID': 'a'}]}
+
+    assert planner.write_delete_logs({'202501|删除日志': {}}) == 0
+    assert data_saver.saved == {}
+    assert '202501|删除日志' in planner.failed
+    assert planner.completed == {}
+
+
+class FakeRequester:
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.calls = []
+
+    def request(self, url, method='GET', **kwargs):
+        self.calls.append(kwargs)
+        response = self.responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+
+def make_fetcher(responses):
+    fetcher = DataSyncManager(time_option='202501', requester=FakeRequester(responses), token='token',
+                              db_operator=object(), rate_limiter=TokenBucket(1000, 100))
+    fetcher.token_cache = FakeTokenCache()
+    return fetcher
+
+
+def test_probe_total_requests_single_row():
+    fetcher = make_fetcher([{'success': True, 'data': {'Msg': {'Model': {'Total': 42, 'list': []}}}}])
+    api_config = {'url': '/api/list', 'method': 'POST', 'payload': {'PageNumber': 3, 'PageSize': 500}}
+
+    assert fetcher.probe_total('汇票管理', api_config) == 42
+    payload = fetcher.requester.calls[0]['json_data']
+    assert payload['PageSize'] == 1 and payload['PageNumber'] == 1
+    # 不修改原配置
+    assert api_config['payload'] == {'PageNumber': 3, 'PageSize': 500}
+
+
+def test_probe_total_retries_once_on_auth_error():
+    fetcher = make_fetcher([{'success': False, 'status_code': 401, 'error': 'Unauthorized'},
+                            {'success': True, 'data': {'Total': 7}}])
+    assert fetcher.probe_total('汇票管理', {'url': '/api/list', 'method': 'GET', 'payload': {'PageSize': 100}}) == 7
+    assert fetcher.requester.calls[-1]['params']['Token'] == 'new-token'
+
+
+@pytest.mark.parametrize('responses, payload', [
+    ([], {'PageNumber': 1}),  # 不分页的接口
+    ([Exception('连接超时')], {'PageSize': 100}),
+    ([{'success': False, 'error': '服务器错误'}], {'PageSize': 100}),
+])
+def test_probe_total_returns_none_when_unavailable(responses, payload):
+    fetcher = make_fetcher(responses)
+    assert fetcher.probe_total('汇票管理', {'url': '/api/list', 'method': 'POST', 'payload': payload}) is None
+
+
+def test_probe_total_ignores_negative_total():
+    fetcher = make_fetcher([{'success': True, 'data': {'Total': -1}}])
+    assert fetcher.probe_total('汇票管理', {'url': '/api/list', 'method': 'GET', 'payload': {'PageSize': 100}}) is None
+
+
+def test_fetch_single_api_pages_without_extra_sleep(monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(cyy_to_mysql_month_all, 'sleep', sleeps.append)
+    fetcher = make_fetcher([{'success': True, 'data': {'Data': [{'ID': 1}, {'ID': 2}]}},
+                            {'success': True, 'data': {'Data': [{'ID': 3}]}}])
+    api_config = {'url': '/api/list', 'method': 'GET', 'payload': {'PageSize': 2, 'PageNumber': 1}}
+
+    assert fetcher.fetch_single_api('汇票管理', api_config) == {'汇票管理': [{'ID': 1}, {'ID': 2}, {'ID': 3}]}
+    assert len(fetcher.requester.calls) == 2
+    # 翻页速率只由限流器控制
+    assert sleeps == []
@@ -0,0 +1,44 @@
+import os
+
+import landing_zone
+from landing_zone import LandingZone
+
+
+def open_stream(tmp_path):
+    zone = LandingZone(str(tmp_path), compression='gzip')
+    return zone, zone.open_stream('按揭业务', '080000_1', '2025-10-15')
+
+
+def test_committed_pages_can_be_read_back(tmp_path):
+    zone, stream = open_stream(tmp_path)
+    stream.write_page(1, {'Data': [{'ID': '1'}]})
+    stream.write_page(2, {'Data': [{'ID': '2'}]})
+
+    assert stream.commit() == stream.final_path
+    assert list(zone.iter_pages(zone.list_files('按揭业务'))) == [(1, {'Data': [{'ID': '1'}]}),
+                                                                   (2, {'Data': [{'ID': '2'}]})]
+
+
+def test_commit_rename_failure_is_only_logged(tmp_path, monkeypatch):
+    zone, stream = open_stream(tmp_path)
+    stream.write_page(1, {'Data': []})
+
+    def fail_replace(src, dst):
+        raise PermissionError('file is locked')
+
+    monkeypatch.setattr(landing_zone.os, 'replace', fail_replace)
+    assert stream.commit() is None
+    assert not os.path.exists(stream.temp_path)
+    assert zone.list_files('按揭业务') == []
+
+
+def test_abort_remove_failure_is_only_logged(tmp_path, monkeypatch):
+    _, stream = open_stream(tmp_path)
+    stream.write_page(1, {'Data': []})
+
+    def fail_remove(path):
+        raise PermissionError('file is locked')
+
+    monkeypatch.setattr(landing_zone.os, 'remove', fail_remove)
+    stream.abort()
+    assert os.path.exists(stream.temp_path)
@@ -0,0 +1,54 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from polling_policy import PollingPolicy
+
+
+NOW = datetime(2025, 10, 15, 8, 30)
+
+
+def test_new_api_is_due_every_cycle(state_store):
+    policy = PollingPolicy(state_store, base_minutes=30, max_staleness_minutes=120)
+    assert policy.interval_minutes('按揭业务') == 30
+    assert policy.due(['按揭业务', '保险业务'], NOW) == ['按揭业务', '保险业务']
+
+
+def test_unchanged_api_backs_off_up_to_max_staleness(state_store):
+    policy = PollingPolicy(state_store, base_minutes=30, max_staleness_minutes=120)
+    for _ in range(10):
+        policy.observe('调车结算查询', changed=False, polled_at=NOW)
+    assert policy.interval_minutes('调车结算查询') == 120
+    assert not policy.is_due('调车结算查询', NOW + timedelta(minutes=30))
+    # 调度抖动：超过 间隔 - 半个基础周期 即到期
+    assert policy.is_due('调车结算查询', NOW + timedelta(minutes=105))
+
+
+def test_changed_api_keeps_base_interval(state_store):
+    policy = PollingPolicy(state_store, base_minutes=30, max_staleness_minutes=120)
+    policy.observe('按揭业务', changed=True, polled_at=NOW)
+    assert policy.interval_minutes('按揭业务') == 30
+    assert policy.is_due('按揭业务', NOW + timedelta(minutes=15))
+
+
+def test_state_is_persisted_and_reloaded(state_store):
+    policy = PollingPolicy(state_store)
+    policy.observe('按揭业务', changed=False, polled_at=NOW)
+    assert 'poll:按揭业务' in state_store.values
+
+    reloaded = PollingPolicy(state_store)
+    assert reloaded.states['按揭业务'] == policy.states['按揭业务']
+    assert reloaded.states['按揭业务']['change_rate'] == pytest.approx(1 - PollingPolicy.SMOOTHING)
+
+
+def test_unparsable_state_polls_immediately(state_store):
+    state_store.set('poll:按揭业务', 'not json')
+    policy = PollingPolicy(state_store)
+    assert policy.is_due('按揭业务', NOW)
+
+
+def test_invalid_intervals_are_rejected(state_store):
+    with pytest.raises(ValueError):
+        PollingPolicy(state_store, base_minutes=0)
+    with pytest.raises(ValueError):
+        PollingPolicy(state_store, base_minutes=60, max_staleness_minutes=30)
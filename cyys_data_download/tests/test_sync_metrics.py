@@ -0,0 +1,18 @@
+from sync_metrics import SyncMetrics
+
+
+def test_prometheus_text_exports_only_gauges():
+    metrics = SyncMetrics('test')
+    metrics.observe_request('按揭业务', latency=0.2)
+    metrics.observe_request('按揭业务', latency=3.0)
+    metrics.observe_write('按揭业务', rows=300, affected=12, seconds=1.5)
+    metrics.finish()
+
+    text = metrics.prometheus_text()
+
+    types = {line.split()[-1] for line in text.splitlines() if line.startswith('# TYPE')}
+    assert types == {'gauge'}
+    assert 'cyy_sync_last_run_rows_per_second_written{job="test",api="按揭业务"} 200.0' in text
+    assert 'cyy_sync_last_run_request_latency_seconds_le{job="test",api="按揭业务",le="0.25"} 1' in text
+    assert 'cyy_sync_last_run_request_latency_seconds_le{job="test",api="按揭业务",le="+Inf"} 2' in text
+    assert 'cyy_sync_last_run_request_latency_seconds_sum{job="test",api="按揭业务"} 3.2' in text
@@ -5,9 +5,10 @@
 
 import logging
 import sys
+import time
 import pandas as pd
 import pymysql
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, text
 from sqlalchemy.types import VARCHAR, DECIMAL, DATETIME, INTEGER
 from sqlalchemy.exc import SQLAlchemyError
 project_root = r"E:\powerbi_data"
@@ -18,6 +19,12 @@ from config.cyys_data_processor.config import SOURCE_MYSQL_CONFIG, OUTPUT_MYSQL_
 class DatabaseManager:
     """数据库管理器"""
 
+    # 源库连接池大小（并发读取表的线程数不应超过该值）
+    SOURCE_POOL_SIZE = 6
+    # 变更日志只读取写入超过该秒数的记录：多个同步线程并发写入时，较小的自增 id 可能晚于较大的 id 提交，
+    # 立即按 id > since_id 读取会永久跳过这些晚提交的记录
+    CHANGELOG_SETTLE_SECONDS = 60
+
     def __init__(self, source_config=None, output_config=None):
         self.source_config = source_config or SOURCE_MYSQL_CONFIG
         self.output_config = output_config or OUTPUT_MYSQL_CONFIG
@@ -26,15 +33,15 @@ class DatabaseManager:
 
     def connect(self):
         """连接数据库"""
-        # 连接源数据库
-        self.source_engine = self._create_engine(self.source_config)
+        # 连接源数据库（多线程并发读取，连接池大小与读取线程数一致）
+        self.source_engine = self._create_engine(self.source_config, pool_size=self.SOURCE_POOL_SIZE)
 
         # 连接输出数据库
         self.output_engine = self._create_engine(self.output_config)
 
         logging.info("数据库连接完成")
 
-    def _create_engine(self, db_config):
+    def _create_engine(self, db_config, pool_size=5):
         """创建数据库引擎"""
         try:
             conn_str = (
@@ -42,7 +49,7 @@ class DatabaseManager:
                 f"{db_config['host']}:{db_config['port']}/{db_config['database']}?"
                 f"charset={db_config['charset']}"
             )
-            engine = create_engine(conn_str, pool_pre_ping=True)
+            engine = create_engine(conn_str, pool_pre_ping=True, pool_size=pool_size)
             logging.info(f"数据库[{db_config['database']}]连接成功")
             return engine
         except SQLAlchemyError as e:
@@ -77,17 +84,108 @@ class DatabaseManager:
             return pd.DataFrame()
 
         try:
+            started = time.perf_counter()
             english_cols = field_mapping[table_name]
             query_cols = ', '.join([f"`{col}`" for col in english_cols])
             query = f"SELECT {query_cols} FROM `{table_name}`"
 
             df = pd.read_sql(query, self.source_engine)
-            logging.info(f"表[{table_name}]读取完成：{len(df)}条数据，{len(english_cols)}个字段")
+            logging.info(f"表[{table_name}]读取完成：{len(df)}条数据，{len(english_cols)}个字段，"
+                         f"耗时{time.perf_counter() - started:.2f}秒")
             return df
         except SQLAlchemyError as e:
             logging.error(f"表[{table_name}]读取失败：{str(e)}")
             return pd.DataFrame()
 
+    def get_table_sizes(self, table_names):
+        """
+        从 information_schema 读取源表大小（数据和索引字节数，为估算值）
+
+        Args:
+            table_names: 表名列表
+
+        Returns:
+            表名到字节数的字典，查询失败时返回空字典
+        """
+        if not table_names:
+            return {}
+        placeholders = ', '.join(f":table_{index}" for index in range(len(table_names)))
+        query = (f"SELECT `TABLE_NAME`, COALESCE(`DATA_LENGTH`, 0) + COALESCE(`INDEX_LENGTH`, 0) "
+                 f"FROM information_schema.TABLES WHERE `TABLE_SCHEMA` = :schema AND `TABLE_NAME` IN ({placeholders})")
+        params = {'schema': self.source_config['database']}
+        params.update({f"table_{index}": table_name for index, table_name in enumerate(table_names)})
+
+        try:
+            with self.source_engine.connect() as conn:
+                return {row[0]: int(row[1]) for row in conn.execute(text(query), params)}
+        except SQLAlchemyError as e:
+            logging.warning(f"源表大小读取失败：{str(e)}")
+            return {}
+
+    def read_changelog(self, since_id=0, table_names=None, settle_seconds=None):
+        """
+        读取同步写入的变更日志（sync_changelog 表）
+
+        Args:
+            since_id: 上次处理到的变更ID，只返回ID更大的记录
+            table_names: 只读取这些表的变更，默认全部
+            settle_seconds: 只读取写入超过该秒数的记录，默认 CHANGELOG_SETTLE_SECONDS
+
+        Returns:
+            DataFrame，列为 id、run_id、table_name、pk_value、op（I-新增 U-更新 D-删除 R-整表替换）、changed_at，
+            按 id 升序；处理完成后以最大 id 作为下次的 since_id
+
+        Raises:
+            SQLAlchemyError: 读取失败（不能当作没有变更，否则调用方会跳过这些变更）
+        """
+        if settle_seconds is None:
+            settle_seconds = self.CHANGELOG_SETTLE_SECONDS
+        query = ("SELECT `id`, `run_id`, `table_name`, `pk_value`, `op`, `changed_at` "
+                 "FROM `sync_changelog` WHERE `id` > :since_id "
+                 "AND `changed_at` <= NOW() - INTERVAL :settle_seconds SECOND")
+        params = {'since_id': since_id, 'settle_seconds': settle_seconds}
+        if table_names:
+            placeholders = ', '.join(f":table_{index}" for index in range(len(table_names)))
+            query += f" AND `table_name` IN ({placeholders})"
+            params.update({f"table_{index}": table_name for index, table_name in enumerate(table_names)})
+        query += " ORDER BY `id`"
+
+        try:
+            df = pd.read_sql(text(query), self.source_engine, params=params)
+            logging.info(f"变更日志读取完成：{len(df)}条（id > {since_id}）")
+            return df
+        except SQLAlchemyError as e:
+            logging.error(f"变更日志读取失败：{str(e)}")
+            raise
+
+    def get_changed_keys(self, since_id=0, table_names=None):
+        """
+        汇总各表自 since_id 之后变化的主键
+
+        Returns:
+            (变更字典, 最大变更ID)：变更字典为 {表名: {'upserted': 主键集合, 'deleted': 主键集合, 'replaced': 是否整表替换}}，
+            同一主键多次变更时以最后一次为准；没有新变更时最大变更ID为 since_id
+
+        Raises:
+            SQLAlchemyError: 变更日志读取失败（调用方保留原 since_id，下次重新读取）
+        """
+        df = self.read_changelog(since_id, table_names)
+        if df.empty:
+            return {}, since_id
+
+        changes = {}
+        for table_name, pk_value, op in df[['table_name', 'pk_value', 'op']].itertuples(index=False):
+            table_changes = changes.setdefault(table_name, {'upserted': set(), 'deleted': set(), 'replaced': False})
+            if op == 'R':
+                table_changes['replaced'] = True
+            elif op == 'D':
+                table_changes['upserted'].discard(pk_value)
+                table_changes['deleted'].add(pk_value)
+            else:
+                table_changes['deleted'].discard(pk_value)
+                table_changes['upserted'].add(pk_value)
+        return changes, int(df['id'].max())
+
     def write_to_output_db(self, df, table_name):
         """将DataFrame写入输出数据库"""
         if df.empty: